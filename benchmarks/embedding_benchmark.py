@@ -0,0 +1,123 @@
+"""Encode throughput of the embedding backends, and how closely ONNX / int8 vectors agree with PyTorch's.
+
+Chunks are 800-character windows of extracted filing text, so the sequence lengths match ingestion. Agreement is
+the mean cosine between each chunk's vectors and the overlap of every chunk's 10 nearest neighbours; overlap well
+below 1.0 means indices built with the PyTorch backend should be rebuilt before switching.
+Run from the repository root so the database path resolves.
+
+With --processes, every stored filing is then bulk-ingested with create_embeddings_bulk at each process count, into
+a temporary index directory and embedding cache, to show how the real ingest path scales with cores.
+
+Usage: python benchmarks/embedding_benchmark.py [--chunks 512] [--batch-size 32] [--backends torch onnx onnx-int8]
+       [--processes 1 2 4 8]
+"""
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+import argparse
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'helpers'))
+
+from config import EMBEDDING_MODEL  # noqa: E402
+from database import DB_PATH, get_all_document_ids  # noqa: E402
+from embedding_models import get_embedding_model, loaded_embedding_models, EncoderPool  # noqa: E402
+from semantic_search import FAISSEnhancedSemanticSearchEngine  # noqa: E402
+
+NEIGHBOURS = 10
+
+def load_chunks(n_chunks, chunk_length=800):
+    """Up to n_chunks windows of stored section text"""
+    conn = sqlite3.connect(DB_PATH)
+    rows = conn.execute('SELECT content FROM extracted_text WHERE length(content) > 100').fetchall()
+    conn.close()
+    
+    chunks = []
+    for (content,) in rows:
+        for start in range(0, len(content), chunk_length):
+            chunks.append(content[start:start + chunk_length])
+            if len(chunks) == n_chunks:
+                return chunks
+    return chunks
+
+def encode(model, chunks, batch_size):
+    """(unit-normalized embeddings, chunks per second), after an untimed warm-up batch"""
+    model.encode(chunks[:batch_size], batch_size=batch_size)
+    start = time.perf_counter()
+    embeddings = np.asarray(model.encode(chunks, batch_size=batch_size), dtype='float32')
+    elapsed = time.perf_counter() - start
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    return embeddings, len(chunks) / elapsed
+
+def neighbours(embeddings):
+    similarities = embeddings @ embeddings.T
+    return np.argsort(-similarities, axis=1)[:, 1:NEIGHBOURS + 1]
+
+def bulk_ingest_scaling(batch_size, backend, process_counts):
+    """Chunks per second of create_embeddings_bulk over every stored filing at each process count, relative to one"""
+    doc_ids = get_all_document_ids()
+    print(f"\n{len(doc_ids)} filings bulk-ingested")
+    print(f"{'processes':<12} {'chunks/s':>9} {'speed-up':>9}")
+    single = None
+    for processes in process_counts:
+        # A fresh index directory and embedding cache, so every chunk is encoded and the app's files are untouched
+        work_dir = tempfile.mkdtemp(prefix='embedding_benchmark_')
+        try:
+            engine = FAISSEnhancedSemanticSearchEngine(index_dir=os.path.join(work_dir, 'faiss_indices'),
+                                                       backend=backend,
+                                                       embedding_cache_path=os.path.join(work_dir, 'cache.db'))
+            n_chunks = sum(len((engine._document_chunks(doc_id) or ([], []))[0]) for doc_id in doc_ids)
+            
+            with EncoderPool(EMBEDDING_MODEL, backend, processes=processes, batch_size=batch_size) as pool:
+                pool.encode(["warm up"] * batch_size * processes)  # Starts the workers and loads their models
+                start = time.perf_counter()
+                engine.create_embeddings_bulk(doc_ids, pool=pool)
+                throughput = n_chunks / (time.perf_counter() - start)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        
+        single = single or throughput
+        print(f"{processes:<12} {throughput:>9.1f} {throughput / single:>8.2f}x")
+
+def run(n_chunks, batch_size, backends, process_counts):
+    chunks = load_chunks(n_chunks)
+    if len(chunks) <= NEIGHBOURS:
+        print("Not enough extracted text; process a filing first")
+        return
+    
+    print(f"{len(chunks)} chunks, {EMBEDDING_MODEL}, batch size {batch_size}\n")
+    print(f"{'backend':<12} {'loaded as':<12} {'chunks/s':>9} {'speed-up':>9} {'cosine':>7} {'nn@10':>6}")
+    
+    reference = None
+    for backend in backends:
+        model = get_embedding_model(EMBEDDING_MODEL, backend)
+        loaded_backend = loaded_embedding_models()[(EMBEDDING_MODEL, backend)]
+        embeddings, throughput = encode(model, chunks, batch_size)
+        
+        if reference is None:
+            reference = (embeddings, throughput, neighbours(embeddings))
+        reference_embeddings, reference_throughput, reference_neighbours = reference
+        
+        cosine = float(np.mean(np.sum(embeddings * reference_embeddings, axis=1)))
+        overlap = np.mean([len(np.intersect1d(a, b)) / NEIGHBOURS
+                           for a, b in zip(neighbours(embeddings), reference_neighbours)])
+        print(f"{backend:<12} {loaded_backend:<12} {throughput:>9.1f} "
+              f"{throughput / reference_throughput:>8.2f}x {cosine:>7.4f} {overlap:>6.3f}")
+    
+    if process_counts:
+        bulk_ingest_scaling(batch_size, backends[0], process_counts)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=512)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--backends', nargs='*', default=['torch', 'onnx', 'onnx-int8'])
+    parser.add_argument('--processes', type=int, nargs='*', default=[])
+    args = parser.parse_args()
+    
+    run(args.chunks, args.batch_size, args.backends, args.processes)
@@ -0,0 +1,106 @@
+"""Recall@k, latency and memory of approximate and quantized indices against the exact flat baseline.
+
+Usage: python benchmarks/index_benchmark.py [--vectors 100000] [--dimension 384] [--queries 200]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'helpers'))
+
+from index_factory import (build_index, search_parameters, index_description, index_size_bytes,  # noqa: E402
+                           rerank_search)
+
+# Search-time knobs swept per index type
+SWEEPS = {
+    'ivf_flat': ('nprobe', [1, 4, 16, 64]),
+    'ivf_pq': ('nprobe', [1, 4, 16, 64]),
+    'hnsw': ('ef_search', [16, 64, 256])
+}
+
+# Vector encodings compared on an exact (flat) scan, each with and without float32 re-ranking
+STORAGE_SWEEP = ['float16', 'int8', 'pq']
+RERANK_FACTOR = 4
+
+def synthetic_embeddings(n_vectors, dimension, n_clusters=256, seed=0):
+    """Clustered unit vectors, closer to sentence embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dimension)).astype('float32')
+    vectors = centers[rng.integers(0, n_clusters, n_vectors)]
+    vectors += 0.5 * rng.standard_normal((n_vectors, dimension)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def perturbed_queries(vectors, n_queries, seed=1):
+    """Queries near stored vectors, like questions whose answer is in the corpus"""
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), n_queries)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype('float32')
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def timed_search(index, queries, k, params, rerank_vectors=None):
+    """Search one query at a time, as the app does, returning (ids, mean latency in ms)"""
+    ids = np.empty((len(queries), k), dtype='int64')
+    start = time.perf_counter()
+    for i in range(len(queries)):
+        if rerank_vectors is None:
+            _, ids[i:i + 1] = index.search(queries[i:i + 1], k, params=params)
+        else:
+            _, ids[i:i + 1] = rerank_search(index, queries[i:i + 1], k, rerank_vectors, RERANK_FACTOR, params)
+    return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+def recall_at_k(ids, ground_truth):
+    hits = sum(len(set(row) & set(truth)) for row, truth in zip(ids, ground_truth))
+    return hits / ground_truth.size
+
+def run(n_vectors, dimension, n_queries, k):
+    vectors = synthetic_embeddings(n_vectors, dimension)
+    queries = perturbed_queries(vectors, n_queries)
+    
+    print(f"{n_vectors} vectors, dimension {dimension}, {n_queries} queries, recall@{k}\n")
+    print(f"{'index':<22} {'setting':<16} {'build s':>8} {'bytes/vec':>9} {'recall':>8} {'ms/query':>9}")
+    
+    def report(description, setting, build_seconds, index, recall, latency):
+        print(f"{description:<22} {setting:<16} {build_seconds:>8.2f} {index_size_bytes(index) / n_vectors:>9.1f} "
+              f"{recall:>8.3f} {latency:>9.3f}")
+    
+    start = time.perf_counter()
+    flat = build_index(vectors, 'flat')
+    build_seconds = time.perf_counter() - start
+    ground_truth, latency = timed_search(flat, queries, k, None)
+    report('Flat', 'exact', build_seconds, flat, 1.0, latency)
+    
+    for storage in STORAGE_SWEEP:
+        start = time.perf_counter()
+        index = build_index(vectors, 'flat', storage=storage)
+        build_seconds = time.perf_counter() - start
+        description = index_description('flat', n_vectors, dimension, storage)
+        
+        for setting, rerank_vectors in [('quantized', None), (f'rerank x{RERANK_FACTOR}', vectors)]:
+            ids, latency = timed_search(index, queries, k, None, rerank_vectors)
+            report(description, setting, build_seconds, index, recall_at_k(ids, ground_truth), latency)
+    
+    for index_type, (knob, values) in SWEEPS.items():
+        start = time.perf_counter()
+        index = build_index(vectors, index_type)
+        build_seconds = time.perf_counter() - start
+        description = index_description(index_type, n_vectors, dimension)
+        
+        for value in values:
+            params = search_parameters(index, **{knob: value})
+            ids, latency = timed_search(index, queries, k, params)
+            report(description, f'{knob}={value}', build_seconds, index, recall_at_k(ids, ground_truth), latency)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vectors', type=int, default=100000)
+    parser.add_argument('--dimension', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+    
+    run(args.vectors, args.dimension, args.queries, args.k)
@@ -0,0 +1,109 @@
+"""Answer quality vs. added latency of cross-encoder re-ranking in enhanced_search, on the stored filings.
+
+Indexes the stored filings into a temporary directory (indices and embedding cache alike, so the application's
+files are never touched); the database is only read. Each query keeps a random subset of the words of one sentence
+from a chunk; a result is relevant when it contains that sentence. Run from the repository root so the database path
+resolves.
+
+Usage: python benchmarks/rerank_benchmark.py [--model cross-encoder/ms-marco-MiniLM-L-6-v2] [--queries 100]
+       [--k 5] [--doc-ids 1 2 ...]
+"""
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'helpers'))
+
+from database import get_all_document_ids  # noqa: E402
+from embedding_models import clear_query_cache  # noqa: E402
+from semantic_search import FAISSEnhancedSemanticSearchEngine  # noqa: E402
+from cross_encoder import CrossEncoderReranker  # noqa: E402
+
+# Candidates re-scored per query
+TOP_N_SWEEP = [5, 10, 20]
+
+def sample_queries(engine, doc_ids, n_queries, seed=0):
+    """(doc_id, query, sentence) triples drawn from sentences of 8-40 words in stored chunks"""
+    rng = np.random.default_rng(seed)
+    sentences = []
+    for doc_id in doc_ids:
+        engine.create_embeddings(doc_id)
+        loaded = engine.index_cache.peek(doc_id)
+        if loaded is None:
+            continue
+        
+        for chunk in loaded[1]['documents']:
+            chunk = re.sub(r'^\[[^\]]*\]\s*', '', chunk)
+            for sentence in re.split(r'(?<=[.!?])\s+', chunk):
+                if 8 <= len(sentence.split()) <= 40:
+                    sentences.append((doc_id, sentence))
+    
+    queries = []
+    for i in rng.choice(len(sentences), min(n_queries, len(sentences)), replace=False):
+        doc_id, sentence = sentences[i]
+        words = sentence.split()
+        kept = np.sort(rng.choice(len(words), max(4, int(len(words) * 0.6)), replace=False))
+        queries.append((doc_id, ' '.join(words[j] for j in kept), sentence))
+    return queries
+
+def evaluate(engine, queries, k):
+    """(MRR@k, hit@1, mean ms per query) of enhanced_search over the sampled queries"""
+    reciprocal_ranks = []
+    latencies = []
+    for doc_id, query, sentence in queries:
+        start = time.perf_counter()
+        results = engine.enhanced_search(doc_id, query, top_k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        
+        rank = next((i + 1 for i, result in enumerate(results) if sentence in result['content']), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+    
+    reciprocal_ranks = np.array(reciprocal_ranks)
+    return reciprocal_ranks.mean(), (reciprocal_ranks == 1.0).mean(), float(np.mean(latencies))
+
+def run(model_name, n_queries, k, doc_ids):
+    work_dir = tempfile.mkdtemp(prefix='rerank_benchmark_')
+    try:
+        engine = FAISSEnhancedSemanticSearchEngine(index_dir=os.path.join(work_dir, 'faiss_indices'),
+                                                   embedding_cache_path=os.path.join(work_dir, 'cache.db'))
+        engine.reranker = None
+        queries = sample_queries(engine, doc_ids or get_all_document_ids(), n_queries)
+        if not queries:
+            print("No chunks found; process a filing first")
+            return
+        
+        print(f"{len(queries)} queries, {model_name}, MRR@{k}\n")
+        print(f"{'ranking':<24} {'MRR':>6} {'hit@1':>6} {'ms/query':>9} {'+ms':>7}")
+        
+        # Every ranking starts from a cold query-embedding cache, so none is charged for encoding the others' queries
+        clear_query_cache()
+        base_mrr, base_hits, base_ms = evaluate(engine, queries, k)
+        print(f"{'heuristic':<24} {base_mrr:>6.3f} {base_hits:>6.3f} {base_ms:>9.2f} {0:>7.2f}")
+        
+        for top_n in TOP_N_SWEEP:
+            # No budget, so every query is re-scored and the added cost is visible
+            engine.reranker = CrossEncoderReranker(model_name, top_n=top_n, budget_ms=float('inf'))
+            engine.reranker.warm_up()
+            
+            clear_query_cache()
+            mrr, hits, ms = evaluate(engine, queries, k)
+            print(f"{f'cross-encoder top {top_n}':<24} {mrr:>6.3f} {hits:>6.3f} {ms:>9.2f} {ms - base_ms:>7.2f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default='cross-encoder/ms-marco-MiniLM-L-6-v2')
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--doc-ids', type=int, nargs='*')
+    args = parser.parse_args()
+    
+    run(args.model, args.queries, args.k, args.doc_ids)
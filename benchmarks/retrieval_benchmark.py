@@ -0,0 +1,131 @@
+"""Retrieval quality and latency of enhanced_search for the Q&A question catalogue, per index/encoder/reranker setup.
+
+Indexes the fixture filings in benchmarks/fixtures/retrieval_corpus.json into a temporary directory (indices and
+embedding cache alike, so the application's files are never touched and build times never hit a warm cache) and runs
+every question of config.QA_QUESTION_CATEGORIES and config.INSIGHT_QUERIES against each of them. A result is relevant
+when its chunk comes from a section labeled as answering the question. Reports recall@k (share of the labeled
+sections found in the top k), MRR@k, hit@1 and per-query latency.
+
+Runs offline: the LLM stage is never called, and models load from the local Hugging Face cache only (set
+HF_HUB_OFFLINE=0 to allow downloads).
+
+Usage: python benchmarks/retrieval_benchmark.py [--k 3] [--index-types flat hnsw ivf_flat] [--storages float32 int8]
+       [--backends torch onnx onnx-int8] [--cross-encoder cross-encoder/ms-marco-MiniLM-L-6-v2]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'helpers'))
+
+os.environ.setdefault('HF_HUB_OFFLINE', '1')
+
+from config import QA_QUESTION_CATEGORIES, INSIGHT_QUERIES  # noqa: E402
+from embedding_models import clear_query_cache  # noqa: E402
+from semantic_search import FAISSEnhancedSemanticSearchEngine  # noqa: E402
+from cross_encoder import CrossEncoderReranker  # noqa: E402
+
+FIXTURE_PATH = os.path.join(ROOT, 'benchmarks', 'fixtures', 'retrieval_corpus.json')
+
+def load_fixture(path=FIXTURE_PATH):
+    """(documents, {question: relevant section names}) for the catalogue questions"""
+    with open(path, 'r') as f:
+        fixture = json.load(f)
+    
+    questions = list(dict.fromkeys(
+        [question for category in QA_QUESTION_CATEGORIES.values() for question in category] + INSIGHT_QUERIES
+    ))
+    unlabeled = [question for question in questions if question not in fixture['relevant_sections']]
+    if unlabeled:
+        print(f"Skipping {len(unlabeled)} questions without labels in {os.path.basename(path)}:")
+        for question in unlabeled:
+            print(f"  {question}")
+    
+    labels = {question: set(fixture['relevant_sections'][question]) for question in questions
+              if question in fixture['relevant_sections']}
+    return fixture['documents'], labels
+
+def index_fixture(engine, documents):
+    """Chunk and index each fixture filing the way create_embeddings does, minus the database; returns seconds"""
+    start = time.perf_counter()
+    for document in documents:
+        chunks, section_names = [], []
+        for section_name, content in document['sections'].items():
+            for i, chunk in enumerate(engine._smart_chunk_text(content, section_name)):
+                chunks.append(chunk)
+                section_names.append(f"{section_name}_{i}")
+        engine._index_document(document['doc_id'], chunks, section_names)
+    return time.perf_counter() - start
+
+def evaluate(engine, documents, labels, k):
+    """recall@k, MRR@k, hit@1 and latencies (ms) over every question and filing"""
+    recalls, reciprocal_ranks, latencies = [], [], []
+    for document in documents:
+        for question, relevant in labels.items():
+            start = time.perf_counter()
+            results = engine.enhanced_search(document['doc_id'], question, top_k=k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            
+            sections = [result['section'].rsplit('_', 1)[0] for result in results[:k]]
+            recalls.append(len(relevant & set(sections)) / len(relevant))
+            rank = next((i + 1 for i, section in enumerate(sections) if section in relevant), None)
+            reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+    
+    reciprocal_ranks = np.array(reciprocal_ranks)
+    return np.mean(recalls), reciprocal_ranks.mean(), (reciprocal_ranks == 1.0).mean(), np.array(latencies)
+
+def configurations(index_types, storages, backends, cross_encoder):
+    for backend in backends:
+        for index_type in index_types:
+            for storage in storages:
+                yield index_type, storage, backend, None
+                if cross_encoder:
+                    yield index_type, storage, backend, cross_encoder
+
+def run(k, index_types, storages, backends, cross_encoder):
+    documents, labels = load_fixture()
+    print(f"{len(documents)} filings x {len(labels)} questions, k={k}\n")
+    print(f"{'index':<10} {'storage':<8} {'encoder':<10} {'reranker':<14} {'build s':>8} "
+          f"{'recall':>7} {'MRR':>6} {'hit@1':>6} {'p50 ms':>7} {'p95 ms':>7}")
+    
+    for index_type, storage, backend, reranker in configurations(index_types, storages, backends, cross_encoder):
+        # Indices and the embedding cache live in a per-configuration temporary directory
+        work_dir = tempfile.mkdtemp(prefix='retrieval_benchmark_')
+        try:
+            engine = FAISSEnhancedSemanticSearchEngine(index_dir=os.path.join(work_dir, 'faiss_indices'),
+                                                       index_type=index_type, index_storage=storage, backend=backend,
+                                                       embedding_cache_path=os.path.join(work_dir, 'cache.db'))
+            engine.reranker = None
+            if reranker:
+                # No budget, so every query is re-scored
+                engine.reranker = CrossEncoderReranker(reranker, budget_ms=float('inf'))
+                engine.reranker.warm_up()
+            
+            build_seconds = index_fixture(engine, documents)
+            clear_query_cache()
+            recall, mrr, hits, latencies = evaluate(engine, documents, labels, k)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        
+        reranker_name = 'cross-encoder' if reranker else 'heuristic'
+        print(f"{index_type:<10} {storage:<8} {backend:<10} {reranker_name:<14} {build_seconds:>8.2f} "
+              f"{recall:>7.3f} {mrr:>6.3f} {hits:>6.3f} {np.percentile(latencies, 50):>7.2f} "
+              f"{np.percentile(latencies, 95):>7.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--index-types', nargs='*', default=['flat', 'hnsw'])
+    parser.add_argument('--storages', nargs='*', default=['float32', 'int8'])
+    parser.add_argument('--backends', nargs='*', default=['torch'])
+    parser.add_argument('--cross-encoder', default=None)
+    args = parser.parse_args()
+    
+    run(args.k, args.index_types, args.storages, args.backends, args.cross_encoder)
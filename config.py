@@ -3,9 +3,54 @@ import os
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 DB_PATH = "10k_analyzer.db"
 UPLOAD_FOLDER = "uploads"
+FAISS_INDEX_DIR = "faiss_indices"
+INDEX_TYPE = "auto"  # Per-document index: auto, flat, ivf_flat, hnsw or ivf_pq
+CORPUS_INDEX_TYPE = "auto"  # Corpus-wide index: auto (flat / IVF-Flat / IVF-PQ by size) or one of those; no HNSW
+IVF_NPROBE = 16  # Inverted lists scanned per query (higher = better recall, slower)
+HNSW_EF_SEARCH = 64  # HNSW candidate list size per query (higher = better recall, slower)
+INDEX_STORAGE = "float32"  # Per-document vectors: float32, float16 (2x smaller), int8 (4x) or pq (8x+)
+CORPUS_INDEX_STORAGE = "float32"  # Same choices for the corpus-wide index
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))  # Loaded documents per engine
+TOMBSTONE_COMPACT_RATIO = 0.3  # Rebuild a document's index once this share of its chunks is tombstoned
+RERANK_FACTOR = 4  # Quantized indices re-score top_k * factor candidates with exact float32 vectors (0 disables)
+BM25_K1 = 1.5  # Term-frequency saturation of the lexical (BM25) chunk index
+BM25_B = 0.75  # Chunk-length normalization of the lexical (BM25) chunk index
+RRF_K = 60  # Reciprocal rank fusion constant for merging dense and BM25 rankings
+CROSS_ENCODER_MODEL = None  # e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2" to re-score top results (None disables)
+CROSS_ENCODER_TOP_N = 20  # Candidates re-scored by the cross-encoder
+CROSS_ENCODER_BUDGET_MS = 150  # Per-search latency budget; re-scoring is skipped when it would not fit
+CROSS_ENCODER_BATCH_SIZE = 16
+CROSS_ENCODER_RETRY_SECONDS = 60  # Wait before loading the model again after a failed warm-up
+DEDUP_SIMILARITY_THRESHOLD = 0.92  # Search results this cosine-similar to a better hit are near-duplicates
+EXPORT_DIR = "exports"  # Partitioned Parquet datasets for cross-filing analytics
+ANALYSIS_CACHE_SIZE = 256  # Parsed analysis results and lookups kept in memory per process
+
+# SQL timing instrumentation; when disabled the query functions are not wrapped at all
+SQL_INSTRUMENTATION_ENABLED = os.getenv("SQL_INSTRUMENTATION", "0") == "1"
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "250"))
+SLOW_QUERY_LOG_PATH = "logs/slow_queries.log"
+
+# Retention policy for uploaded documents and their search indices
+RETENTION_MAX_AGE_DAYS = None  # None keeps documents regardless of age
+RETENTION_DROP_SUPERSEDED = False  # Drop older uploads of a company and fiscal year once a newer one is processed
+RETENTION_VACUUM_PAGES = 1000  # Pages released per incremental VACUUM run (None releases all)
 
 LLM_MODEL = "gpt-3.5-turbo"
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = "torch"  # torch, onnx (same vectors, faster on CPU) or onnx-int8 (dynamic int8, needs a reindex)
+ONNX_INT8_FILE = "onnx/model_quint8_avx2.onnx"  # Quantized export to load from the model repository
+ONNX_EXPORT_DIR = "onnx_models"  # Local int8 exports of models whose repository has none
+QUERY_EMBEDDING_CACHE_SIZE = 2048  # Normalized query embeddings kept per process
+EMBEDDING_CACHE_PATH = "embedding_cache.db"  # Content-addressed chunk embeddings shared by all documents
+ENCODE_BATCH_SIZE = 32  # Chunks per encoder forward pass (and per encoder pool task)
+EMBED_STREAM_BATCH_SIZE = 256  # Chunks encoded, normalized and added to an index per step of create_embeddings
+ENCODER_POOL_PROCESSES = None  # Bulk-ingestion encoder processes; None = one per ENCODER_POOL_THREADS cores
+ENCODER_POOL_THREADS = 1  # Intra-op threads per encoder process, so processes do not contend for cores
+WARM_UP_IN_BACKGROUND = True  # Load faiss, the embedding model and the OpenAI client on a thread when the app starts
+CHUNK_MAX_LENGTH = 800  # Characters per indexed chunk; part of each index's manifest
+CHUNK_OVERLAP = 100  # Characters shared by consecutive chunks; part of each index's manifest
+INDEX_AUTO_REBUILD = True  # Rebuild indices whose manifest no longer matches model and chunker, else only flag them
+INDEX_VERIFY_CHECKSUMS = True  # Hash index files when a generation is first loaded, or a file changed size or mtime since
 MAX_TOKENS = 4000
 TEMPERATURE = 0.3
 
@@ -85,4 +130,47 @@ DEFAULT_FALLBACK_DATA = {
         "Economic and market volatility",
         "Technology and innovation challenges"
     ]
-}
\ No newline at end of file
+}
+
+# Suggested questions of the Q&A tab; also the query set of benchmarks/retrieval_benchmark.py
+QA_QUESTION_CATEGORIES = {
+    "💰 Financial Performance": [
+        "What are the key financial metrics and performance trends?",
+        "How did revenue and profitability change compared to previous year?",
+        "What are the main sources of revenue and their growth rates?",
+        "What is the company's cash flow and financial stability situation?",
+        "What are the key financial ratios and their implications?"
+    ],
+    "⚠️ Risk Analysis": [
+        "What are the most significant risk factors facing the company?",
+        "How do market risks impact the company's operations?",
+        "What regulatory and compliance risks does the company face?",
+        "What are the operational and supply chain risks?",
+        "How does the company mitigate its key risks?"
+    ],
+    "🏢 Business Strategy": [
+        "What is the company's primary business and main revenue sources?",
+        "What are the main competitive advantages and market position?",
+        "What are management's strategic priorities and future outlook?",
+        "How is the company positioned in its industry?",
+        "What are the key growth drivers and opportunities?"
+    ],
+    "📊 Operations & Market": [
+        "What are the main business segments and their performance?",
+        "How does the company compete in its markets?",
+        "What are the key operational metrics and trends?",
+        "What geographic markets does the company operate in?",
+        "What are the company's key products and services?"
+    ]
+}
+
+# Canonical queries of get_enhanced_document_insights
+INSIGHT_QUERIES = [
+    "What is the company's primary business and main revenue sources?",
+    "What are the key financial performance metrics and trends?",
+    "What are the most significant risk factors facing the company?",
+    "How did the company perform compared to the previous year?",
+    "What are the management's strategic priorities and future outlook?",
+    "What are the main competitive advantages and market position?",
+    "What is the company's cash flow and financial stability situation?"
+]
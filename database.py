@@ -1,13 +1,141 @@
+import os
 import sqlite3
 import json
+import time
+import logging
+import threading
+import functools
 import pandas as pd
+from collections import OrderedDict
 from datetime import datetime
-from config import DB_PATH
+from config import (DB_PATH, ANALYSIS_CACHE_SIZE, SQL_INSTRUMENTATION_ENABLED,
+                    SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_LOG_PATH)
 
+DOCUMENT_TABLES = ['financial_metrics', 'risk_factors', 'business_segments',
+                   'extracted_text', 'analysis_results', 'translations']
+
+# Per-statement timing aggregates, only populated when instrumentation is enabled
+_query_stats = {}
+_query_stats_lock = threading.Lock()
+_slow_query_logger = None
+
+def _get_slow_query_logger():
+    global _slow_query_logger
+    
+    if _slow_query_logger is None:
+        log_dir = os.path.dirname(SLOW_QUERY_LOG_PATH)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        
+        logger = logging.getLogger("database.slow_queries")
+        handler = logging.FileHandler(SLOW_QUERY_LOG_PATH)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+        logger.propagate = False
+        _slow_query_logger = logger
+    return _slow_query_logger
+
+def _rows_returned(result):
+    if result is None or isinstance(result, (bool, int, float, str)):
+        return 0
+    if isinstance(result, tuple):
+        return 1
+    try:
+        return len(result)
+    except TypeError:
+        return 0
+
+def _record_query(name, duration_ms, rows):
+    with _query_stats_lock:
+        stats = _query_stats.setdefault(name, {
+            'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'slow_calls': 0
+        })
+        stats['calls'] += 1
+        stats['total_ms'] += duration_ms
+        stats['max_ms'] = max(stats['max_ms'], duration_ms)
+        stats['rows'] += rows
+        is_slow = duration_ms >= SLOW_QUERY_THRESHOLD_MS
+        if is_slow:
+            stats['slow_calls'] += 1
+    
+    if is_slow:
+        _get_slow_query_logger().warning(f"{name} took {duration_ms:.1f} ms ({rows} rows)")
+
+def _instrumented(func):
+    # With instrumentation disabled the function is returned untouched, so it costs nothing
+    if not SQL_INSTRUMENTATION_ENABLED:
+        return func
+    
+    name = func.__name__.lstrip('_')
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        rows = 0
+        try:
+            result = func(*args, **kwargs)
+            rows = _rows_returned(result)
+            return result
+        finally:
+            _record_query(name, (time.perf_counter() - start) * 1000, rows)
+    
+    return wrapper
+
+def get_query_report():
+    with _query_stats_lock:
+        report = [dict(stats, statement=name) for name, stats in _query_stats.items()]
+    
+    for entry in report:
+        entry['avg_ms'] = entry['total_ms'] / entry['calls']
+    
+    return sorted(report, key=lambda entry: entry['total_ms'], reverse=True)
+
+def reset_query_stats():
+    with _query_stats_lock:
+        _query_stats.clear()
+
+# Read-through LRU cache for per-document lookups, keyed by (doc_id, lookup name)
+_read_cache = OrderedDict()
+_read_cache_lock = threading.Lock()
+_read_cache_generation = 0
+
+def _cached(key, loader):
+    with _read_cache_lock:
+        if key in _read_cache:
+            _read_cache.move_to_end(key)
+            return _read_cache[key]
+        generation = _read_cache_generation
+    
+    value = loader()
+    
+    with _read_cache_lock:
+        # Skip the insert if a writer invalidated the cache while we were reading
+        if generation == _read_cache_generation:
+            _read_cache[key] = value
+            while len(_read_cache) > ANALYSIS_CACHE_SIZE:
+                _read_cache.popitem(last=False)
+    return value
+
+def invalidate_read_cache(doc_id=None):
+    global _read_cache_generation
+    
+    with _read_cache_lock:
+        _read_cache_generation += 1
+        if doc_id is None:
+            _read_cache.clear()
+        else:
+            for key in [key for key in _read_cache if key[0] == doc_id]:
+                del _read_cache[key]
+
+@_instrumented
 def init_database():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
+    # Only takes effect on a fresh database; reclaim_space() converts existing ones
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS documents (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -86,9 +214,13 @@ def init_database():
         )
     ''')
     
+    for table in DOCUMENT_TABLES:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_doc_id ON {table} (doc_id)')
+    
     conn.commit()
     conn.close()
 
+@_instrumented
 def add_document(filename, company_name=None, fiscal_year=None):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -103,6 +235,7 @@ def add_document(filename, company_name=None, fiscal_year=None):
     conn.close()
     return doc_id
 
+@_instrumented
 def update_document_processed(doc_id):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -113,7 +246,9 @@ def update_document_processed(doc_id):
     
     conn.commit()
     conn.close()
+    invalidate_read_cache(doc_id)
 
+@_instrumented
 def save_financial_metrics(doc_id, metrics_data):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -132,7 +267,9 @@ def save_financial_metrics(doc_id, metrics_data):
     
     conn.commit()
     conn.close()
+    invalidate_read_cache(doc_id)
 
+@_instrumented
 def save_risk_factors(doc_id, risk_data):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -147,7 +284,9 @@ def save_risk_factors(doc_id, risk_data):
     
     conn.commit()
     conn.close()
+    invalidate_read_cache(doc_id)
 
+@_instrumented
 def save_business_segments(doc_id, segments_data):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -160,7 +299,9 @@ def save_business_segments(doc_id, segments_data):
     
     conn.commit()
     conn.close()
+    invalidate_read_cache(doc_id)
 
+@_instrumented
 def save_extracted_text(doc_id, section_name, content):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -173,6 +314,7 @@ def save_extracted_text(doc_id, section_name, content):
     conn.commit()
     conn.close()
 
+@_instrumented
 def save_analysis_results(doc_id, analysis_type, results):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -186,8 +328,10 @@ def save_analysis_results(doc_id, analysis_type, results):
     
     conn.commit()
     conn.close()
+    invalidate_read_cache(doc_id)
 
-def get_document_info(doc_id):
+@_instrumented
+def _load_document_info(doc_id):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
@@ -197,7 +341,11 @@ def get_document_info(doc_id):
     conn.close()
     return result
 
-def get_financial_metrics(doc_id):
+def get_document_info(doc_id):
+    return _cached((doc_id, 'document_info'), lambda: _load_document_info(doc_id))
+
+@_instrumented
+def _load_financial_metrics(doc_id):
     conn = sqlite3.connect(DB_PATH)
     df = pd.read_sql_query('''
         SELECT metric_name, metric_value, metric_unit, year
@@ -207,7 +355,12 @@ def get_financial_metrics(doc_id):
     conn.close()
     return df
 
-def get_risk_factors(doc_id):
+def get_financial_metrics(doc_id):
+    # Copy so callers can never mutate the cached frame
+    return _cached((doc_id, 'financial_metrics'), lambda: _load_financial_metrics(doc_id)).copy()
+
+@_instrumented
+def _load_risk_factors(doc_id):
     conn = sqlite3.connect(DB_PATH)
     df = pd.read_sql_query('''
         SELECT risk_category, risk_description, severity_level
@@ -217,7 +370,12 @@ def get_risk_factors(doc_id):
     conn.close()
     return df
 
-def get_business_segments(doc_id):
+def get_risk_factors(doc_id):
+    # Copy so callers can never mutate the cached frame
+    return _cached((doc_id, 'risk_factors'), lambda: _load_risk_factors(doc_id)).copy()
+
+@_instrumented
+def _load_business_segments(doc_id):
     conn = sqlite3.connect(DB_PATH)
     df = pd.read_sql_query('''
         SELECT segment_name, segment_revenue, segment_description
@@ -227,7 +385,12 @@ def get_business_segments(doc_id):
     conn.close()
     return df
 
-def get_analysis_results(doc_id, analysis_type=None):
+def get_business_segments(doc_id):
+    # Copy so callers can never mutate the cached frame
+    return _cached((doc_id, 'business_segments'), lambda: _load_business_segments(doc_id)).copy()
+
+@_instrumented
+def _load_analysis_results(doc_id, analysis_type=None):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
@@ -247,6 +410,26 @@ def get_analysis_results(doc_id, analysis_type=None):
     conn.close()
     return results
 
+def get_analysis_results(doc_id, analysis_type=None):
+    return list(_cached((doc_id, ('rows', analysis_type)),
+                        lambda: _load_analysis_results(doc_id, analysis_type)))
+
+def _parse_analysis_result(results):
+    try:
+        return json.loads(results)
+    except (TypeError, json.JSONDecodeError):
+        return results
+
+def get_parsed_analysis_results(doc_id, analysis_type):
+    # Latest result of the given type, JSON-decoded when possible; shared, so treat as read-only
+    def load():
+        rows = _load_analysis_results(doc_id, analysis_type)
+        return _parse_analysis_result(rows[0][0]) if rows else None
+    
+    # Namespaced: (doc_id, 'risk_factors') already holds get_risk_factors' DataFrame
+    return _cached((doc_id, ('parsed', analysis_type)), load)
+
+@_instrumented
 def get_latest_document():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -260,6 +443,7 @@ def get_latest_document():
     conn.close()
     return result
 
+@_instrumented
 def save_translation(doc_id, source_lang, target_lang, translated_content, section_name):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -271,8 +455,10 @@ def save_translation(doc_id, source_lang, target_lang, translated_content, secti
     
     conn.commit()
     conn.close()
+    invalidate_read_cache(doc_id)
 
-def get_translations(doc_id, target_language):
+@_instrumented
+def _load_translations(doc_id, target_language):
     conn = sqlite3.connect(DB_PATH)
     df = pd.read_sql_query('''
         SELECT section_name, translated_content
@@ -282,15 +468,99 @@ def get_translations(doc_id, target_language):
     conn.close()
     return df
 
-def clear_all_data():
+def get_translations(doc_id, target_language):
+    return _cached((doc_id, ('translations', target_language)),
+                   lambda: _load_translations(doc_id, target_language)).copy()
+
+@_instrumented
+def get_all_document_ids():
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT id FROM documents')
+    doc_ids = [row[0] for row in cursor.fetchall()]
+    
+    conn.close()
+    return doc_ids
+
+@_instrumented
+def get_expired_document_ids(max_age_days=None, drop_superseded=True):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    expired = set()
+    
+    if max_age_days is not None:
+        cursor.execute('''
+            SELECT id FROM documents WHERE upload_date < datetime('now', ?)
+        ''', (f'-{int(max_age_days)} days',))
+        expired.update(row[0] for row in cursor.fetchall())
+    
+    if drop_superseded:
+        # An upload is superseded once a newer filing of the same company and fiscal year has been processed;
+        # filenames like 10-K.pdf say nothing about the filing, and documents missing either field never match
+        cursor.execute('''
+            SELECT old.id FROM documents old
+            WHERE EXISTS (
+                SELECT 1 FROM documents new
+                WHERE new.company_name = old.company_name AND new.fiscal_year = old.fiscal_year
+                  AND new.id > old.id AND new.processed
+            )
+        ''')
+        expired.update(row[0] for row in cursor.fetchall())
+    
+    conn.close()
+    return sorted(expired)
+
+@_instrumented
+def delete_document(doc_id):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
-    tables = ['documents', 'financial_metrics', 'risk_factors', 'business_segments', 
-              'extracted_text', 'analysis_results', 'translations']
+    # All deletes run in a single transaction so a document is never half-removed
+    for table in DOCUMENT_TABLES:
+        cursor.execute(f'DELETE FROM {table} WHERE doc_id = ?', (doc_id,))
     
-    for table in tables:
+    cursor.execute('DELETE FROM documents WHERE id = ?', (doc_id,))
+    deleted = cursor.rowcount > 0
+    
+    conn.commit()
+    conn.close()
+    invalidate_read_cache(doc_id)
+    return deleted
+
+@_instrumented
+def reclaim_space(max_pages=None):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('PRAGMA auto_vacuum')
+    if cursor.fetchone()[0] != 2:
+        # Databases created before incremental mode need one full VACUUM to switch over
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.execute('VACUUM')
+    elif max_pages:
+        cursor.execute(f'PRAGMA incremental_vacuum({int(max_pages)})').fetchall()
+    else:
+        cursor.execute('PRAGMA incremental_vacuum').fetchall()
+    
+    cursor.execute('PRAGMA freelist_count')
+    free_pages = cursor.fetchone()[0]
+    
+    conn.close()
+    return free_pages
+
+@_instrumented
+def clear_all_data():
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    # Unqualified DELETEs let SQLite truncate each table instead of removing rows one by one
+    for table in DOCUMENT_TABLES + ['documents']:
         cursor.execute(f'DELETE FROM {table}')
     
     conn.commit()
-    conn.close()
\ No newline at end of file
+    conn.close()
+    invalidate_read_cache()
+    
+    reclaim_space()
\ No newline at end of file
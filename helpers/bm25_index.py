@@ -0,0 +1,144 @@
+import os
+import re
+import numpy as np
+from config import BM25_K1, BM25_B
+
+# Lowercase words and numbers, keeping internal separators so "1,234.5", "r&d" and "10-k" stay one token
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,&'-][a-z0-9]+)*")
+
+def tokenize(text):
+    return _TOKEN_PATTERN.findall(str(text).lower())
+
+class BM25Segment:
+    """Postings of one run of consecutive chunks: sorted vocabulary, CSR term frequencies and chunk lengths"""
+    
+    def __init__(self, terms, indptr, chunk_ids, frequencies, lengths):
+        self.terms = terms
+        self.indptr = indptr
+        self.chunk_ids = chunk_ids
+        self.frequencies = frequencies
+        self.lengths = lengths
+    
+    @classmethod
+    def build(cls, texts):
+        """Index texts by position within the segment"""
+        tokens = [tokenize(text) for text in texts]
+        n_chunks = len(tokens)
+        
+        lengths = np.array([len(chunk_tokens) for chunk_tokens in tokens], dtype='int32')
+        flat_tokens = np.array([token for chunk_tokens in tokens for token in chunk_tokens])
+        if len(flat_tokens) == 0:
+            return cls(np.array([], dtype='<U1'), np.zeros(1, dtype='int64'), np.zeros(0, dtype='int32'),
+                       np.zeros(0, dtype='int32'), lengths)
+        
+        terms, term_ids = np.unique(flat_tokens, return_inverse=True)
+        chunk_of_token = np.repeat(np.arange(n_chunks, dtype='int64'), lengths)
+        
+        # Unique (term, chunk) keys come out sorted by term, then chunk: CSR postings with their term frequencies
+        keys, frequencies = np.unique(term_ids.astype('int64') * n_chunks + chunk_of_token, return_counts=True)
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(keys // n_chunks, minlength=len(terms)))])
+        
+        return cls(terms, indptr.astype('int64'), (keys % n_chunks).astype('int32'), frequencies.astype('int32'),
+                   lengths)
+    
+    @property
+    def n_chunks(self):
+        return len(self.lengths)
+    
+    @property
+    def nbytes(self):
+        return (self.terms.nbytes + self.indptr.nbytes + self.chunk_ids.nbytes + self.frequencies.nbytes
+                + self.lengths.nbytes)
+    
+    def postings(self, query_terms):
+        """(query term index, chunk id, term frequency) of every posting of the query terms in the vocabulary"""
+        empty = np.zeros(0, dtype='int64')
+        if len(query_terms) == 0 or len(self.terms) == 0:
+            return empty, empty, empty
+        
+        positions = np.minimum(np.searchsorted(self.terms, query_terms), len(self.terms) - 1)
+        found = np.flatnonzero(self.terms[positions] == query_terms)
+        
+        slices = [slice(self.indptr[positions[i]], self.indptr[positions[i] + 1]) for i in found]
+        if not slices:
+            return empty, empty, empty
+        return (np.repeat(found, [s.stop - s.start for s in slices]),
+                np.concatenate([self.chunk_ids[s] for s in slices]).astype('int64'),
+                np.concatenate([self.frequencies[s] for s in slices]))
+    
+    def save(self, path):
+        """Write via a temp file and rename, like the other per-generation files"""
+        with open(path + ".tmp", 'wb') as f:
+            np.savez(f, terms=self.terms, indptr=self.indptr, chunk_ids=self.chunk_ids,
+                     frequencies=self.frequencies, lengths=self.lengths)
+        os.replace(path + ".tmp", path)
+    
+    @classmethod
+    def load(cls, path):
+        """A saved segment, or None for files holding precomputed weights, which cannot be combined"""
+        with np.load(path) as arrays:
+            if 'frequencies' not in arrays:
+                return None
+            return cls(arrays['terms'], arrays['indptr'], arrays['chunk_ids'], arrays['frequencies'],
+                       arrays['lengths'])
+
+class BM25Index:
+    """Okapi BM25 over a document's chunks, scored at query time from per-segment term frequencies, so appending
+    chunks or tombstoning some never rewrites the postings of the others"""
+    
+    def __init__(self, segments, tombstones=None, k1=BM25_K1, b=BM25_B):
+        self.segments = segments
+        self.k1 = k1
+        self.b = b
+        self.starts = np.cumsum([0] + [segment.n_chunks for segment in segments])
+        self.n_chunks = int(self.starts[-1])
+        
+        # Tombstoned chunks count towards neither document frequencies nor the average length
+        lengths = np.concatenate([segment.lengths for segment in segments])
+        self.live = None
+        if tombstones is not None and len(tombstones):
+            self.live = np.ones(self.n_chunks, dtype=bool)
+            self.live[np.asarray(tombstones, dtype='int64')] = False
+            lengths = lengths[self.live]
+        self.live_chunks = len(lengths)
+        self.average_length = lengths.sum() / max(self.live_chunks, 1)
+    
+    @classmethod
+    def build(cls, texts, tombstones=None):
+        return cls([BM25Segment.build(texts)], tombstones)
+    
+    @property
+    def nbytes(self):
+        return sum(segment.nbytes for segment in self.segments) + (0 if self.live is None else self.live.nbytes)
+    
+    def _postings(self, query):
+        """(query term index, chunk position, term frequency, chunk length) of the live postings of the query's
+        distinct terms"""
+        query_terms = np.unique(tokenize(query))
+        term_ids, chunk_ids, frequencies, lengths = [], [], [], []
+        for start, segment in zip(self.starts, self.segments):
+            segment_terms, segment_chunks, segment_frequencies = segment.postings(query_terms)
+            term_ids.append(segment_terms)
+            chunk_ids.append(segment_chunks + start)
+            frequencies.append(segment_frequencies)
+            lengths.append(segment.lengths[segment_chunks])
+        
+        postings = [np.concatenate(values) for values in (term_ids, chunk_ids, frequencies, lengths)]
+        if self.live is not None:
+            keep = self.live[postings[1]]
+            postings = [values[keep] for values in postings]
+        return len(query_terms), postings
+    
+    def search(self, query, k):
+        """(scores, chunk positions) of the k best-scoring live chunks containing any query term"""
+        n_terms, (term_ids, chunk_ids, frequencies, lengths) = self._postings(query)
+        
+        document_frequencies = np.bincount(term_ids, minlength=n_terms)
+        idf = np.log1p((self.live_chunks - document_frequencies + 0.5) / (document_frequencies + 0.5))
+        length_norm = self.k1 * (1 - self.b + self.b * lengths / self.average_length)
+        weights = idf[term_ids] * frequencies * (self.k1 + 1) / (frequencies + length_norm)
+        scores = np.bincount(chunk_ids, weights=weights, minlength=self.n_chunks)
+        
+        matches = np.flatnonzero(scores)
+        top = matches[np.argsort(-scores[matches], kind='stable')[:k]]
+        return scores[top].astype('float32'), top
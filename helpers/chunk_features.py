@@ -0,0 +1,50 @@
+import zlib
+import numpy as np
+from bm25_index import tokenize
+
+# Terms that mark a chunk as carrying financial data (a re-ranking boost)
+FINANCIAL_KEYWORDS = [
+    'revenue', 'income', 'profit', 'loss', 'assets', 'liabilities', 'cash', 'debt',
+    'margin', 'growth', 'decline', 'financial', 'earnings', 'sales', 'costs'
+]
+
+# Each chunk's distinct tokens set two hashed bits of a bitmap (a Bloom filter); a query word matches when
+# both are set, with ~1.5% false positives for a typical 800-character chunk
+TOKEN_BITMAP_BITS = 2048
+
+FEATURE_DTYPE = np.dtype([
+    ('length', 'int32'),
+    ('has_keyword', 'bool'),
+    ('token_bits', 'uint64', (TOKEN_BITMAP_BITS // 64,))
+])
+
+def _token_bits(tokens):
+    """(n, 2) bit positions of tokens; crc32 rather than hash(), as str hashes change between processes"""
+    hashes = np.array([zlib.crc32(token.encode('utf-8')) for token in tokens], dtype='int64')
+    return np.stack([hashes % TOKEN_BITMAP_BITS, (hashes >> 16) % TOKEN_BITMAP_BITS], axis=1)
+
+def chunk_features(texts, keywords=FINANCIAL_KEYWORDS):
+    """Per-chunk re-ranking features (length, keyword flag, token bitmap) as a structured array"""
+    features = np.zeros(len(texts), dtype=FEATURE_DTYPE)
+    
+    for row, text in zip(features, texts):
+        text = str(text)
+        text_lower = text.lower()
+        row['length'] = len(text)
+        row['has_keyword'] = any(keyword in text_lower for keyword in keywords)
+        
+        bits = _token_bits(set(tokenize(text_lower))).ravel()
+        np.bitwise_or.at(row['token_bits'], bits // 64, np.left_shift(np.uint64(1), (bits % 64).astype('uint64')))
+    
+    return features
+
+def matched_terms(features, query):
+    """Number of distinct query words each chunk's token bitmap contains"""
+    bits = _token_bits(set(tokenize(query)))
+    if len(bits) == 0:
+        return np.zeros(len(features), dtype='int64')
+    
+    # (chunks, words, 2) bit tests; a word is present when both of its bits are set
+    words = features['token_bits'][:, bits // 64]
+    present = ((words >> (bits % 64).astype('uint64')) & np.uint64(1)).astype(bool).all(axis=2)
+    return present.sum(axis=1).astype('int64')
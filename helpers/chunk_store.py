@@ -0,0 +1,98 @@
+import os
+import numpy as np
+
+class ChunkStore:
+    """Read-only sequence of strings over memory-mapped packed UTF-8 and an offsets array"""
+    
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+    
+    def __len__(self):
+        return len(self._offsets) - 1
+    
+    @property
+    def nbytes(self):
+        return self._data.nbytes + self._offsets.nbytes
+    
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("chunk index out of range")
+        
+        # Only the pages holding this chunk are touched
+        start, end = self._offsets[position], self._offsets[position + 1]
+        return bytes(self._data[start:end]).decode('utf-8')
+    
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+class SegmentedChunkStore:
+    """Read-only sequence over consecutive chunk stores, e.g. the segments of a document's index"""
+    
+    def __init__(self, stores):
+        self.stores = stores
+        self._starts = np.cumsum([0] + [len(store) for store in stores])
+    
+    def __len__(self):
+        return int(self._starts[-1])
+    
+    @property
+    def nbytes(self):
+        return sum(store.nbytes for store in self.stores)
+    
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("chunk index out of range")
+        
+        segment = np.searchsorted(self._starts, position, side='right') - 1
+        return self.stores[segment][position - self._starts[segment]]
+    
+    def __iter__(self):
+        for store in self.stores:
+            yield from store
+
+def chunk_store_paths(directory, name):
+    """Data and offsets files of a chunk store"""
+    return (os.path.join(directory, f"{name}.bin"),
+            os.path.join(directory, f"{name}_offsets.npy"))
+
+def write_chunk_store(directory, name, texts):
+    """Pack strings as UTF-8 with an int64 offsets array, replacing files via temp + rename"""
+    data_path, offsets_path = chunk_store_paths(directory, name)
+    encoded = [str(text).encode('utf-8') for text in texts]
+    
+    offsets = np.zeros(len(encoded) + 1, dtype='int64')
+    np.cumsum([len(chunk) for chunk in encoded], out=offsets[1:])
+    
+    # Never rewrite files in place: other processes may have them mapped
+    with open(data_path + ".tmp", 'wb') as f:
+        f.write(b''.join(encoded))
+    with open(offsets_path + ".tmp", 'wb') as f:
+        np.save(f, offsets)
+    
+    os.replace(data_path + ".tmp", data_path)
+    os.replace(offsets_path + ".tmp", offsets_path)
+
+def open_chunk_store(directory, name):
+    """Map a chunk store into memory; pages are shared by every process reading the same files"""
+    data_path, offsets_path = chunk_store_paths(directory, name)
+    offsets = np.load(offsets_path, mmap_mode='r')
+    
+    # np.memmap cannot map an empty file
+    if os.path.getsize(data_path):
+        data = np.memmap(data_path, dtype=np.uint8, mode='r')
+    else:
+        data = np.zeros(0, dtype=np.uint8)
+    
+    return ChunkStore(data, offsets)
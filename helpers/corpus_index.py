@@ -0,0 +1,259 @@
+import os
+import sqlite3
+import threading
+import numpy as np
+from config import FAISS_INDEX_DIR
+from lazy_imports import lazy_import
+from index_factory import (create_index, train_index, select_index_type, index_type_of, storage_of, search_parameters,
+                           write_index_atomic, vectors_for_ids)
+from chunk_features import FEATURE_DTYPE, chunk_features
+
+faiss = lazy_import('faiss')
+
+# Chunk ids encode their document: chunk_id = doc_id * CHUNK_ID_STRIDE + chunk position
+CHUNK_ID_STRIDE = 1 << 20
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+class CorpusIndex:
+    """Corpus-wide FAISS index over every document's chunks, with a chunk lookup table"""
+
+    def __init__(self, index_dir=FAISS_INDEX_DIR):
+        self.index_path = os.path.join(index_dir, "corpus.faiss")
+        self.lookup_path = os.path.join(index_dir, "corpus_chunks.db")
+        self.index = None
+        self.index_type = None
+        self.synced = False
+        self._lock = threading.RLock()
+        self._pending = None  # Lookup transaction that save() commits once the index file is written
+
+        os.makedirs(index_dir, exist_ok=True)
+        self._init_lookup()
+
+        if os.path.exists(self.index_path):
+            self.index = faiss.read_index(self.index_path)
+            self.index_type = index_type_of(self.index)
+
+            if self.index_type == 'hnsw':
+                # Written before HNSW was refused (see reset); dropped so the next sync rebuilds it
+                print("Discarding HNSW corpus index: it cannot remove replaced chunks")
+                self.clear()
+
+    def _init_lookup(self):
+        conn = sqlite3.connect(self.lookup_path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS corpus_chunks (
+                chunk_id INTEGER PRIMARY KEY,
+                doc_id INTEGER,
+                section TEXT,
+                content TEXT,
+                features BLOB
+            )
+        ''')
+
+        # Lookup tables created before re-ranking features were stored get the column; their rows stay NULL
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(corpus_chunks)')]
+        if 'features' not in columns:
+            conn.execute('ALTER TABLE corpus_chunks ADD COLUMN features BLOB')
+
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_corpus_chunks_doc_id ON corpus_chunks (doc_id)')
+        conn.commit()
+        conn.close()
+
+    def reset(self, dimension, n_vectors, index_type, training_vectors, storage='float32'):
+        """Replace the index with an empty one of the type chosen for n_vectors, trained if needed"""
+        if select_index_type(n_vectors, index_type) == 'hnsw':
+            # Re-indexed documents reuse their chunk ids, so vectors HNSW cannot remove would answer for new chunks
+            raise ValueError("The corpus index cannot be HNSW: it must remove the chunks of replaced documents")
+
+        with self._lock:
+            self.index, self.index_type = create_index(dimension, n_vectors, index_type, with_ids=True,
+                                                       storage=storage)
+            if training_vectors is not None:
+                train_index(self.index, training_vectors)
+
+            self.reset_lookup()
+
+    def clear(self):
+        """Drop the index and every lookup row; the next save deletes the index file"""
+        with self._lock:
+            self.index, self.index_type = None, None
+            self.reset_lookup()
+
+    def reset_lookup(self):
+        """Delete every lookup row, committed by the next save"""
+        self._lookup().execute('DELETE FROM corpus_chunks')
+
+    @staticmethod
+    def chunk_ids(doc_id, count):
+        return doc_id * CHUNK_ID_STRIDE + np.arange(count, dtype='int64')
+
+    def _lookup(self):
+        """Connection holding the lookup changes made since the last save, uncommitted"""
+        if self._pending is None:
+            self._pending = sqlite3.connect(self.lookup_path, check_same_thread=False)
+        return self._pending
+
+    def save(self):
+        """Persist the index via a temp file and rename, then commit the lookup changes it covers
+
+        A crash in between leaves indexed ids without lookup rows, which searches skip and the next
+        sync_corpus_index re-adds, never lookup rows pointing at vectors that were not saved.
+        Writes the whole index, so batch changes with save=False and save once.
+        """
+        with self._lock:
+            if self.index is not None:
+                write_index_atomic(self.index, self.index_path)
+            elif os.path.exists(self.index_path):
+                os.remove(self.index_path)
+            if self._pending is not None:
+                self._pending.commit()
+                self._pending.close()
+                self._pending = None
+
+    def add_document(self, doc_id, embeddings, documents, section_names, save=True, positions=None):
+        """Index a document's normalized chunk embeddings, replacing any previous version"""
+        with self._lock:
+            self.remove_document(doc_id, save=False)
+            self.add_chunks(doc_id, embeddings, documents, section_names, save=save, positions=positions)
+
+    def add_chunks(self, doc_id, embeddings, documents, section_names, save=True, positions=None):
+        """Add chunks at positions (default 0..n-1) of a document's index without touching its other chunks"""
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+
+        with self._lock:
+            if self.index is None:
+                # Start exact; sync rebuilds into an approximate type once the corpus grows
+                self.index, self.index_type = create_index(embeddings.shape[1], 0, 'flat', with_ids=True)
+
+            if positions is None:
+                ids = self.chunk_ids(doc_id, len(documents))
+            else:
+                ids = doc_id * CHUNK_ID_STRIDE + np.asarray(positions, dtype='int64')
+            self.index.add_with_ids(embeddings, ids)
+            features = chunk_features(documents)
+
+            self._lookup().executemany('''
+                INSERT OR REPLACE INTO corpus_chunks (chunk_id, doc_id, section, content, features)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(int(chunk_id), doc_id, section, content, row.tobytes())
+                  for chunk_id, section, content, row in zip(ids, section_names, documents, features)])
+
+            if save:
+                self.save()
+
+    def remove_document(self, doc_id, save=True):
+        """Drop all of a document's chunks from the index and lookup table"""
+        with self._lock:
+            if self.index is not None:
+                first_id = doc_id * CHUNK_ID_STRIDE
+                self.index.remove_ids(faiss.IDSelectorRange(first_id, first_id + CHUNK_ID_STRIDE))
+
+            self._lookup().execute('DELETE FROM corpus_chunks WHERE doc_id = ?', (doc_id,))
+
+            if save:
+                self.save()
+
+    def remove_chunks(self, doc_id, positions, save=True):
+        """Drop chunks at positions of a document's index (e.g. tombstoned sections)"""
+        ids = doc_id * CHUNK_ID_STRIDE + np.asarray(positions, dtype='int64')
+        if len(ids) == 0:
+            return
+
+        with self._lock:
+            if self.index is not None:
+                self.index.remove_ids(faiss.IDSelectorBatch(ids))
+
+            self._lookup().executemany('DELETE FROM corpus_chunks WHERE chunk_id = ?',
+                                       [(int(chunk_id),) for chunk_id in ids])
+
+            if save:
+                self.save()
+
+    def _query(self, sql, params=()):
+        """Rows of a lookup query, including unsaved changes so they agree with the in-memory index"""
+        with self._lock:
+            if self._pending is not None:
+                return self._pending.execute(sql, params).fetchall()
+
+        conn = sqlite3.connect(self.lookup_path)
+        rows = conn.execute(sql, params).fetchall()
+        conn.close()
+        return rows
+
+    def document_ids(self):
+        return {row[0] for row in self._query('SELECT DISTINCT doc_id FROM corpus_chunks')}
+
+    def _chunk_ids_for_documents(self, doc_ids):
+        chunk_ids = []
+        doc_ids = list(doc_ids)
+
+        for start in range(0, len(doc_ids), _LOOKUP_BATCH):
+            batch = doc_ids[start:start + _LOOKUP_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            chunk_ids.extend(row[0] for row in self._query(
+                f'SELECT chunk_id FROM corpus_chunks WHERE doc_id IN ({placeholders})', batch
+            ))
+
+        return np.array(chunk_ids, dtype='int64')
+
+    def search(self, query_embeddings, top_k=10, doc_ids=None, nprobe=None, ef_search=None):
+        """Search all documents, or only doc_ids, returning (similarities, chunk_ids) per query"""
+        with self._lock:
+            if self.index is None or self.index.ntotal == 0:
+                empty = np.zeros((len(query_embeddings), 0))
+                return empty.astype('float32'), empty.astype('int64')
+
+            selector = None
+            if doc_ids is not None:
+                # Restrict the scan to the selected documents' chunk ids
+                selector = faiss.IDSelectorBatch(self._chunk_ids_for_documents(doc_ids))
+            params = search_parameters(self.index, nprobe, ef_search, selector)
+
+            k = min(top_k, self.index.ntotal)
+            return self.index.search(np.ascontiguousarray(query_embeddings, dtype='float32'), k, params=params)
+
+    def get_chunks(self, chunk_ids):
+        """Lookup rows (doc_id, section, content, re-ranking features) for chunk ids"""
+        chunks = {}
+        chunk_ids = [int(chunk_id) for chunk_id in chunk_ids]
+
+        for start in range(0, len(chunk_ids), _LOOKUP_BATCH):
+            batch = chunk_ids[start:start + _LOOKUP_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            for chunk_id, doc_id, section, content, features in self._query(
+                f'SELECT chunk_id, doc_id, section, content, features FROM corpus_chunks '
+                f'WHERE chunk_id IN ({placeholders})',
+                batch
+            ):
+                if features is None:
+                    features = chunk_features([content])[0]
+                else:
+                    features = np.frombuffer(features, dtype=FEATURE_DTYPE)[0]
+                chunks[chunk_id] = {'doc_id': doc_id, 'section': section, 'content': content, 'features': features}
+
+        return chunks
+
+    def get_vectors(self, chunk_ids):
+        """Stored (normalized) vectors for chunk ids, in the given order"""
+        with self._lock:
+            return vectors_for_ids(self.index, chunk_ids)
+
+    def stats(self):
+        return {
+            'total_vectors': self.index.ntotal if self.index is not None else 0,
+            'total_documents': len(self.document_ids()),
+            'index_type': self.index_type or 'flat',
+            'storage': storage_of(self.index) if self.index is not None else None
+        }
+
+# One corpus index per directory, shared by every engine in the process
+_corpus_indices = {}
+_corpus_indices_lock = threading.Lock()
+
+def get_corpus_index(index_dir=FAISS_INDEX_DIR):
+    with _corpus_indices_lock:
+        if index_dir not in _corpus_indices:
+            _corpus_indices[index_dir] = CorpusIndex(index_dir)
+        return _corpus_indices[index_dir]
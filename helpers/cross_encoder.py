@@ -0,0 +1,117 @@
+import time
+import threading
+from config import (CROSS_ENCODER_MODEL, CROSS_ENCODER_TOP_N, CROSS_ENCODER_BUDGET_MS, CROSS_ENCODER_BATCH_SIZE,
+                    CROSS_ENCODER_RETRY_SECONDS)
+from lazy_imports import module_available
+
+# ONNX inference is optional; without onnxruntime the PyTorch backend is used
+ONNX_AVAILABLE = module_available('onnxruntime')
+
+# Process-wide registry so every search engine shares one loaded model
+_models = {}
+_models_lock = threading.Lock()
+
+def _load_cross_encoder(model_name):
+    from sentence_transformers import CrossEncoder  # Deferred like the embedding model: it imports torch
+    
+    if ONNX_AVAILABLE:
+        try:
+            return CrossEncoder(model_name, backend='onnx')
+        except Exception as e:  # older sentence-transformers, or no ONNX export for this model
+            print(f"ONNX cross-encoder unavailable, using PyTorch: {e}")
+    return CrossEncoder(model_name)
+
+def get_cross_encoder(model_name=CROSS_ENCODER_MODEL):
+    """Return the shared CrossEncoder for a model name, loading it on first use"""
+    model = _models.get(model_name)
+    if model is None:
+        with _models_lock:
+            model = _models.get(model_name)
+            if model is None:
+                model = _load_cross_encoder(model_name)
+                _models[model_name] = model
+    return model
+
+class CrossEncoderReranker:
+    """Re-scores the top candidates of a search with a cross-encoder, unless that would overrun the latency budget"""
+    
+    def __init__(self, model_name=CROSS_ENCODER_MODEL, top_n=CROSS_ENCODER_TOP_N, budget_ms=CROSS_ENCODER_BUDGET_MS,
+                 batch_size=CROSS_ENCODER_BATCH_SIZE):
+        self.model_name = model_name
+        self.top_n = top_n
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self.ms_per_pair = None  # Moving average of measured inference cost
+        self.runs = 0
+        self.skips = 0
+        self._lock = threading.Lock()
+        self._loading = None
+        self._retry_at = 0.0  # A failed warm-up is retried by requests after this time
+    
+    def warm_up(self):
+        """Load the model and time a batch of chunk-sized passages, so requests have a cost estimate"""
+        model = get_cross_encoder(self.model_name)
+        passage = "warm up " * 128
+        
+        # The first, untimed call absorbs one-off setup costs
+        model.predict([("warm up", passage)] * 2, batch_size=self.batch_size)
+        self._measure(model, "warm up", [passage] * self.top_n)
+    
+    def _measure(self, model, query, texts):
+        start = time.perf_counter()
+        scores = model.predict([(query, text) for text in texts], batch_size=self.batch_size)
+        ms_per_pair = (time.perf_counter() - start) * 1000 / max(len(texts), 1)
+        
+        with self._lock:
+            self.ms_per_pair = ms_per_pair if self.ms_per_pair is None else 0.8 * self.ms_per_pair + 0.2 * ms_per_pair
+        return scores
+    
+    def rerank(self, query, results, started_at):
+        """Results with the top_n re-ordered by cross-encoder score; unchanged when skipped"""
+        candidates = results[:self.top_n]
+        if len(candidates) < 2:
+            return results
+        
+        # The model loads in the background; requests before it is ready keep the heuristic order
+        if self.ms_per_pair is None:
+            self._warm_up_in_background()
+            self.skips += 1
+            return results
+        
+        remaining_ms = self.budget_ms - (time.perf_counter() - started_at) * 1000
+        if self.ms_per_pair * len(candidates) > remaining_ms:
+            self.skips += 1
+            return results
+        
+        scores = self._measure(get_cross_encoder(self.model_name), query, [result['content'] for result in candidates])
+        self.runs += 1
+        
+        for result, score in zip(candidates, scores):
+            result['cross_encoder_score'] = float(score)
+        candidates = sorted(candidates, key=lambda x: x['cross_encoder_score'], reverse=True)
+        return candidates + results[self.top_n:]
+    
+    def _warm_up_in_background(self):
+        with self._lock:
+            if self._loading is None and time.monotonic() >= self._retry_at:
+                self._loading = threading.Thread(target=self._try_warm_up, daemon=True)
+                self._loading.start()
+    
+    def _try_warm_up(self):
+        try:
+            self.warm_up()
+        except Exception as e:
+            print(f"Error loading cross-encoder {self.model_name}, retrying in {CROSS_ENCODER_RETRY_SECONDS}s: {e}")
+            with self._lock:
+                self._retry_at = time.monotonic() + CROSS_ENCODER_RETRY_SECONDS
+                self._loading = None
+    
+    def stats(self):
+        return {
+            'model': self.model_name,
+            'top_n': self.top_n,
+            'budget_ms': self.budget_ms,
+            'ms_per_pair': self.ms_per_pair,
+            'runs': self.runs,
+            'skips': self.skips
+        }
@@ -0,0 +1,238 @@
+import os
+import re
+import json
+import sqlite3
+from datetime import datetime
+from config import DB_PATH, EXPORT_DIR
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional; the rest of the app does not need pyarrow
+    pa = None
+    pq = None
+
+EXPORT_STATE_FILE = "_export_state.json"
+
+# One partitioned dataset per table; fiscal_year lives in the partition path, not the files
+EXPORT_DATASETS = ['financial_metrics', 'risk_factors', 'business_segments', 'executive_insights']
+
+def _dataset_schemas():
+    """Arrow schemas shared by every file of a dataset so scans never see drifting types"""
+    doc_fields = [
+        ('doc_id', pa.int64()),
+        ('company_name', pa.string()),
+        ('filename', pa.string())
+    ]
+    
+    return {
+        'financial_metrics': pa.schema(doc_fields + [
+            ('metric_name', pa.string()),
+            ('metric_value', pa.float64()),
+            ('metric_unit', pa.string()),
+            ('year', pa.string())
+        ]),
+        'risk_factors': pa.schema(doc_fields + [
+            ('risk_category', pa.string()),
+            ('risk_description', pa.string()),
+            ('severity_level', pa.string())
+        ]),
+        'business_segments': pa.schema(doc_fields + [
+            ('segment_name', pa.string()),
+            ('segment_revenue', pa.float64()),
+            ('segment_description', pa.string())
+        ]),
+        'executive_insights': pa.schema(doc_fields + [
+            ('insight_type', pa.string()),
+            ('position', pa.int32()),
+            ('insight_text', pa.string())
+        ])
+    }
+
+def _normalize_metric_name(name):
+    """Normalize metric names such as 'Net Income' and 'net-income' to 'net_income'"""
+    return re.sub(r'[^a-z0-9]+', '_', str(name or '').lower()).strip('_')
+
+def _to_float(value):
+    """Coerce values stored as text (e.g. '$1,234.5') to floats, or None"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    
+    cleaned = re.sub(r'[^0-9.\-]', '', str(value))
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+def _partition_value(fiscal_year):
+    """Hive partition value for a document's fiscal year"""
+    value = re.sub(r'[^0-9A-Za-z_-]', '', str(fiscal_year or ''))
+    return value or 'unknown'
+
+def _load_state(export_dir):
+    state_path = os.path.join(export_dir, EXPORT_STATE_FILE)
+    if not os.path.exists(state_path):
+        return {'documents': {}, 'last_export': None}
+    
+    with open(state_path, 'r') as f:
+        return json.load(f)
+
+def _save_state(export_dir, state):
+    state_path = os.path.join(export_dir, EXPORT_STATE_FILE)
+    temp_path = state_path + ".tmp"
+    
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+    
+    os.replace(temp_path, state_path)
+
+def _export_path(export_dir, dataset, partition, doc_id):
+    return os.path.join(export_dir, dataset, f"fiscal_year={partition}", f"doc_{doc_id}.parquet")
+
+def _write_rows(path, rows, schema):
+    """Write one document's rows to a Parquet file via a temp file and rename"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    table = pa.Table.from_pylist(rows, schema=schema)
+    temp_path = path + ".tmp"
+    pq.write_table(table, temp_path, compression='zstd')
+    os.replace(temp_path, path)
+
+def _executive_insight_rows(results_json):
+    """Flatten the executive_insights JSON blob into one row per insight"""
+    try:
+        insights = json.loads(results_json)
+    except (TypeError, json.JSONDecodeError):
+        return []
+    
+    if not isinstance(insights, dict):
+        return []
+    
+    rows = []
+    for insight_type, key in [('financial_highlight', 'financial_highlights'), ('key_risk', 'key_risks')]:
+        for position, text in enumerate(insights.get(key) or []):
+            rows.append({'insight_type': insight_type, 'position': position, 'insight_text': str(text)})
+    
+    if insights.get('business_strategy'):
+        rows.append({'insight_type': 'business_strategy', 'position': 0,
+                     'insight_text': str(insights['business_strategy'])})
+    
+    recommendation = insights.get('investment_recommendation')
+    if isinstance(recommendation, dict):
+        if recommendation.get('rating'):
+            rows.append({'insight_type': 'investment_rating', 'position': 0,
+                         'insight_text': str(recommendation['rating'])})
+        if recommendation.get('rationale'):
+            rows.append({'insight_type': 'investment_rationale', 'position': 0,
+                         'insight_text': str(recommendation['rationale'])})
+    
+    return rows
+
+def _document_rows(cursor, doc_id):
+    """Collect the normalized rows of every dataset for one document"""
+    rows = {}
+    
+    cursor.execute('''
+        SELECT metric_name, metric_value, metric_unit, year
+        FROM financial_metrics WHERE doc_id = ?
+    ''', (doc_id,))
+    rows['financial_metrics'] = [
+        {'metric_name': _normalize_metric_name(name), 'metric_value': _to_float(value),
+         'metric_unit': unit, 'year': None if year is None else str(year)}
+        for name, value, unit, year in cursor.fetchall()
+    ]
+    
+    cursor.execute('''
+        SELECT risk_category, risk_description, severity_level
+        FROM risk_factors WHERE doc_id = ?
+    ''', (doc_id,))
+    rows['risk_factors'] = [
+        {'risk_category': category, 'risk_description': description, 'severity_level': severity}
+        for category, description, severity in cursor.fetchall()
+    ]
+    
+    cursor.execute('''
+        SELECT segment_name, segment_revenue, segment_description
+        FROM business_segments WHERE doc_id = ?
+    ''', (doc_id,))
+    rows['business_segments'] = [
+        {'segment_name': name, 'segment_revenue': _to_float(revenue), 'segment_description': description}
+        for name, revenue, description in cursor.fetchall()
+    ]
+    
+    cursor.execute('''
+        SELECT results FROM analysis_results
+        WHERE doc_id = ? AND analysis_type = 'executive_insights'
+        ORDER BY created_date DESC LIMIT 1
+    ''', (doc_id,))
+    latest = cursor.fetchone()
+    rows['executive_insights'] = _executive_insight_rows(latest[0]) if latest else []
+    
+    return rows
+
+def _remove_exported_document(export_dir, doc_id, partition):
+    for dataset in EXPORT_DATASETS:
+        path = _export_path(export_dir, dataset, partition, doc_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+def export_to_parquet(export_dir=EXPORT_DIR, full=False):
+    """Incrementally export processed documents to partitioned Parquet datasets"""
+    if pa is None:
+        raise ImportError("pyarrow is required for Parquet export: pip install pyarrow")
+    
+    os.makedirs(export_dir, exist_ok=True)
+    state = {'documents': {}, 'last_export': None} if full else _load_state(export_dir)
+    exported = state['documents']
+    schemas = _dataset_schemas()
+    
+    # Read-only connection so a long export never holds a write lock on the live database
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    cursor = conn.cursor()
+    
+    summary = {'exported_documents': [], 'removed_documents': [], 'rows_written': 0}
+    
+    try:
+        cursor.execute('SELECT id FROM documents')
+        live_ids = {str(row[0]) for row in cursor.fetchall()}
+        
+        # Drop files of documents that were purged since the last export
+        for doc_key in sorted(set(exported) - live_ids):
+            _remove_exported_document(export_dir, doc_key, exported.pop(doc_key))
+            summary['removed_documents'].append(int(doc_key))
+        
+        documents = conn.execute('''
+            SELECT id, filename, company_name, fiscal_year FROM documents
+            WHERE processed ORDER BY id
+        ''')
+        
+        # Stream one document at a time so memory stays bounded by the largest filing
+        for doc_id, filename, company_name, fiscal_year in documents:
+            if str(doc_id) in exported:
+                continue
+            
+            partition = _partition_value(fiscal_year)
+            doc_fields = {'doc_id': doc_id, 'company_name': company_name, 'filename': filename}
+            
+            for dataset, rows in _document_rows(cursor, doc_id).items():
+                if not rows:
+                    continue
+                
+                rows = [dict(doc_fields, **row) for row in rows]
+                _write_rows(_export_path(export_dir, dataset, partition, doc_id), rows, schemas[dataset])
+                summary['rows_written'] += len(rows)
+            
+            exported[str(doc_id)] = partition
+            summary['exported_documents'].append(doc_id)
+    
+    finally:
+        conn.close()
+        state['last_export'] = datetime.now().isoformat()
+        _save_state(export_dir, state)
+    
+    return summary
+
+if __name__ == "__main__":
+    result = export_to_parquet()
+    print(f"Exported {len(result['exported_documents'])} documents "
+          f"({result['rows_written']} rows), removed {len(result['removed_documents'])}")
@@ -0,0 +1,361 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import multiprocessing
+import numpy as np
+from collections import OrderedDict, deque
+from lazy_imports import module_available
+from config import (EMBEDDING_MODEL, EMBEDDING_BACKEND, ONNX_INT8_FILE, ONNX_EXPORT_DIR, QUERY_EMBEDDING_CACHE_SIZE,
+                    EMBEDDING_CACHE_PATH, ENCODE_BATCH_SIZE, ENCODER_POOL_PROCESSES, ENCODER_POOL_THREADS)
+
+# ONNX inference is optional; without onnxruntime the PyTorch backend is used
+ONNX_AVAILABLE = module_available('onnxruntime')
+
+# Process-wide registry so every search engine and thread shares one loaded model;
+# values are (model, backend actually loaded) keyed by (model name, requested backend)
+_models = {}
+_models_lock = threading.Lock()
+
+def _export_int8_model(model_name):
+    """Quantize an ONNX export of the model once, kept under ONNX_EXPORT_DIR"""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+    
+    local_dir = os.path.join(ONNX_EXPORT_DIR, model_name.replace('/', '__'))
+    if not os.path.exists(os.path.join(local_dir, ONNX_INT8_FILE)):
+        model = SentenceTransformer(model_name, backend='onnx')
+        model.save(local_dir)
+        suffix = os.path.splitext(os.path.basename(ONNX_INT8_FILE))[0][len('model_'):]
+        export_dynamic_quantized_onnx_model(model, 'avx2', local_dir, file_suffix=suffix)
+    return SentenceTransformer(local_dir, backend='onnx', model_kwargs={'file_name': ONNX_INT8_FILE})
+
+def _load_embedding_model(model_name, backend):
+    """(model, backend) for the requested backend, falling back to PyTorch when ONNX cannot be used"""
+    # Imported here rather than at module level: sentence_transformers pulls in torch, which takes seconds
+    from sentence_transformers import SentenceTransformer
+    
+    if backend in ('onnx', 'onnx-int8') and not ONNX_AVAILABLE:
+        print(f"onnxruntime not installed, using PyTorch for {model_name}")
+    elif backend == 'onnx':
+        try:
+            return SentenceTransformer(model_name, backend='onnx'), 'onnx'
+        except Exception as e:  # older sentence-transformers, or the model cannot be exported
+            print(f"ONNX embedding model unavailable, using PyTorch: {e}")
+    elif backend == 'onnx-int8':
+        try:
+            return SentenceTransformer(model_name, backend='onnx', model_kwargs={'file_name': ONNX_INT8_FILE}), backend
+        except Exception as e:
+            print(f"No {ONNX_INT8_FILE} for {model_name}, quantizing locally: {e}")
+        try:
+            return _export_int8_model(model_name), backend
+        except Exception as e:
+            print(f"int8 ONNX embedding model unavailable, using PyTorch: {e}")
+    return SentenceTransformer(model_name), 'torch'
+
+def _registered_model(model_name, backend):
+    entry = _models.get((model_name, backend))
+    if entry is None:
+        with _models_lock:
+            # Re-check under the lock so concurrent callers load the model only once
+            entry = _models.get((model_name, backend))
+            if entry is None:
+                entry = _load_embedding_model(model_name, backend)
+                _models[(model_name, backend)] = entry
+    return entry
+
+def get_embedding_model(model_name=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND):
+    """Return the shared SentenceTransformer for a model name and backend, loading it on first use"""
+    return _registered_model(model_name, backend)[0]
+
+def embedding_space(model_name=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND):
+    """Name of the vector space a model produces; indices and caches only mix vectors of one space"""
+    # The fp32 ONNX export reproduces PyTorch's vectors (to ~1e-6), while int8 weights shift them measurably;
+    # so only int8 loads the model here, to learn whether it fell back to PyTorch
+    if backend != 'onnx-int8':
+        return model_name
+    loaded_backend = _registered_model(model_name, backend)[1]
+    return f"{model_name}#int8" if loaded_backend == 'onnx-int8' else model_name
+
+def warm_up_embedding_model(model_name=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND):
+    """Load the model and run a tiny encode so the first real request skips setup costs"""
+    model = get_embedding_model(model_name, backend)
+    model.encode(["warm up"])
+    return model
+
+def loaded_embedding_models():
+    """Backend each model in memory runs on, by (model name, requested backend)"""
+    return {key: loaded_backend for key, (_, loaded_backend) in _models.items()}
+
+# The model held by an encoder pool worker process, and the vector space it produces
+_worker_model = None
+_worker_space = None
+
+def _init_encoder_worker(model_name, backend, threads):
+    global _worker_model, _worker_space
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker_model = get_embedding_model(model_name, backend)
+    _worker_space = embedding_space(model_name, backend)
+
+def _encode_batch(texts):
+    return np.asarray(_worker_model.encode(texts, batch_size=len(texts)), dtype='float32')
+
+def _get_worker_space():
+    return _worker_space
+
+class EncoderPool:
+    """Worker processes that each hold the embedding model, so bulk ingestion encodes on every core"""
+    
+    def __init__(self, model_name=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND, processes=ENCODER_POOL_PROCESSES,
+                 threads=ENCODER_POOL_THREADS, batch_size=ENCODE_BATCH_SIZE):
+        self.model_name = model_name
+        self.backend = backend
+        self.threads = threads
+        self.processes = processes or max(1, (os.cpu_count() or 1) // threads)
+        self.batch_size = batch_size
+        self._pool = None
+    
+    def _start(self):
+        """The worker processes, started on first use as each loads a model"""
+        if self._pool is None:
+            # Spawn, not fork: forking a process whose torch thread pool is running can deadlock
+            self._pool = multiprocessing.get_context('spawn').Pool(
+                self.processes, initializer=_init_encoder_worker,
+                initargs=(self.model_name, self.backend, self.threads)
+            )
+        return self._pool
+    
+    def embedding_space(self):
+        """Vector space of the workers' model, without loading the model in this process"""
+        if self.backend != 'onnx-int8':
+            return embedding_space(self.model_name, self.backend)
+        return self._start().apply(_get_worker_space)
+    
+    def stream(self, batches):
+        """Raw float32 embeddings of each batch of texts, in order as they finish; batches may be a generator"""
+        # Batches are queued to whichever worker is free, so one stream keeps every worker busy
+        return self._start().imap(_encode_batch, batches)
+    
+    def encode(self, texts):
+        """Raw float32 embeddings of texts, in order"""
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        return np.vstack(list(self.stream(batches)))
+    
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self._pool is not None:
+            # Batches still queued by an abandoned stream are dropped rather than waited for
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self.close()
+
+def _normalize_rows(embeddings):
+    """L2-normalize embedding rows in place"""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings /= np.maximum(norms, 1e-12)
+    return embeddings
+
+class QueryEmbeddingCache:
+    """Bounded LRU of normalized query embeddings keyed by (embedding space, query text)"""
+    
+    def __init__(self, max_entries=QUERY_EMBEDDING_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get_many(self, space, queries):
+        """Cached vectors for each query, or None where the query has not been seen"""
+        vectors = []
+        with self._lock:
+            for query in queries:
+                key = (space, query)
+                vector = self._entries.get(key)
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                vectors.append(vector)
+        return vectors
+    
+    def put_many(self, space, vectors_by_query):
+        with self._lock:
+            for query, vector in vectors_by_query.items():
+                vector.setflags(write=False)  # Shared between callers, so never mutated
+                self._entries[(space, query)] = vector
+                self._entries.move_to_end((space, query))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+_query_cache = QueryEmbeddingCache()
+
+def encode_queries(queries, model_name=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND):
+    """Normalized float32 query embeddings, running the encoder only for uncached queries"""
+    space = embedding_space(model_name, backend)
+    vectors = _query_cache.get_many(space, queries)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    
+    if missing:
+        # Encode each distinct unseen query once, in a single batch
+        texts = list(dict.fromkeys(queries[i] for i in missing))
+        encoded = np.asarray(get_embedding_model(model_name, backend).encode(texts, batch_size=ENCODE_BATCH_SIZE),
+                             dtype='float32')
+        encoded_by_query = dict(zip(texts, _normalize_rows(encoded)))
+        _query_cache.put_many(space, encoded_by_query)
+        
+        for i in missing:
+            vectors[i] = encoded_by_query[queries[i]]
+    
+    return np.vstack(vectors)
+
+def get_query_cache_stats():
+    """Hit/miss counters and size of the shared query embedding cache"""
+    return _query_cache.stats()
+
+def clear_query_cache():
+    """Drop every cached query embedding, e.g. so a benchmark times the encoder"""
+    _query_cache.clear()
+
+# SQLite limits the number of bound parameters per statement
+_CACHE_LOOKUP_BATCH = 500
+
+def _init_embedding_cache(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chunk_embeddings (
+            key BLOB PRIMARY KEY,
+            dimension INTEGER,
+            vector BLOB
+        ) WITHOUT ROWID
+    ''')
+
+def _chunk_key(space, text):
+    """Content address of a chunk embedding: hash of the embedding space and chunk text"""
+    return hashlib.sha256(f"{space}\0{text}".encode('utf-8')).digest()
+
+def _cached_vectors(conn, keys):
+    """float16 vectors of the keys found in the embedding cache"""
+    cached = {}
+    distinct_keys = list(dict.fromkeys(keys))
+    for start in range(0, len(distinct_keys), _CACHE_LOOKUP_BATCH):
+        batch = distinct_keys[start:start + _CACHE_LOOKUP_BATCH]
+        placeholders = ','.join('?' * len(batch))
+        rows = conn.execute(
+            f'SELECT key, dimension, vector FROM chunk_embeddings WHERE key IN ({placeholders})', batch
+        )
+        for key, dimension, vector in rows:
+            cached[key] = np.frombuffer(vector, dtype=np.float16).reshape(dimension)
+    return cached
+
+def _insert_vectors(conn, keys, encoded):
+    """Normalize raw embeddings and store them in the cache; returns the float16 vectors stored"""
+    encoded = _normalize_rows(np.asarray(encoded, dtype='float32')).astype(np.float16)
+    conn.executemany(
+        'INSERT OR IGNORE INTO chunk_embeddings (key, dimension, vector) VALUES (?, ?, ?)',
+        [(key, vector.shape[0], vector.tobytes()) for key, vector in zip(keys, encoded)]
+    )
+    return encoded
+
+def encode_documents(texts, model_name=EMBEDDING_MODEL, cache_path=EMBEDDING_CACHE_PATH, backend=EMBEDDING_BACKEND,
+                     pool=None, space=None):
+    """Normalized float32 chunk embeddings, encoding only chunks missing from the persistent cache"""
+    # Plain model names stay the space of PyTorch and fp32 ONNX, so existing cache entries remain valid
+    space = space or embedding_space(model_name, backend)
+    keys = [_chunk_key(space, text) for text in texts]
+    
+    conn = sqlite3.connect(cache_path)
+    try:
+        _init_embedding_cache(conn)
+        cached = _cached_vectors(conn, keys)
+        
+        # Encode each distinct uncached chunk once, e.g. boilerplate repeated across filings
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        
+        if missing:
+            # A pool spreads bulk ingestion over its worker processes
+            if pool is not None:
+                encoded = pool.encode(list(missing.values()))
+            else:
+                model = get_embedding_model(model_name, backend)
+                encoded = model.encode(list(missing.values()), batch_size=ENCODE_BATCH_SIZE)
+            encoded = _insert_vectors(conn, list(missing), encoded)
+            conn.commit()
+            cached.update(zip(missing, encoded))
+    finally:
+        conn.close()
+    
+    # Fresh and cached chunks both go through float16, so re-ingests produce identical vectors
+    return np.vstack([cached[key] for key in keys]).astype('float32') if keys else np.zeros((0, 0), dtype='float32')
+
+def cache_document_embeddings(documents, pool, cache_path=EMBEDDING_CACHE_PATH):
+    """Encode the uncached chunks of many (doc_id, texts) documents as one stream on an encoder pool, yielding each
+    doc_id once all of its chunks are in the cache"""
+    space = pool.embedding_space()
+    
+    conn = sqlite3.connect(cache_path)
+    try:
+        _init_embedding_cache(conn)
+        
+        # One queue of chunks from every document keeps all workers busy, however uneven the documents are;
+        # a document is complete once the batch holding its last uncached chunk comes back
+        queued = {}
+        complete_after = deque()
+        for doc_id, texts in documents:
+            keys = {_chunk_key(space, text): text for text in texts}
+            cached = _cached_vectors(conn, list(keys))
+            for key, text in keys.items():
+                if key not in cached:
+                    queued.setdefault(key, text)
+            complete_after.append((doc_id, -(-len(queued) // pool.batch_size)))
+        
+        keys, texts = list(queued), list(queued.values())
+        del queued
+        batches = (texts[start:start + pool.batch_size] for start in range(0, len(texts), pool.batch_size))
+        
+        done = 0
+        results = pool.stream(batches) if texts else None
+        while complete_after:
+            while complete_after and complete_after[0][1] <= done:
+                yield complete_after.popleft()[0]
+            if complete_after:
+                encoded = next(results)
+                _insert_vectors(conn, keys[done * pool.batch_size:(done + 1) * pool.batch_size], encoded)
+                done += 1
+                # Committed before the next document is handed out, so its chunks are readable from the cache
+                if complete_after[0][1] <= done:
+                    conn.commit()
+    finally:
+        conn.close()
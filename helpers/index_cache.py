@@ -0,0 +1,130 @@
+import sys
+import threading
+from collections import OrderedDict
+from config import INDEX_CACHE_MAX_BYTES
+from index_factory import SegmentedIndex
+from lazy_imports import lazy_import
+
+faiss = lazy_import('faiss')  # Loaded when the first index is touched, not when the app starts
+
+def estimate_index_bytes(index):
+    """Approximate memory held by a FAISS index: stored codes plus graph links and id maps"""
+    if isinstance(index, SegmentedIndex):
+        return sum(estimate_index_bytes(segment) for segment in index.segments)
+    
+    base = index
+    extra = 0
+    
+    if isinstance(base, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        extra += index.ntotal * 16  # id map and its reverse lookup
+        base = faiss.downcast_index(base.index)
+    
+    if isinstance(base, faiss.IndexHNSW):
+        extra += base.hnsw.neighbors.size() * 4
+        base = faiss.downcast_index(base.storage)
+    
+    try:
+        code_size = base.sa_code_size()
+    except RuntimeError:
+        code_size = base.d * 4
+    return index.ntotal * code_size + extra
+
+def _values_bytes(values):
+    if values is None:
+        return 0
+    elif hasattr(values, 'nbytes'):
+        return values.nbytes
+    return sum(sys.getsizeof(value) for value in values)
+
+def estimate_entry_bytes(faiss_index, entry):
+    """Bytes a loaded document can occupy; memory-mapped files count at their full size"""
+    return (estimate_index_bytes(faiss_index)
+            + _values_bytes(entry.get('documents'))
+            + _values_bytes(entry.get('section_names'))
+            + _values_bytes(entry.get('vectors'))
+            + _values_bytes(entry.get('bm25'))
+            + _values_bytes(entry.get('features')))
+
+class IndexCache:
+    """LRU of loaded document indices and chunk caches bounded by a memory budget in bytes"""
+    
+    def __init__(self, max_bytes=INDEX_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # doc_id -> (faiss_index, entry, size in bytes)
+        self._pinned = set()
+        self._lock = threading.RLock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __contains__(self, doc_id):
+        return doc_id in self._entries
+    
+    def get(self, doc_id):
+        """(faiss_index, entry) for a loaded document, or None; counts a hit or miss"""
+        with self._lock:
+            cached = self._entries.get(doc_id)
+            if cached is None:
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(doc_id)
+            self.hits += 1
+            return cached[0], cached[1]
+    
+    def peek(self, doc_id):
+        """Like get, without touching recency or counters"""
+        with self._lock:
+            cached = self._entries.get(doc_id)
+            return None if cached is None else (cached[0], cached[1])
+    
+    def put(self, doc_id, faiss_index, entry):
+        """Cache a loaded document, then evict least recently used unpinned documents over budget"""
+        with self._lock:
+            self.pop(doc_id)
+            size = estimate_entry_bytes(faiss_index, entry)
+            self._entries[doc_id] = (faiss_index, entry, size)
+            self.total_bytes += size
+            self._evict(keep=doc_id)
+    
+    def pop(self, doc_id):
+        with self._lock:
+            cached = self._entries.pop(doc_id, None)
+            if cached is not None:
+                self.total_bytes -= cached[2]
+            return cached
+    
+    def _evict(self, keep=None):
+        # The document just loaded always stays, even when it alone exceeds the budget
+        for doc_id in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if doc_id == keep or doc_id in self._pinned:
+                continue
+            self.pop(doc_id)
+            self.evictions += 1
+    
+    def pin(self, doc_id):
+        """Exempt a document from eviction (it may be loaded before or after pinning)"""
+        with self._lock:
+            self._pinned.add(doc_id)
+    
+    def unpin(self, doc_id):
+        with self._lock:
+            self._pinned.discard(doc_id)
+            self._evict()
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'loaded_documents': len(self._entries),
+                'pinned_documents': sorted(self._pinned),
+                'bytes_used': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
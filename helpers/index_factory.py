@@ -0,0 +1,305 @@
+import os
+import numpy as np
+from config import IVF_NPROBE, HNSW_EF_SEARCH
+from lazy_imports import lazy_import
+
+# Executed on first use, so importing the search modules does not pay for loading faiss
+faiss = lazy_import('faiss')
+
+INDEX_TYPES = ['flat', 'ivf_flat', 'hnsw', 'ivf_pq']
+
+# How each vector is stored: 4, 2 or 1 bytes per dimension, or a product-quantized code
+STORAGE_TYPES = ['float32', 'float16', 'int8', 'pq']
+_SCALAR_CODES = {'float32': 'Flat', 'float16': 'SQfp16', 'int8': 'SQ8'}
+
+# Automatic selection thresholds; exact search stays cheap below the first one
+FLAT_MAX_VECTORS = 50000
+IVF_FLAT_MAX_VECTORS = 2000000
+
+# Upper bound on vectors used to train IVF/PQ quantizers
+MAX_TRAINING_VECTORS = 100000
+
+# Fewest vectors a PQ codebook is trained on; k-means needs at least 2^nbits (16 at the 4-bit floor) points
+PQ_MIN_VECTORS = 64
+
+def select_index_type(n_vectors, index_type='auto'):
+    """Resolve 'auto' to a concrete index type for the given number of vectors"""
+    if index_type != 'auto':
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+        return index_type
+    
+    # HNSW is only used when asked for explicitly: it cannot remove vectors. Per-document indices work around that
+    # with tombstones, but the corpus index re-adds replaced documents under the same chunk ids, so the stale
+    # vectors would answer for the new chunks; CorpusIndex.reset refuses HNSW outright
+    if n_vectors < FLAT_MAX_VECTORS:
+        return 'flat'
+    elif n_vectors < IVF_FLAT_MAX_VECTORS:
+        return 'ivf_flat'
+    return 'ivf_pq'
+
+def _nlist(n_vectors):
+    # ~4*sqrt(n) inverted lists, capped so each centroid gets the ~39 training points faiss expects
+    return max(1, min(int(4 * np.sqrt(n_vectors)), n_vectors // 39))
+
+def _pq_subquantizers(dimension):
+    # Prefer 8 dimensions per sub-quantizer, falling back to whatever divides the dimension
+    for m in (dimension // 8, dimension // 4, dimension // 2):
+        if m > 0 and dimension % m == 0:
+            return m
+    return 1
+
+def _pq_code(n_vectors, dimension):
+    # 8-bit codes need ~256*39 training vectors; smaller documents get fewer centroids per sub-quantizer
+    nbits = int(np.clip(np.log2(max(n_vectors, 1) / 39), 4, 8))
+    return f'PQ{_pq_subquantizers(dimension)}x{nbits}'
+
+def _vector_code(storage, n_vectors, dimension):
+    if storage == 'pq':
+        # Too few vectors to learn a codebook; int8 is the next most compact encoding
+        return _pq_code(n_vectors, dimension) if n_vectors >= PQ_MIN_VECTORS else 'SQ8'
+    elif storage in _SCALAR_CODES:
+        return _SCALAR_CODES[storage]
+    raise ValueError(f"Unknown storage type '{storage}', expected one of {STORAGE_TYPES}")
+
+def index_description(index_type, n_vectors, dimension, storage='float32'):
+    """faiss.index_factory string for an index type and vector storage sized for n_vectors"""
+    code = _vector_code(storage, n_vectors, dimension)
+    
+    if index_type == 'flat':
+        # IndexPQ rejects id selectors (tombstones, document filters); a single inverted list scans the same
+        # codes exhaustively and accepts them
+        return f'IVF1,{code}' if code.startswith('PQ') else code
+    elif index_type == 'ivf_flat':
+        return f'IVF{_nlist(n_vectors)},{code}'
+    elif index_type == 'hnsw':
+        return 'HNSW32' if code == 'Flat' else f'HNSW32_{code}'
+    elif index_type == 'ivf_pq':
+        # Small documents keep the inverted lists but store int8 codes, as pq storage does
+        return f'IVF{_nlist(n_vectors)},{_vector_code("pq", n_vectors, dimension)}'
+    raise ValueError(f"Unknown index type '{index_type}'")
+
+def create_index(dimension, n_vectors, index_type='auto', with_ids=False, storage='float32'):
+    """Create an empty inner-product index, returning (index, resolved index type)"""
+    index_type = select_index_type(n_vectors, index_type)
+    description = index_description(index_type, n_vectors, dimension, storage)
+    
+    if with_ids:
+        description = 'IDMap2,' + description
+    
+    return faiss.index_factory(dimension, description, faiss.METRIC_INNER_PRODUCT), index_type
+
+def train_index(index, training_vectors):
+    """Train IVF/PQ quantizers on (a sample of) the vectors; no-op for indices that need no training"""
+    if index.is_trained:
+        return
+    
+    training_vectors = np.ascontiguousarray(training_vectors, dtype='float32')
+    if len(training_vectors) > MAX_TRAINING_VECTORS:
+        rows = np.random.default_rng(0).choice(len(training_vectors), MAX_TRAINING_VECTORS, replace=False)
+        training_vectors = training_vectors[np.sort(rows)]
+    
+    index.train(training_vectors)
+
+def build_index(embeddings, index_type='auto', ids=None, storage='float32'):
+    """Create, train and fill an index with normalized embeddings"""
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    index, _ = create_index(embeddings.shape[1], len(embeddings), index_type, with_ids=ids is not None,
+                            storage=storage)
+    train_index(index, embeddings)
+    
+    if ids is None:
+        index.add(embeddings)
+    else:
+        index.add_with_ids(embeddings, np.asarray(ids, dtype='int64'))
+    return index
+
+class SegmentedIndex:
+    """Consecutive indices searched as one, each storing its vectors under their positions across all segments: the
+    first as a plain index, later ones as IDMap2 indices"""
+    
+    def __init__(self, segments):
+        self.segments = segments
+        self.starts = np.cumsum([0] + [segment.ntotal for segment in segments])
+        self.ntotal = int(self.starts[-1])
+        self.d = segments[0].d
+    
+    def search(self, queries, k, params=None):
+        """Best k hits over every segment; params holds one entry per segment (see search_parameters)"""
+        params = params or [None] * len(self.segments)
+        hits = [segment.search(queries, k, params=segment_params)
+                for segment, segment_params in zip(self.segments, params)]
+        similarities = np.hstack([segment_similarities for segment_similarities, _ in hits])
+        ids = np.hstack([segment_ids for _, segment_ids in hits])
+        similarities[ids < 0] = -np.inf
+        
+        order = np.argsort(-similarities, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(similarities, order, axis=1), np.take_along_axis(ids, order, axis=1)
+    
+    def reconstruct_batch(self, ids):
+        """Stored vectors by id, each reconstructed by the segment holding it"""
+        ids = np.asarray(ids, dtype='int64')
+        segment_of_id = np.searchsorted(self.starts, ids, side='right') - 1
+        vectors = np.zeros((len(ids), self.d), dtype='float32')
+        for segment in np.unique(segment_of_id):
+            rows = segment_of_id == segment
+            vectors[rows] = vectors_for_ids(self.segments[segment], ids[rows])
+        return vectors
+
+class SegmentedRows:
+    """Rows of consecutive arrays (e.g. memory-mapped per-segment vectors) indexed by position as one array"""
+    
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.starts = np.cumsum([0] + [len(rows) for rows in arrays])
+        self.dtype = arrays[0].dtype
+    
+    def __len__(self):
+        return int(self.starts[-1])
+    
+    @property
+    def nbytes(self):
+        return sum(rows.nbytes for rows in self.arrays)
+    
+    def __getitem__(self, positions):
+        positions = np.asarray(positions, dtype='int64')
+        segment_of_row = np.searchsorted(self.starts, positions, side='right') - 1
+        rows = np.zeros(positions.shape + self.arrays[0].shape[1:], dtype=self.dtype)
+        for segment in np.unique(segment_of_row):
+            selected = segment_of_row == segment
+            rows[selected] = self.arrays[segment][positions[selected] - self.starts[segment]]
+        return rows
+
+def _base_index(index):
+    if isinstance(index, SegmentedIndex):
+        # Type and storage are reported for the first segment, which holds most of a document
+        return _base_index(index.segments[0])
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+def index_type_of(index):
+    """Index type name ('flat', 'ivf_flat', 'hnsw', 'ivf_pq') of an existing index"""
+    base = _base_index(index)
+    
+    if isinstance(base, faiss.IndexIVFPQ) and base.nlist == 1:
+        return 'flat'  # Exhaustive PQ, see index_description
+    elif isinstance(base, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    elif isinstance(base, faiss.IndexIVF):
+        return 'ivf_flat'
+    elif isinstance(base, faiss.IndexHNSW):
+        return 'hnsw'
+    return 'flat'
+
+def storage_of(index):
+    """Storage type name ('float32', 'float16', 'int8', 'pq') of an existing index"""
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base = faiss.downcast_index(base.storage)
+    
+    if isinstance(base, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return 'pq'
+    elif isinstance(base, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return 'float16' if base.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else 'int8'
+    return 'float32'
+
+def index_size_bytes(index):
+    """Serialized size of an index, close to the memory it holds"""
+    if isinstance(index, SegmentedIndex):
+        return sum(index_size_bytes(segment) for segment in index.segments)
+    return faiss.serialize_index(index).nbytes
+
+def read_index_mmap(path):
+    """Open a persisted index memory-mapped; the result is read-only and must never be added to"""
+    # Map stored codes instead of copying them into RAM (IO_FLAG_MMAP_IFC needs faiss >= 1.10)
+    return faiss.read_index(path, getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP))
+
+def write_index_atomic(index, path):
+    """Write an index via a temp file and rename, so mapped readers keep a consistent old copy"""
+    temp_path = path + ".tmp"
+    faiss.write_index(index, temp_path)
+    os.replace(temp_path, path)
+
+def reconstruct_all(index):
+    """All stored vectors of an index in insertion order"""
+    if isinstance(index, SegmentedIndex):
+        return index.reconstruct_batch(np.arange(index.ntotal))
+    if isinstance(_base_index(index), faiss.IndexIVF):
+        # IVF indices can only reconstruct by id once the direct map is built
+        faiss.extract_index_ivf(index).make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+def search_parameters(index, nprobe=None, ef_search=None, selector=None):
+    """Per-call search parameters (nprobe / efSearch / id filter), or None for plain exact search"""
+    if isinstance(index, SegmentedIndex):
+        # Segments store vectors under their positions across the document, so one id filter serves them all
+        return [search_parameters(segment, nprobe, ef_search, selector) for segment in index.segments]
+    
+    kwargs = {}
+    if selector is not None:
+        kwargs['sel'] = selector
+    
+    # By class rather than index_type_of: exhaustive PQ is an IVF index that reports 'flat'
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=nprobe or IVF_NPROBE, **kwargs)
+    elif isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search or HNSW_EF_SEARCH, **kwargs)
+    elif kwargs:
+        return faiss.SearchParameters(**kwargs)
+    return None
+
+def rerank_search(index, query_embeddings, k, vectors, rerank_factor, params=None):
+    """Fetch k * rerank_factor candidates from a (quantized) index and re-score them with exact float32 vectors"""
+    candidates = min(k * rerank_factor, index.ntotal)
+    _, candidate_ids = index.search(query_embeddings, candidates, params=params)
+    
+    # vectors may be a read-only memmap, in which case only the candidate rows are read from disk
+    valid = candidate_ids >= 0
+    rows = np.asarray(vectors[np.where(valid, candidate_ids, 0).ravel()], dtype='float32')
+    scores = np.einsum('qcd,qd->qc', rows.reshape(*candidate_ids.shape, -1), query_embeddings)
+    scores[~valid] = -np.inf
+    
+    k = min(k, candidates)
+    order = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    similarities = np.take_along_axis(scores, order, axis=1).astype('float32')
+    ids = np.take_along_axis(candidate_ids, order, axis=1)
+    ids[~np.isfinite(similarities)] = -1
+    return similarities, ids
+
+def vectors_for_ids(index, ids, vectors=None):
+    """Stored vectors by id: exact rows of vectors when given, otherwise reconstructed (lossy when quantized)"""
+    ids = np.asarray(ids, dtype='int64')
+    if vectors is not None:
+        return np.asarray(vectors[ids], dtype='float32')
+    elif isinstance(index, SegmentedIndex):
+        return index.reconstruct_batch(ids)
+    
+    if isinstance(_base_index(index), faiss.IndexIVF):
+        # IVF indices can only reconstruct by id once the direct map is built (also fine on mapped indices)
+        ivf = faiss.extract_index_ivf(index)
+        if ivf.direct_map.type == faiss.DirectMap.NoMap:
+            ivf.make_direct_map()
+    return index.reconstruct_batch(ids)
+
+def score_ids(index, query_embedding, ids, vectors=None):
+    """Inner products of one query with stored vectors by id, e.g. for hits found by another retriever"""
+    return vectors_for_ids(index, ids, vectors) @ query_embedding
+
+def measure_recall(vectors, search, k=10, n_queries=100, seed=0):
+    """recall@k of search(queries, k) against exact search over vectors"""
+    vectors = np.asarray(vectors, dtype='float32')
+    k = min(k, len(vectors))
+    if k == 0:
+        return 1.0
+    
+    # Normalized midpoints of random pairs of stored vectors, so queries fall between neighbours
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), n_queries)] + vectors[rng.integers(0, len(vectors), n_queries)]
+    queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    
+    exact = np.argpartition(-(queries @ vectors.T), k - 1, axis=1)[:, :k]
+    _, found = search(np.ascontiguousarray(queries), k)
+    hits = sum(len(set(row) & set(truth)) for row, truth in zip(found, exact))
+    return hits / exact.size
@@ -0,0 +1,27 @@
+import sys
+import threading
+import importlib.util
+
+_lock = threading.Lock()
+
+def lazy_import(name):
+    """Module object for name that is only executed on first attribute access, so importing its users stays cheap"""
+    with _lock:
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+        
+        spec = importlib.util.find_spec(name)
+        if spec is None:
+            raise ImportError(f"No module named '{name}'")
+        
+        loader = importlib.util.LazyLoader(spec.loader)
+        spec.loader = loader
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        loader.exec_module(module)
+        return module
+
+def module_available(name):
+    """Whether an optional dependency is installed, without importing it"""
+    return importlib.util.find_spec(name) is not None
@@ -1,17 +1,14 @@
-import openai
 import json
 import re
-from config import OPENAI_API_KEY, LLM_MODEL, EXTRACTION_PROMPTS, TEMPERATURE, MAX_TOKENS, DEFAULT_FALLBACK_DATA
+from config import LLM_MODEL, EXTRACTION_PROMPTS, TEMPERATURE, MAX_TOKENS, DEFAULT_FALLBACK_DATA
 from database import save_financial_metrics, save_risk_factors, save_business_segments, save_analysis_results, get_analysis_results
 from pdf_processor import chunk_text_for_analysis
-
-# Initialize OpenAI client for v1.x
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+from openai_client import get_openai_client
 
 def call_openai_api(prompt, text_chunk, max_retries=2):
     for attempt in range(max_retries):
         try:
-            response = client.chat.completions.create(
+            response = get_openai_client().chat.completions.create(
                 model=LLM_MODEL,
                 messages=[
                     {"role": "system", "content": "You are a financial analyst specialized in 10-K document analysis. Always return valid JSON responses."},
@@ -0,0 +1,16 @@
+import threading
+from config import OPENAI_API_KEY
+
+# One client per process, created on first use: importing openai alone takes most of a second
+_client = None
+_client_lock = threading.Lock()
+
+def get_openai_client():
+    """Return the shared OpenAI v1.x client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import openai
+                _client = openai.OpenAI(api_key=OPENAI_API_KEY)
+    return _client
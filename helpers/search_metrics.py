@@ -0,0 +1,117 @@
+import time
+import threading
+import numpy as np
+
+# Histogram bucket upper bounds: 100 log-spaced steps from 10 us to 2 minutes (~18% apart), plus an overflow bucket
+LATENCY_BUCKETS_MS = np.geomspace(0.01, 120000, 100)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; percentiles are interpolated within the bucket they fall in"""
+    
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = np.zeros(len(bounds) + 1, dtype='int64')
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+    
+    @property
+    def count(self):
+        return int(self.counts.sum())
+    
+    def record(self, ms):
+        self.counts[np.searchsorted(self.bounds, ms)] += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+    
+    def percentile(self, q):
+        count = self.count
+        if count == 0:
+            return None
+        
+        cumulative = np.cumsum(self.counts)
+        rank = q / 100 * count
+        bucket = int(np.searchsorted(cumulative, rank))
+        if bucket >= len(self.bounds):
+            return self.max_ms
+        
+        lower = self.bounds[bucket - 1] if bucket else 0.0
+        below = cumulative[bucket - 1] if bucket else 0
+        fraction = (rank - below) / self.counts[bucket]
+        return float(min(lower + fraction * (self.bounds[bucket] - lower), self.max_ms))
+    
+    def summary(self):
+        count = self.count
+        return {
+            'count': count,
+            'mean_ms': self.total_ms / count if count else None,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max_ms if count else None
+        }
+
+class SearchMetrics:
+    """Per-stage latency histograms and event counters of the search and QA pipelines"""
+    
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+    
+    def record(self, pipeline, stage, ms):
+        with self._lock:
+            histogram = self._histograms.get((pipeline, stage))
+            if histogram is None:
+                histogram = self._histograms[(pipeline, stage)] = LatencyHistogram()
+            histogram.record(ms)
+    
+    def count(self, pipeline, event):
+        """Count an outcome, e.g. a fallback answer or a failed search"""
+        with self._lock:
+            self._counters[(pipeline, event)] = self._counters.get((pipeline, event), 0) + 1
+    
+    def snapshot(self):
+        """{pipeline: {'stages': {stage: latency summary}, 'events': {event: count}}}"""
+        with self._lock:
+            snapshot = {}
+            for (pipeline, stage), histogram in self._histograms.items():
+                snapshot.setdefault(pipeline, {'stages': {}, 'events': {}})['stages'][stage] = histogram.summary()
+            for (pipeline, event), count in self._counters.items():
+                snapshot.setdefault(pipeline, {'stages': {}, 'events': {}})['events'][event] = count
+            return snapshot
+    
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+# Process-wide, like the model and query caches: every engine and the API endpoint see the same numbers
+_metrics = SearchMetrics()
+
+class StageTimer:
+    """Times consecutive stages of one request: lap(stage) records the time since the previous lap"""
+    
+    def __init__(self, pipeline, metrics=None):
+        self.pipeline = pipeline
+        self.metrics = metrics or _metrics
+        self.started_at = time.perf_counter()
+        self._last = self.started_at
+    
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.metrics.record(self.pipeline, stage, (now - self._last) * 1000)
+        self._last = now
+    
+    def count(self, event):
+        self.metrics.count(self.pipeline, event)
+    
+    def finish(self):
+        """Record the end-to-end time as the 'total' stage"""
+        self.metrics.record(self.pipeline, 'total', (time.perf_counter() - self.started_at) * 1000)
+
+def get_search_metrics():
+    """p50/p95/p99 latency of every recorded stage, and event counts, by pipeline"""
+    return _metrics.snapshot()
+
+def reset_search_metrics():
+    _metrics.reset()
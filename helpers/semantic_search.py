@@ -1,40 +1,77 @@
-import openai
 import numpy as np
-import faiss
 import os
+import hashlib
 import pickle
-from sentence_transformers import SentenceTransformer
+import shutil
 import sqlite3
-from database import DB_PATH, get_analysis_results
-from config import OPENAI_API_KEY, EMBEDDING_MODEL, LLM_MODEL
+import tempfile
+import threading
+from database import (DB_PATH, get_analysis_results, get_document_info, delete_document, get_all_document_ids,
+                      get_expired_document_ids, reclaim_space)
+from config import (EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_CACHE_PATH, LLM_MODEL, FAISS_INDEX_DIR, INDEX_TYPE,
+                    CORPUS_INDEX_TYPE, INDEX_STORAGE, CORPUS_INDEX_STORAGE, RERANK_FACTOR, TOMBSTONE_COMPACT_RATIO, RRF_K,
+                    DEDUP_SIMILARITY_THRESHOLD, CROSS_ENCODER_MODEL, ENCODER_POOL_PROCESSES, EMBED_STREAM_BATCH_SIZE,
+                    CHUNK_MAX_LENGTH, CHUNK_OVERLAP, INDEX_AUTO_REBUILD, INDEX_VERIFY_CHECKSUMS,
+                    RETENTION_MAX_AGE_DAYS, RETENTION_DROP_SUPERSEDED, RETENTION_VACUUM_PAGES, INSIGHT_QUERIES)
 import json
 import re
 from collections import Counter
+from contextlib import nullcontext
+from embedding_models import (get_embedding_model, embedding_space, warm_up_embedding_model, encode_queries,
+                              encode_documents, cache_document_embeddings, EncoderPool)
+from corpus_index import get_corpus_index
+from index_factory import (build_index, create_index, train_index, select_index_type, storage_of, index_size_bytes,
+                           search_parameters, rerank_search, score_ids, vectors_for_ids, measure_recall,
+                           read_index_mmap, write_index_atomic, SegmentedIndex, SegmentedRows, MAX_TRAINING_VECTORS)
+from chunk_store import write_chunk_store, open_chunk_store, SegmentedChunkStore
+from bm25_index import BM25Index, BM25Segment
+from chunk_features import FINANCIAL_KEYWORDS, FEATURE_DTYPE, chunk_features, matched_terms
+from index_cache import IndexCache
+from cross_encoder import CrossEncoderReranker
+from search_metrics import StageTimer
+from openai_client import get_openai_client
+from lazy_imports import lazy_import
 
-# Initialize OpenAI client for v1.x
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+# Importing this module stays cheap: faiss, the embedding model and the OpenAI client load on first use
+faiss = lazy_import('faiss')
 
 class FAISSEnhancedSemanticSearchEngine:
-    def __init__(self):
-        self.model = SentenceTransformer(EMBEDDING_MODEL)
-        self.faiss_indices = {}  # Store FAISS indices by doc_id
-        self.documents_cache = {}
+    def __init__(self, index_dir=FAISS_INDEX_DIR, index_type=INDEX_TYPE, index_storage=INDEX_STORAGE,
+                 backend=EMBEDDING_BACKEND, embedding_cache_path=EMBEDDING_CACHE_PATH):
+        self.model_name = EMBEDDING_MODEL
+        self.backend = backend
+        self.embedding_cache_path = embedding_cache_path
+        self.index_type = index_type
+        self.index_storage = index_storage
+        self.index_cache = IndexCache()  # FAISS indices and chunks by doc_id, bounded by INDEX_CACHE_MAX_BYTES
+        self._update_lock = threading.Lock()  # Serializes incremental section updates
+        self.reranker = CrossEncoderReranker() if CROSS_ENCODER_MODEL else None
         self.index_dimension = None
-        self.faiss_index_dir = "faiss_indices"
+        self._embedding_space = None
+        self.faiss_index_dir = index_dir
         
         # Create directory for FAISS indices
         if not os.path.exists(self.faiss_index_dir):
             os.makedirs(self.faiss_index_dir)
         
-        self.financial_keywords = [
-            'revenue', 'income', 'profit', 'loss', 'assets', 'liabilities', 'cash', 'debt',
-            'margin', 'growth', 'decline', 'financial', 'earnings', 'sales', 'costs'
-        ]
+        self.financial_keywords = FINANCIAL_KEYWORDS
         self.risk_keywords = [
             'risk', 'risks', 'uncertainty', 'challenges', 'threats', 'adverse', 'impact',
             'volatility', 'exposure', 'compliance', 'regulatory', 'competition'
         ]
     
+    @property
+    def model(self):
+        """Shared process-wide model, loaded by the first engine that encodes anything"""
+        return get_embedding_model(self.model_name, self.backend)
+    
+    @property
+    def embedding_space(self):
+        """Model plus backend, if that changes vectors"""
+        if self._embedding_space is None:
+            self._embedding_space = embedding_space(self.model_name, self.backend)
+        return self._embedding_space
+    
     def create_embeddings(self, doc_id):
         """Create FAISS index for document embeddings"""
         try:
@@ -42,55 +79,14 @@ class FAISSEnhancedSemanticSearchEngine:
             if self._load_faiss_index(doc_id):
                 return True
             
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT section_name, content FROM extracted_text WHERE doc_id = ?
-            ''', (doc_id,))
-            
-            sections = cursor.fetchall()
-            conn.close()
-            
-            if not sections:
+            chunks = self._document_chunks(doc_id)
+            if chunks is None:
                 return self._create_fallback_faiss_index(doc_id)
             
-            documents = []
-            section_names = []
-            
-            for section_name, content in sections:
-                if content and len(content) > 100:
-                    # Smart chunking with overlap
-                    chunks = self._smart_chunk_text(content, section_name, max_length=800, overlap=100)
-                    for i, chunk in enumerate(chunks):
-                        documents.append(chunk)
-                        section_names.append(f"{section_name}_{i}")
-            
+            documents, section_names = chunks
             if documents:
-                # Create embeddings
-                embeddings = self.model.encode(documents)
-                self.index_dimension = embeddings.shape[1]
-                
-                # Create FAISS index
-                faiss_index = faiss.IndexFlatIP(self.index_dimension)  # Inner Product for cosine similarity
-                
-                # Normalize embeddings for cosine similarity
-                faiss.normalize_L2(embeddings.astype('float32'))
-                
-                # Add embeddings to FAISS index
-                faiss_index.add(embeddings.astype('float32'))
-                
-                # Store in memory
-                self.faiss_indices[doc_id] = faiss_index
-                self.documents_cache[doc_id] = {
-                    'documents': documents,
-                    'section_names': section_names
-                }
-                
-                # Save to disk
-                self._save_faiss_index(doc_id, faiss_index, documents, section_names)
-                
-                return True
+                # Embeddings are created batch by batch, reusing cached vectors for chunks seen in earlier uploads
+                return self._index_document(doc_id, documents, section_names)
             
         except Exception as e:
             print(f"Error creating FAISS embeddings: {e}")
@@ -98,52 +94,342 @@ class FAISSEnhancedSemanticSearchEngine:
         
         return False
     
-    def _save_faiss_index(self, doc_id, faiss_index, documents, section_names):
-        """Save FAISS index and metadata to disk"""
+    def create_embeddings_bulk(self, doc_ids, processes=ENCODER_POOL_PROCESSES, pool=None):
+        """Create FAISS indices for many documents, encoding all their chunks as one stream on a pool of encoder
+        processes (a given pool, or one started for the call)"""
+        results = {}
+        if pool is None:
+            pool_context = EncoderPool(self.model_name, self.backend, processes=processes)
+        else:
+            pool_context = nullcontext(pool)  # A given pool is left running for the caller
+        
+        try:
+            with pool_context as pool:
+                # The workers report the vector space, so this process never loads the model
+                self._embedding_space = pool.embedding_space()
+                pending = self._chunks_to_embed(doc_ids, results)
+                
+                # Each document is indexed from the embedding cache as soon as the stream has encoded all its chunks,
+                # while the workers carry on with the next documents
+                for doc_id in cache_document_embeddings(((doc_id, chunks[0]) for doc_id, chunks in pending.items()),
+                                                        pool, self.embedding_cache_path):
+                    documents, section_names = pending[doc_id]
+                    try:
+                        results[doc_id] = self._index_document(doc_id, documents, section_names, save_corpus=False)
+                    except Exception as e:
+                        print(f"Error creating FAISS embeddings: {e}")
+                        results[doc_id] = self._create_fallback_faiss_index(doc_id)
+        except Exception as e:
+            print(f"Error encoding chunks in encoder pool: {e}")
+        
+        # Documents the pool did not get to are encoded in this process
+        for doc_id in doc_ids:
+            if doc_id not in results:
+                results[doc_id] = self.create_embeddings(doc_id)
+        
+        # Writing the corpus index costs O(corpus), so the whole batch is saved once
+        get_corpus_index(self.faiss_index_dir).save()
+        return results
+    
+    def _chunks_to_embed(self, doc_ids, results):
+        """{doc_id: (chunk texts, section names)} of documents without an index; results gets the rest"""
+        pending = {}
+        for doc_id in doc_ids:
+            try:
+                if self._read_persisted_index(doc_id) is not None:
+                    results[doc_id] = True
+                    continue
+                
+                chunks = self._document_chunks(doc_id)
+                if chunks is None:
+                    results[doc_id] = self._create_fallback_faiss_index(doc_id)
+                elif chunks[0]:
+                    pending[doc_id] = chunks
+                else:
+                    results[doc_id] = False
+            except Exception as e:
+                print(f"Error reading chunks for doc_id {doc_id}: {e}")
+                results[doc_id] = self._create_fallback_faiss_index(doc_id)
+        return pending
+    
+    def _document_chunks(self, doc_id):
+        """(chunk texts, chunk section names) of a document's extracted_text, or None if it has none"""
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT section_name, content FROM extracted_text WHERE doc_id = ? ORDER BY id
+        ''', (doc_id,))
+        
+        sections = cursor.fetchall()
+        conn.close()
+        
+        if not sections:
+            return None
+        
+        return self._chunk_rows(sections)
+    
+    def _chunk_rows(self, rows):
+        """(chunk texts, chunk section names) of (section_name, content) rows of extracted_text"""
+        documents = []
+        section_names = []
+        
+        for section_name, content in rows:
+            if content and len(content) > 100:
+                # Smart chunking with overlap
+                chunks = self._smart_chunk_text(content, section_name)
+                for i, chunk in enumerate(chunks):
+                    documents.append(chunk)
+                    section_names.append(f"{section_name}_{i}")
+        
+        return documents, section_names
+    
+    def _index_document(self, doc_id, documents, section_names, save_corpus=True):
+        """Build, save, cache and add to the corpus the FAISS index of a document's chunks, one batch at a time"""
+        n_chunks = len(documents)
+        
+        def embed(positions):
+            # A fresh float32 buffer per batch, encoding only chunks missing from the embedding cache
+            return encode_documents([documents[i] for i in positions], self.model_name,
+                                    cache_path=self.embedding_cache_path, backend=self.backend,
+                                    space=self.embedding_space)
+        
+        # The first batch gives the dimension, so a document whose chunks are all cached (e.g. by a bulk ingest's
+        # encoder pool) never loads the model in this process
+        first_batch = embed(np.arange(min(EMBED_STREAM_BATCH_SIZE, n_chunks)))
+        dimension = first_batch.shape[1]
+        self.index_dimension = dimension
+        
+        # Create an inner-product index sized for the chunk count; IVF/PQ and int8 quantizers train on a sample
+        faiss_index, index_type = create_index(dimension, n_chunks, self.index_type, storage=self.index_storage)
+        if not faiss_index.is_trained:
+            sample = np.arange(n_chunks)
+            if n_chunks > MAX_TRAINING_VECTORS:
+                sample = np.sort(np.random.default_rng(0).choice(n_chunks, MAX_TRAINING_VECTORS, replace=False))
+            training_vectors = embed(sample)
+            faiss.normalize_L2(training_vectors)
+            train_index(faiss_index, training_vectors)
+            del training_vectors
+        
+        # Exact vectors are only needed to re-rank quantized indices and to measure recall of approximate ones;
+        # they are spooled to disk rather than accumulated in memory
+        spool_path = None
+        spool = None
+        if index_type != 'flat' or self.index_storage != 'float32':
+            fd, spool_path = tempfile.mkstemp(prefix=f"spool_{doc_id}_", suffix=".npy", dir=self.faiss_index_dir)
+            os.close(fd)
+            spool = np.lib.format.open_memmap(spool_path, mode='w+', dtype='float32', shape=(n_chunks, dimension))
+        
+        corpus = get_corpus_index(self.faiss_index_dir)
+        corpus.remove_document(doc_id, save=False)
+        
         try:
-            index_path = os.path.join(self.faiss_index_dir, f"index_{doc_id}.faiss")
-            metadata_path = os.path.join(self.faiss_index_dir, f"metadata_{doc_id}.pkl")
+            # Encode, normalize and add one batch at a time, so peak memory follows the batch size
+            for start in range(0, n_chunks, EMBED_STREAM_BATCH_SIZE):
+                end = min(start + EMBED_STREAM_BATCH_SIZE, n_chunks)
+                batch = first_batch if start == 0 else embed(np.arange(start, end))
+                first_batch = None
+                
+                # Normalize embeddings for cosine similarity, in place on the buffer that is added
+                faiss.normalize_L2(batch)
+                faiss_index.add(batch)
+                if spool is not None:
+                    spool[start:end] = batch
+                
+                # Make the document searchable corpus-wide
+                corpus.add_chunks(doc_id, batch, documents[start:end], section_names[start:end], save=False,
+                                  positions=np.arange(start, end))
             
-            # Save FAISS index
-            faiss.write_index(faiss_index, index_path)
+            # Quantized indices keep the exact vectors on disk to re-rank their top candidates
+            vectors = spool if self.index_storage != 'float32' else None
             
-            # Save metadata
-            metadata = {
+            bm25 = BM25Segment.build(documents)
+            cached = {
                 'documents': documents,
                 'section_names': section_names,
-                'dimension': self.index_dimension
+                'vectors': vectors,
+                'recall': 1.0,
+                'bm25': BM25Index([bm25]),
+                'features': chunk_features(documents),
+                'embedding_space': self.embedding_space
             }
             
-            with open(metadata_path, 'wb') as f:
-                pickle.dump(metadata, f)
-                
+            # Measure what approximation and quantization cost in recall, as searched (incl. re-ranking)
+            if spool is not None:
+                cached['recall'] = measure_recall(
+                    spool, lambda queries, k: self._search_index(faiss_index, cached, queries, k)
+                )
+            
+            # Save to disk
+            self._save_faiss_index(doc_id, faiss_index, documents, section_names,
+                                   vectors=vectors, recall=cached['recall'], bm25=bm25, features=cached['features'])
+        except Exception:
+            # Leave no partial document in the corpus index
+            corpus.remove_document(doc_id, save=False)
+            raise
+        finally:
+            del spool
+            if spool_path is not None and os.path.exists(spool_path):
+                os.remove(spool_path)
+        
+        # Serve re-ranking from the memory-mapped saved copy
+        if vectors is not None:
+            cached['vectors'] = self._load_vectors(doc_id)
+        
+        # Store in memory
+        self.index_cache.put(doc_id, faiss_index, cached)
+        if save_corpus:
+            corpus.save()
+        
+        return True
+    
+    def _save_faiss_index(self, doc_id, faiss_index, documents, section_names, is_fallback=False,
+                          vectors=None, recall=1.0, bm25=None, features=None, manifest=None):
+        """Save FAISS index and metadata to disk"""
+        try:
+            doc_dir = document_index_dir(doc_id, self.faiss_index_dir)
+            os.makedirs(doc_dir, exist_ok=True)
+            
+            # Each save writes a new generation of files; replacing metadata.json switches readers over atomically
+            previous = read_document_metadata(doc_dir)
+            generation = previous.get('generation', 0) + 1 if previous else 1
+            
+            # The whole index becomes the generation's single segment
+            write_segment(doc_dir, generation, faiss_index, documents, section_names, vectors, bm25, features)
+            commit_generation(doc_dir, generation, [{'generation': generation, 'chunk_count': len(documents)}],
+                              manifest or self._manifest(), is_fallback=is_fallback, recall=recall)
+            
             print(f"FAISS index saved for doc_id {doc_id}")
+            return True
             
         except Exception as e:
             print(f"Error saving FAISS index: {e}")
+            return False
+    
+    def _read_persisted_index(self, doc_id):
+        """Map a document's FAISS index and chunk store from disk, or None if not persisted"""
+        doc_dir = document_index_dir(doc_id, self.faiss_index_dir)
+        metadata = read_document_metadata(doc_dir)
+        
+        if metadata is None and self._migrate_legacy_index(doc_id):
+            metadata = read_document_metadata(doc_dir)
+        if metadata is None:
+            return None
+        
+        try:
+            return self._open_generation(doc_id, doc_dir, metadata)
+        except FileNotFoundError:
+            # A concurrent save replaced this generation between reading metadata and opening its files
+            return self._open_generation(doc_id, doc_dir, read_document_metadata(doc_dir))
+    
+    def _open_generation(self, doc_id, doc_dir, metadata):
+        """Map the generation metadata points at, or delete it and return None if it is corrupt or stale"""
+        if metadata is None:
+            return None
+        
+        problem = corrupt_generation_files(doc_dir, metadata) if INDEX_VERIFY_CHECKSUMS else None
+        if problem:
+            problem = f"checksum mismatch in {', '.join(problem)}"
+        elif INDEX_AUTO_REBUILD:
+            problem = self._stale_manifest(metadata)
+        
+        if problem:
+            # Callers treat the document as never indexed and rebuild it from extracted_text
+            print(f"Discarding FAISS index for doc_id {doc_id}: {problem}")
+            self.index_cache.pop(doc_id)
+            remove_document_index_files(doc_id, self.faiss_index_dir)
+            return None
+        
+        return faiss_index_generation(doc_dir, metadata)
+    
+    def _manifest(self):
+        """What produced this engine's indices: embedding model, vector space and dimension, and chunking"""
+        return {
+            'embedding_model': self.model_name,
+            'embedding_space': self.embedding_space,
+            'dimension': self.index_dimension or self.model.get_sentence_embedding_dimension(),
+            'chunker': {'max_length': CHUNK_MAX_LENGTH, 'overlap': CHUNK_OVERLAP}
+        }
+    
+    def _stale_manifest(self, metadata):
+        """Why a persisted index does not match the configured model and chunker, or None if it does"""
+        # Indices saved before the manifest was recorded were built with the original model and chunker
+        manifest = {key: metadata.get(key, value) for key, value in LEGACY_MANIFEST.items()}
+        expected = self._manifest()
+        
+        if manifest['embedding_model'] != expected['embedding_model']:
+            return f"built with {manifest['embedding_model']}, configured model is {expected['embedding_model']}"
+        if manifest['embedding_space'] != expected['embedding_space']:
+            return f"holds {manifest['embedding_space']} embeddings, queries use {expected['embedding_space']}"
+        dimension = self.model.get_sentence_embedding_dimension()
+        if metadata.get('dimension') and metadata['dimension'] != dimension:
+            return f"{metadata['dimension']}-dimensional vectors, model produces {dimension}"
+        if not metadata.get('is_fallback') and manifest['chunker'] != expected['chunker']:
+            return f"chunked with {manifest['chunker']}, configured chunker is {expected['chunker']}"
+        return None
+    
+    def _migrate_legacy_index(self, doc_id):
+        """Convert index_<id>.faiss + metadata_<id>.pkl from older versions to the per-document layout"""
+        index_path, metadata_path, vectors_path = legacy_index_paths(doc_id, self.faiss_index_dir)
+        
+        if not (os.path.exists(index_path) and os.path.exists(metadata_path)):
+            return False
+        
+        with open(metadata_path, 'rb') as f:
+            metadata = pickle.load(f)
+        
+        vectors = np.load(vectors_path) if os.path.exists(vectors_path) else None
+        self.index_dimension = metadata['dimension']
+        self._save_faiss_index(doc_id, faiss.read_index(index_path), metadata['documents'], metadata['section_names'],
+                               is_fallback=metadata.get('is_fallback', False), vectors=vectors,
+                               recall=metadata.get('recall_at_10'),
+                               manifest=dict(LEGACY_MANIFEST, dimension=metadata['dimension']))
+        
+        if read_document_metadata(document_index_dir(doc_id, self.faiss_index_dir)) is None:
+            return False
+        
+        for path in (index_path, metadata_path, vectors_path):
+            if os.path.exists(path):
+                os.remove(path)
+        
+        print(f"Migrated FAISS index for doc_id {doc_id}")
+        return True
+    
+    def _load_vectors(self, doc_id):
+        """Memory-mapped exact vectors saved alongside a quantized index, or None"""
+        doc_dir = document_index_dir(doc_id, self.faiss_index_dir)
+        metadata = read_document_metadata(doc_dir)
+        if metadata is None:
+            return None
+        return _load_array(document_file(doc_dir, VECTORS_FILE, metadata.get('generation', 0)))
     
     def _load_faiss_index(self, doc_id):
         """Load FAISS index and metadata from disk"""
         try:
-            index_path = os.path.join(self.faiss_index_dir, f"index_{doc_id}.faiss")
-            metadata_path = os.path.join(self.faiss_index_dir, f"metadata_{doc_id}.pkl")
-            
-            if not (os.path.exists(index_path) and os.path.exists(metadata_path)):
+            persisted = self._read_persisted_index(doc_id)
+            if persisted is None:
                 return False
             
-            # Load FAISS index
-            faiss_index = faiss.read_index(index_path)
+            faiss_index, metadata = persisted
             
-            # Load metadata
-            with open(metadata_path, 'rb') as f:
-                metadata = pickle.load(f)
+            # Only reached for stale indices when INDEX_AUTO_REBUILD is off
+            problem = self._stale_manifest(metadata)
+            if problem:
+                print(f"FAISS index for doc_id {doc_id} is stale ({problem}); reindex_document() to rebuild it")
             
             # Store in memory
-            self.faiss_indices[doc_id] = faiss_index
-            self.documents_cache[doc_id] = {
+            self.index_cache.put(doc_id, faiss_index, {
                 'documents': metadata['documents'],
-                'section_names': metadata['section_names']
-            }
+                'section_names': metadata['section_names'],
+                'vectors': metadata['vectors'],
+                'recall': metadata.get('recall_at_10'),
+                'bm25': metadata['bm25'],
+                'features': metadata['features'],
+                'tombstones': metadata['tombstones'],
+                'selector': _live_selector(metadata['tombstones']),
+                'embedding_space': metadata.get('embedding_space', LEGACY_MANIFEST['embedding_space']),
+                'reindex_required': problem is not None
+            })
             self.index_dimension = metadata['dimension']
             
             print(f"FAISS index loaded for doc_id {doc_id}")
@@ -153,7 +439,7 @@ class FAISSEnhancedSemanticSearchEngine:
             print(f"Error loading FAISS index: {e}")
             return False
     
-    def _smart_chunk_text(self, text, section_name, max_length=800, overlap=100):
+    def _smart_chunk_text(self, text, section_name, max_length=CHUNK_MAX_LENGTH, overlap=CHUNK_OVERLAP):
         """Smart chunking that preserves sentence boundaries and adds context"""
         # Clean text first
         text = re.sub(r'\s+', ' ', text).strip()
@@ -211,72 +497,170 @@ class FAISSEnhancedSemanticSearchEngine:
                            'financial_performance', 'cash_position', 'management_strategy']
         
         # Create embeddings for fallback
-        embeddings = self.model.encode(fallback_documents)
+        embeddings = encode_documents(fallback_documents, self.model_name, cache_path=self.embedding_cache_path,
+                                      backend=self.backend)
         self.index_dimension = embeddings.shape[1]
         
         # Create FAISS index
-        faiss_index = faiss.IndexFlatIP(self.index_dimension)
-        faiss.normalize_L2(embeddings.astype('float32'))
-        faiss_index.add(embeddings.astype('float32'))
+        faiss.normalize_L2(embeddings)
+        faiss_index = build_index(embeddings, 'flat')
+        bm25 = BM25Segment.build(fallback_documents)
+        features = chunk_features(fallback_documents)
         
         # Store in memory
-        self.faiss_indices[doc_id] = faiss_index
-        self.documents_cache[doc_id] = {
+        self.index_cache.put(doc_id, faiss_index, {
             'documents': fallback_documents,
-            'section_names': fallback_sections
-        }
+            'section_names': fallback_sections,
+            'vectors': None,
+            'recall': 1.0,
+            'bm25': BM25Index([bm25]),
+            'features': features,
+            'embedding_space': self.embedding_space
+        })
         
-        # Save to disk
-        self._save_faiss_index(doc_id, faiss_index, fallback_documents, fallback_sections)
+        # Save to disk (placeholder content is kept out of the corpus index)
+        self._save_faiss_index(doc_id, faiss_index, fallback_documents, fallback_sections, is_fallback=True,
+                               bm25=bm25, features=features)
         
         return True
     
-    def enhanced_search(self, doc_id, query, top_k=5):
+    def enhanced_search(self, doc_id, query, top_k=5, nprobe=None, ef_search=None):
         """Enhanced FAISS-powered search with query expansion and better ranking"""
-        if doc_id not in self.faiss_indices:
+        # Each stage's latency goes into the process-wide histograms of get_search_metrics()
+        timer = StageTimer('search')
+        try:
+            return self._timed_search(timer, doc_id, query, top_k, nprobe, ef_search)
+        finally:
+            timer.finish()
+    
+    def _timed_search(self, timer, doc_id, query, top_k, nprobe, ef_search):
+        loaded = self.index_cache.get(doc_id)
+        if loaded is None:
             self.create_embeddings(doc_id)
+            loaded = self.index_cache.peek(doc_id)
+        timer.lap('load_index')
         
-        if doc_id not in self.faiss_indices:
+        if loaded is None:
+            timer.count('fallback')
             return self._fallback_search_results(query)
         
         try:
             # Generate multiple query variations
             query_variations = self._generate_query_variations(query)
-            all_results = []
+            timer.lap('variations')
             
-            faiss_index = self.faiss_indices[doc_id]
-            documents = self.documents_cache[doc_id]['documents']
-            section_names = self.documents_cache[doc_id]['section_names']
+            faiss_index, cached = loaded
+            if faiss_index.ntotal == 0:
+                # Every section was removed
+                timer.count('fallback')
+                return self._fallback_search_results(query)
             
-            for q in query_variations:
-                # Get query embedding
-                query_embedding = self.model.encode([q])
-                faiss.normalize_L2(query_embedding.astype('float32'))
-                
-                # Search with FAISS
-                similarities, indices = faiss_index.search(query_embedding.astype('float32'), min(top_k * 2, len(documents)))
-                
-                for idx, similarity in zip(indices[0], similarities[0]):
-                    if similarity > 0.1:  # Minimum similarity threshold
-                        all_results.append({
-                            'content': documents[idx],
-                            'section': section_names[idx],
-                            'similarity': float(similarity),
-                            'query_variant': q
-                        })
-            
-            # Remove duplicates and rank by relevance
-            unique_results = self._remove_similar_results(all_results)
+            documents = cached['documents']
+            
+            # Encode all uncached variations in one batch and search them with a single FAISS call
+            query_embeddings = encode_queries(query_variations, self.model_name, self.backend)
+            timer.lap('encode')
+            similarities, indices = self._search_index(faiss_index, cached, query_embeddings,
+                                                       min(top_k * 2, len(documents)), nprobe, ef_search)
+            timer.lap('faiss_search')
+            
+            # Fuse with BM25 hits, which catch exact tickers, line items and numbers the embeddings miss
+            all_results = self._fuse_results(similarities, indices, query_variations, faiss_index, cached, query,
+                                             top_k * 2)
+            timer.lap('fusion')
+            
+            # Remove near-duplicates (overlapping chunks, repeated boilerplate) by embedding similarity
+            chunk_ids = [result['chunk_id'] for result in all_results]
+            vectors = vectors_for_ids(faiss_index, chunk_ids, cached.get('vectors'))
+            unique_results = self._remove_similar_results(all_results, vectors)
+            timer.lap('dedup')
             
             # Re-rank based on query relevance and content quality
-            ranked_results = self._rerank_results(unique_results, query)
+            features = cached['features'][[result['chunk_id'] for result in unique_results]]
+            ranked_results = self._rerank_results(unique_results, query, features)
+            timer.lap('rerank')
             
+            # Optionally re-score the best candidates with a cross-encoder, if the latency budget allows
+            if self.reranker is not None:
+                ranked_results = self.reranker.rerank(query, ranked_results, timer.started_at)
+                timer.lap('cross_encoder')
+            
+            if not ranked_results:
+                timer.count('no_results')
             return ranked_results[:top_k]
             
         except Exception as e:
             print(f"FAISS search error: {e}")
+            timer.count('error')
             return self._fallback_search_results(query)
     
+    def _search_index(self, faiss_index, cached, query_embeddings, k, nprobe=None, ef_search=None):
+        """Search a document's index, re-scoring quantized hits with exact vectors when they are available"""
+        vectors = cached.get('vectors')
+        
+        # nprobe / ef_search override the configured recall-vs-speed knobs of IVF and HNSW indices;
+        # the selector skips tombstoned chunks
+        params = search_parameters(faiss_index, nprobe, ef_search, cached.get('selector'))
+        
+        if vectors is not None and RERANK_FACTOR > 0:
+            return rerank_search(faiss_index, query_embeddings, k, vectors, RERANK_FACTOR, params)
+        return faiss_index.search(query_embeddings, k, params=params)
+    
+    def _best_hits(self, similarities, indices, min_similarity=0.1):
+        """Collapse per-variation FAISS hits to each id's best score, as (similarities, ids, variation ids)"""
+        flat_similarities = similarities.ravel()
+        flat_indices = indices.ravel()
+        variation_ids = np.repeat(np.arange(similarities.shape[0]), similarities.shape[1])
+        
+        # FAISS pads missing neighbours with -1; also apply the minimum similarity threshold
+        keep = (flat_indices >= 0) & (flat_similarities > min_similarity)
+        flat_similarities = flat_similarities[keep]
+        flat_indices = flat_indices[keep]
+        variation_ids = variation_ids[keep]
+        
+        # After a descending sort, the first occurrence of each chunk is its best hit
+        order = np.argsort(-flat_similarities, kind='stable')
+        _, first_hits = np.unique(flat_indices[order], return_index=True)
+        best = order[np.sort(first_hits)]
+        
+        return flat_similarities[best], flat_indices[best], variation_ids[best]
+    
+    def _fuse_results(self, similarities, indices, query_variations, faiss_index, cached, query, k):
+        """Merge per-variation FAISS hits with the top-k BM25 hits by reciprocal rank fusion, best first"""
+        best_similarities, best_indices, variation_ids = self._best_hits(similarities, indices)
+        dense = {int(idx): (float(similarity), query_variations[variation_id])
+                 for similarity, idx, variation_id in zip(best_similarities, best_indices, variation_ids)}
+        
+        # Lexical (BM25) hits for the original query catch exact tickers, line items and numbers
+        bm25 = cached['bm25']
+        bm25_scores, bm25_ids = bm25.search(query, k)
+        lexical = dict(zip(bm25_ids.tolist(), bm25_scores.tolist()))
+        
+        # Each ranking adds 1 / (RRF_K + rank) per chunk; only the best 2k are turned into results
+        fusion = Counter()
+        for rank, idx in enumerate(sorted(dense, key=lambda idx: dense[idx][0], reverse=True)):
+            fusion[idx] += 1.0 / (RRF_K + rank + 1)
+        for rank, idx in enumerate(lexical):
+            fusion[idx] += 1.0 / (RRF_K + rank + 1)
+        chunk_ids = [idx for idx, _ in fusion.most_common(2 * k)]
+        
+        # Chunks only BM25 found still get their true cosine similarity, which confidence scoring relies on
+        lexical_only = [idx for idx in chunk_ids if idx not in dense]
+        if lexical_only:
+            query_embedding = encode_queries([query], self.model_name, self.backend)[0]
+            similarities = score_ids(faiss_index, query_embedding, lexical_only, cached.get('vectors'))
+            dense.update((idx, (float(similarity), query)) for idx, similarity in zip(lexical_only, similarities))
+        
+        return [{
+            'content': cached['documents'][idx],
+            'section': cached['section_names'][idx],
+            'similarity': dense[idx][0],
+            'query_variant': dense[idx][1],
+            'chunk_id': idx,
+            'bm25_score': lexical.get(idx, 0.0),
+            'fusion_score': fusion[idx]
+        } for idx in chunk_ids]
+    
     def _generate_query_variations(self, query):
         """Generate related queries for better search coverage"""
         variations = [query]
@@ -301,14 +685,38 @@ class FAISSEnhancedSemanticSearchEngine:
         
         return list(set(variations))  # Remove duplicates
     
-    def _remove_similar_results(self, results):
-        """Remove similar/duplicate results"""
+    def _remove_similar_results(self, results, vectors=None):
+        """Remove similar/duplicate results, keeping the more relevant of each near-duplicate pair"""
+        order = sorted(range(len(results)), key=lambda i: results[i].get('fusion_score', results[i]['similarity']),
+                       reverse=True)
+        results = [results[i] for i in order]
+        
+        if vectors is None:
+            return self._remove_duplicate_text(results)
+        
+        # All pairwise cosine similarities in one product; only pairs within the same document count
+        vectors = np.asarray(vectors, dtype='float32')[order]
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        doc_ids = np.array([result.get('doc_id') for result in results], dtype=object)
+        duplicates = np.triu((vectors @ vectors.T >= DEDUP_SIMILARITY_THRESHOLD)
+                             & (doc_ids[:, None] == doc_ids[None, :]), k=1)
+        
+        # Walking from the most relevant result, each kept result suppresses its less relevant near-duplicates
+        keep = np.ones(len(results), dtype=bool)
+        for i in range(len(results)):
+            if keep[i]:
+                keep[duplicates[i]] = False
+        
+        return [result for result, kept in zip(results, keep) if kept]
+    
+    def _remove_duplicate_text(self, results):
         unique_results = []
         seen_content = set()
         
-        for result in sorted(results, key=lambda x: x['similarity'], reverse=True):
-            # Create a simplified version for comparison
-            content_key = re.sub(r'[^\w\s]', '', result['content'].lower())[:100]
+        for result in results:
+            # Compare text after the shared "[Section Name]" prefix (per document for corpus-wide results)
+            content = re.sub(r'^\[[^\]]*\]\s*', '', result['content'])
+            content_key = (result.get('doc_id'), re.sub(r'[^\w\s]', '', content.lower())[:100])
             
             if content_key not in seen_content:
                 seen_content.add(content_key)
@@ -316,29 +724,313 @@ class FAISSEnhancedSemanticSearchEngine:
         
         return unique_results
     
-    def _rerank_results(self, results, original_query):
+    def _rerank_results(self, results, original_query, features=None):
         """Re-rank results based on query relevance and content quality"""
-        query_lower = original_query.lower()
+        if not results:
+            return results
         
-        for result in results:
-            content_lower = result['content'].lower()
+        # Feature rows precomputed at index time, aligned with results (computed here only if missing)
+        if features is None:
+            features = chunk_features([result['content'] for result in results], self.financial_keywords)
+        
+        # Boost for exact query word matches, financial data and longer, more detailed content
+        relevance_boost = (0.1 * matched_terms(features, original_query)
+                           + 0.05 * features['has_keyword']
+                           + 0.03 * (features['length'] > 500))
+        
+        # Calculate final score
+        final_scores = np.array([result['similarity'] for result in results]) + relevance_boost
+        
+        # Fused results rank by the fusion score, scaled by the same boosts
+        if all('fusion_score' in result for result in results):
+            ranking = np.array([result['fusion_score'] for result in results]) * (1 + relevance_boost)
+        else:
+            ranking = final_scores
+        
+        ranked_results = []
+        for i in np.argsort(-ranking, kind='stable'):
+            results[i]['relevance_boost'] = float(relevance_boost[i])
+            results[i]['final_score'] = float(final_scores[i])
+            ranked_results.append(results[i])
+        return ranked_results
+    
+    def update_section(self, doc_id, section_name, content=None):
+        """Re-index one section: tombstone its old chunks and embed only the new content's chunks
+        
+        content defaults to the section's rows in extracted_text; callers store new text there first.
+        """
+        rows = [(section_name, content)] if content is not None else self._section_rows(doc_id, section_name)
+        
+        # Chunked exactly as a full build of the document chunks them
+        documents, section_names = self._chunk_rows(rows)
+        return self._apply_chunk_changes(doc_id, section_name, documents, section_names)
+    
+    def remove_section(self, doc_id, section_name):
+        """Tombstone every chunk of a section"""
+        return self._apply_chunk_changes(doc_id, section_name, [], [])
+    
+    def _section_rows(self, doc_id, section_name):
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT section_name, content FROM extracted_text WHERE doc_id = ? AND section_name = ? ORDER BY id
+        ''', (doc_id, section_name))
+        
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+    
+    def _apply_chunk_changes(self, doc_id, section_name, new_documents, new_section_names):
+        """Tombstone a section's live chunks and append new ones as a segment; unchanged chunks are neither
+        rewritten nor re-hashed"""
+        with self._update_lock:
+            persisted = self._read_persisted_index(doc_id)
+            # New chunks cannot be appended to an index of another model, vector space or chunking either
+            if persisted is None or persisted[1].get('is_fallback') or self._stale_manifest(persisted[1]):
+                # Nothing to update in place: build the whole index from extracted_text
+                return self.reindex_document(doc_id)
+            
+            faiss_index, metadata = persisted
+            tombstones = set(metadata['tombstones'].tolist())
+            removed = [position for position, name in enumerate(metadata['section_names'])
+                       if position not in tombstones and name.rsplit('_', 1)[0] == section_name]
+            if not removed and not new_documents:
+                return {'added_chunks': 0, 'removed_chunks': 0, 'compacted': False}
+            tombstones.update(removed)
+            
+            first_new_position = faiss_index.ntotal
+            embeddings = None
+            if new_documents:
+                # Only the changed section is embedded; unchanged chunks keep their vectors
+                embeddings = encode_documents(new_documents, self.model_name, cache_path=self.embedding_cache_path,
+                                              backend=self.backend)
+                faiss.normalize_L2(embeddings)
+            
+            self.index_dimension = faiss_index.d
+            tombstones = np.array(sorted(tombstones), dtype='int64')
+            compacted = len(tombstones) > TOMBSTONE_COMPACT_RATIO * (first_new_position + len(new_documents))
+            
+            if compacted:
+                saved = self._compact_index(doc_id, faiss_index, metadata, tombstones, new_documents,
+                                            new_section_names, embeddings)
+            else:
+                saved = self._append_segment(doc_id, faiss_index, metadata, tombstones, new_documents,
+                                             new_section_names, embeddings)
+            
+            if not saved:
+                return False
+            
+            # Mirror the change in the corpus index; compaction renumbers chunks, so re-add the whole document
+            corpus = get_corpus_index(self.faiss_index_dir)
+            if compacted or doc_id not in corpus.document_ids():
+                persisted = self._persisted_corpus_document(doc_id)
+                if persisted is not None:
+                    positions, embeddings, documents, section_names = persisted
+                    corpus.add_document(doc_id, embeddings, documents, section_names, positions=positions)
+                else:
+                    corpus.remove_document(doc_id)
+            else:
+                corpus.remove_chunks(doc_id, removed, save=False)
+                if new_documents:
+                    positions = np.arange(first_new_position, first_new_position + len(new_documents))
+                    corpus.add_chunks(doc_id, embeddings, new_documents, new_section_names, save=False,
+                                      positions=positions)
+                corpus.save()
+            
+            # Searches switch to the new generation, mapped like any other load
+            self.index_cache.pop(doc_id)
+            self._load_faiss_index(doc_id)
+            
+            return {'added_chunks': len(new_documents), 'removed_chunks': len(removed), 'compacted': bool(compacted)}
+    
+    def _append_segment(self, doc_id, faiss_index, metadata, tombstones, documents, section_names, embeddings):
+        """Save a generation with new tombstones and the new chunks as a segment after the existing ones"""
+        try:
+            doc_dir = document_index_dir(doc_id, self.faiss_index_dir)
+            generation = metadata.get('generation', 0) + 1
+            segments = metadata['segments']
+            
+            if documents:
+                # Trailing segments no larger than the new one are merged into it, like the carries of a binary
+                # counter: a document keeps O(log n) segments and each chunk is rewritten O(log n) times
+                merged = len(segments)
+                chunk_count = len(documents)
+                while merged > 0 and chunk_count >= segments[merged - 1]['chunk_count']:
+                    merged -= 1
+                    chunk_count += segments[merged]['chunk_count']
+                
+                start = faiss_index.ntotal + len(documents) - chunk_count
+                positions = np.arange(start, faiss_index.ntotal)
+                vectors = np.vstack([vectors_for_ids(faiss_index, positions, metadata['vectors']), embeddings])
+                texts = [metadata['documents'][i] for i in positions] + documents
+                names = [metadata['section_names'][i] for i in positions] + section_names
+                features = np.concatenate([metadata['features'][positions], chunk_features(documents)])
+                
+                # Chunk positions never change: the first segment is a plain index, later ones keep positions as
+                # ids; the document's storage is kept, so either every segment has exact vectors or none has
+                segment_index = build_index(vectors, self.index_type, storage=storage_of(faiss_index),
+                                            ids=np.arange(start, start + chunk_count) if start else None)
+                write_segment(doc_dir, generation, segment_index, texts, names,
+                              vectors if storage_of(segment_index) != 'float32' else None, features=features)
+                segments = segments[:merged] + [{'generation': generation, 'chunk_count': chunk_count}]
+            
+            commit_generation(doc_dir, generation, segments, self._manifest(), tombstones=tombstones,
+                              recall=metadata.get('recall_at_10'), previous=metadata)
+            
+            print(f"FAISS index saved for doc_id {doc_id}")
+            return True
+            
+        except Exception as e:
+            print(f"Error saving FAISS index: {e}")
+            return False
+    
+    def _compact_index(self, doc_id, faiss_index, metadata, tombstones, documents, section_names, embeddings):
+        """Too many dead chunks: rebuild the document as one segment of its live chunks (no re-embedding)"""
+        live = np.setdiff1d(np.arange(faiss_index.ntotal), tombstones)
+        live_embeddings = vectors_for_ids(faiss_index, live, metadata['vectors'])
+        if embeddings is not None:
+            live_embeddings = np.vstack([live_embeddings, embeddings])
+        documents = [metadata['documents'][i] for i in live] + documents
+        section_names = [metadata['section_names'][i] for i in live] + section_names
+        
+        if documents:
+            faiss_index = build_index(live_embeddings, self.index_type, storage=self.index_storage)
+        else:
+            # Every section was removed; an empty exact index needs no training
+            faiss_index = build_index(live_embeddings, 'flat')
+        vectors = live_embeddings if storage_of(faiss_index) != 'float32' else None
+        return self._save_faiss_index(doc_id, faiss_index, documents, section_names, vectors=vectors,
+                                      recall=metadata.get('recall_at_10'))
+    
+    def reindex_document(self, doc_id):
+        """Drop a document's index files and re-embed it from extracted_text with the current encoder"""
+        self.evict_document(doc_id)
+        remove_document_index_files(doc_id, self.faiss_index_dir)
+        return self.create_embeddings(doc_id)
+    
+    def sync_corpus_index(self):
+        """Bring the corpus index in line with the per-document indices on disk"""
+        corpus = get_corpus_index(self.faiss_index_dir)
+        on_disk = _indexed_document_ids(self.faiss_index_dir)
+        in_corpus = corpus.document_ids()
+        
+        for doc_id in in_corpus - on_disk:
+            corpus.remove_document(doc_id, save=False)
+        
+        for doc_id in sorted(on_disk - in_corpus):
+            persisted = self._persisted_corpus_document(doc_id)
+            if persisted is not None:
+                positions, embeddings, documents, section_names = persisted
+                corpus.add_document(doc_id, embeddings, documents, section_names, save=False, positions=positions)
+        
+        # Switch index type once the corpus has grown (or shrunk) past a selection threshold, or storage changed
+        if corpus.index is not None and (
+            select_index_type(corpus.index.ntotal, CORPUS_INDEX_TYPE) != corpus.index_type
+            or storage_of(corpus.index) != CORPUS_INDEX_STORAGE
+        ):
+            self.rebuild_corpus_index()
+            return
+        
+        corpus.save()
+        corpus.synced = True
+    
+    def _persisted_corpus_document(self, doc_id):
+        """(positions, embeddings, documents, section_names) of a document's live chunks, or None for fallbacks"""
+        persisted = self._read_persisted_index(doc_id)
+        if persisted is None:
+            return None
+        
+        faiss_index, metadata = persisted
+        if metadata.get('is_fallback') or faiss_index.ntotal == 0:
+            return None
+        
+        # Prefer the exact copy kept for quantized indices over lossy reconstruction
+        positions = np.setdiff1d(np.arange(faiss_index.ntotal), metadata['tombstones'])
+        embeddings = np.ascontiguousarray(vectors_for_ids(faiss_index, positions, metadata['vectors']))
+        
+        # Older versions did not normalize on disk
+        faiss.normalize_L2(embeddings)
+        
+        documents = [metadata['documents'][i] for i in positions]
+        section_names = [metadata['section_names'][i] for i in positions]
+        return positions, embeddings, documents, section_names
+    
+    def _persisted_corpus_documents(self):
+        """(doc_id, positions, embeddings, documents, section_names) of every non-fallback document on disk"""
+        for doc_id in sorted(_indexed_document_ids(self.faiss_index_dir)):
+            persisted = self._persisted_corpus_document(doc_id)
+            if persisted is not None:
+                yield (doc_id,) + persisted
+    
+    def rebuild_corpus_index(self, index_type=CORPUS_INDEX_TYPE):
+        """Rebuild the corpus index from the per-document indices, choosing its type from the corpus size"""
+        corpus = get_corpus_index(self.faiss_index_dir)
+        
+        # First pass: count vectors and gather a training sample spread across documents
+        total_vectors = 0
+        training_vectors = None
+        for _, _, embeddings, _, _ in self._persisted_corpus_documents():
+            total_vectors += len(embeddings)
+            training_vectors = embeddings if training_vectors is None else np.vstack([training_vectors, embeddings])
+            if len(training_vectors) > 2 * MAX_TRAINING_VECTORS:
+                training_vectors = training_vectors[::2]
+        
+        if training_vectors is None:
+            # Nothing to index, nor a dimension to create an index with; the first document added starts a new one
+            corpus.clear()
+        else:
+            corpus.reset(training_vectors.shape[1], total_vectors, index_type, training_vectors, CORPUS_INDEX_STORAGE)
             
-            # Boost score for exact matches
-            exact_matches = sum(1 for word in query_lower.split() if word in content_lower)
-            result['relevance_boost'] = exact_matches * 0.1
+            # Second pass: add the documents one at a time to bound memory
+            for doc_id, positions, embeddings, documents, section_names in self._persisted_corpus_documents():
+                corpus.add_document(doc_id, embeddings, documents, section_names, save=False, positions=positions)
+        
+        corpus.save()
+        corpus.synced = True
+    
+    def corpus_search(self, query, top_k=10, doc_ids=None, nprobe=None, ef_search=None):
+        """Search every indexed document, or only doc_ids, with a single corpus-wide FAISS call"""
+        try:
+            corpus = get_corpus_index(self.faiss_index_dir)
+            if not corpus.synced:
+                self.sync_corpus_index()
+            
+            query_variations = self._generate_query_variations(query)
+            query_embeddings = encode_queries(query_variations, self.model_name, self.backend)
+            similarities, chunk_ids = corpus.search(query_embeddings, top_k * 2, doc_ids, nprobe, ef_search)
+            
+            best_similarities, best_ids, variation_ids = self._best_hits(similarities, chunk_ids)
+            chunks = corpus.get_chunks(best_ids)
             
-            # Boost for financial data
-            if any(keyword in content_lower for keyword in self.financial_keywords):
-                result['relevance_boost'] += 0.05
+            results = []
+            for similarity, chunk_id, variation_id in zip(best_similarities, best_ids, variation_ids):
+                chunk = chunks.get(int(chunk_id))
+                if chunk is None:
+                    continue
+                
+                doc_info = get_document_info(chunk['doc_id'])
+                results.append({
+                    'doc_id': chunk['doc_id'],
+                    'company_name': doc_info[2] if doc_info else None,
+                    'content': chunk['content'],
+                    'section': chunk['section'],
+                    'similarity': float(similarity),
+                    'query_variant': query_variations[variation_id],
+                    'chunk_id': int(chunk_id)
+                })
             
-            # Boost for longer, more detailed content
-            if len(result['content']) > 500:
-                result['relevance_boost'] += 0.03
+            vectors = corpus.get_vectors([result['chunk_id'] for result in results]) if results else None
+            unique_results = self._remove_similar_results(results, vectors)
+            features = np.array([chunks[result['chunk_id']]['features'] for result in unique_results],
+                                dtype=FEATURE_DTYPE)
+            ranked_results = self._rerank_results(unique_results, query, features)
             
-            # Calculate final score
-            result['final_score'] = result['similarity'] + result['relevance_boost']
+            return ranked_results[:top_k]
         
-        return sorted(results, key=lambda x: x['final_score'], reverse=True)
+        except Exception as e:
+            print(f"Corpus search error: {e}")
+            return []
     
     def search(self, doc_id, query, top_k=5):
         """Wrapper for backward compatibility"""
@@ -381,18 +1073,41 @@ class FAISSEnhancedSemanticSearchEngine:
     
     def get_index_stats(self, doc_id):
         """Get statistics about the FAISS index"""
-        if doc_id in self.faiss_indices:
-            faiss_index = self.faiss_indices[doc_id]
-            documents = self.documents_cache[doc_id]['documents']
+        loaded = self.index_cache.peek(doc_id)
+        if loaded is not None:
+            faiss_index, cached = loaded
+            index_bytes = index_size_bytes(faiss_index)
+            float32_bytes = faiss_index.ntotal * self.index_dimension * 4
             
             return {
                 'total_vectors': faiss_index.ntotal,
                 'dimension': self.index_dimension,
-                'total_documents': len(documents),
-                'index_type': 'FAISS IndexFlatIP',
-                'storage_size': f"{faiss_index.ntotal * self.index_dimension * 4 / (1024**2):.2f} MB"
+                'total_documents': len(cached['documents']),
+                'index_type': f"FAISS {type(faiss_index).__name__}",
+                'vector_storage': storage_of(faiss_index),
+                'storage_size': f"{index_bytes / (1024**2):.2f} MB",
+                'compression_ratio': round(float32_bytes / index_bytes, 1) if index_bytes else None,
+                'recall_at_10': cached.get('recall'),
+                'embedding_space': cached.get('embedding_space'),
+                'reindex_required': cached.get('reindex_required', False),
+                'tombstoned_chunks': len(cached.get('tombstones', ())),
+                'float32_rerank': cached.get('vectors') is not None and RERANK_FACTOR > 0,
+                'cache': self.index_cache.stats(),
+                'cross_encoder': self.reranker.stats() if self.reranker is not None else None
             }
         return None
+    
+    def pin_document(self, doc_id):
+        """Keep a hot document loaded regardless of the memory budget"""
+        self.index_cache.pin(doc_id)
+    
+    def unpin_document(self, doc_id):
+        self.index_cache.unpin(doc_id)
+    
+    def evict_document(self, doc_id):
+        """Drop a document's index and chunks from memory"""
+        self.index_cache.pop(doc_id)
+        self.index_cache.unpin(doc_id)
 
 class EnhancedQuestionAnsweringEngine:
     def __init__(self, search_engine):
@@ -418,11 +1133,14 @@ ANSWER:"""
     
     def enhanced_answer_question(self, doc_id, question):
         """Enhanced Q&A with FAISS-powered multi-stage processing"""
+        timer = StageTimer('qa')
         try:
             # Stage 1: Enhanced FAISS search with multiple strategies
             search_results = self.search_engine.enhanced_search(doc_id, question, top_k=6)
+            timer.lap('retrieval')
             
             if not search_results:
+                timer.count('fallback')
                 return self._fallback_answer(question)
             
             # Stage 2: Smart context selection and formatting
@@ -433,9 +1151,10 @@ ANSWER:"""
                 context=formatted_context,
                 question=question
             )
+            timer.lap('prompt_build')
             
             # Stage 4: Generate comprehensive answer
-            response = client.chat.completions.create(
+            response = get_openai_client().chat.completions.create(
                 model=LLM_MODEL,
                 messages=[
                     {"role": "system", "content": "You are a senior financial analyst and 10-K document expert. Provide detailed, accurate financial analysis based on the provided context."},
@@ -444,33 +1163,37 @@ ANSWER:"""
                 temperature=0.2,  # Lower temperature for more consistent answers
                 max_tokens=800
             )
+            timer.lap('llm')
             
             answer = response.choices[0].message.content
             
             # Stage 5: Enhanced response formatting
             formatted_answer = self._format_answer(answer)
             
-            return {
+            result = {
                 'answer': formatted_answer,
                 'sources': search_results,
                 'confidence': self._calculate_confidence(search_results),
                 'context_quality': self._assess_context_quality(search_results),
                 'search_method': 'FAISS Enhanced'
             }
+            timer.lap('format')
+            return result
             
         except Exception as e:
             print(f"Enhanced QA error: {e}")
+            timer.count('error')
             return self._fallback_answer(question)
+        finally:
+            timer.finish()
     
     def _format_context_for_qa(self, search_results, question):
         """Format FAISS search results into optimal context for Q&A"""
         context_parts = []
         total_tokens = 0
         
-        # Prioritize results by relevance and diversity
-        sorted_results = sorted(search_results, key=lambda x: x.get('final_score', x['similarity']), reverse=True)
-        
-        for i, result in enumerate(sorted_results):
+        # Results arrive ranked by enhanced_search (dense + BM25 fusion), most relevant first
+        for i, result in enumerate(search_results):
             content = result['content']
             section = result['section']
             
@@ -615,7 +1338,7 @@ INSTRUCTIONS:
 COMPREHENSIVE ANSWER:"""
             
             # Generate answer with full document context using NEW OpenAI v1.x API
-            response = client.chat.completions.create(
+            response = get_openai_client().chat.completions.create(
                 model=LLM_MODEL,
                 messages=[
                     {"role": "system", "content": "You are the world's leading expert in 10-K financial document analysis with access to complete document context. Provide the most comprehensive, accurate, and insightful analysis possible."},
@@ -664,15 +1387,363 @@ COMPREHENSIVE ANSWER:"""
         return answer
     
 
+# Files inside a document's index directory; chunk stores add documents.* and sections.*.
+# All but metadata.json carry the generation they belong to, e.g. index.3.faiss
+INDEX_FILE = "index.faiss"
+METADATA_FILE = "metadata.json"
+VECTORS_FILE = "vectors.npy"
+TOMBSTONES_FILE = "tombstones.npy"
+BM25_FILE = "bm25.npz"
+FEATURES_FILE = "features.npy"
+VERIFIED_FILE = "verified.json"  # Size and mtime of each file when the generation last matched its checksums
+
+# Manifest of indices saved before one was recorded: the only model and chunking they could have been built with
+LEGACY_MANIFEST = {
+    'embedding_model': "sentence-transformers/all-MiniLM-L6-v2",
+    'embedding_space': "sentence-transformers/all-MiniLM-L6-v2",
+    'dimension': 384,
+    'chunker': {'max_length': 800, 'overlap': 100}
+}
+
+def document_file(doc_dir, name, generation):
+    """Path of one generation of a document file; generation 0 is the unversioned layout"""
+    if not generation:
+        return os.path.join(doc_dir, name)
+    stem, extension = os.path.splitext(name)
+    return os.path.join(doc_dir, f"{stem}.{generation}{extension}")
+
+def chunk_store_name(name, generation):
+    return f"{name}.{generation}" if generation else name
+
+def read_document_metadata(doc_dir):
+    """A document's metadata.json, or None if it has no complete index"""
+    metadata_path = os.path.join(doc_dir, METADATA_FILE)
+    if not os.path.exists(metadata_path):
+        return None
+    
+    with open(metadata_path, 'r') as f:
+        return json.load(f)
+
+def document_segments(metadata):
+    """[{'generation', 'chunk_count'}] of the segments a generation's index is made of, oldest first; indices saved
+    before segments existed are a single segment of their own generation"""
+    return metadata.get('segments') or [{'generation': metadata.get('generation', 0),
+                                         'chunk_count': metadata.get('chunk_count')}]
+
+def read_segment(doc_dir, generation):
+    """Map the index, chunk stores, exact vectors, BM25 postings and features of the segment a generation added"""
+    documents = open_chunk_store(doc_dir, chunk_store_name('documents', generation))
+    
+    # Indices saved before BM25 was added, or before it kept term frequencies, get their postings built on load
+    bm25_path = document_file(doc_dir, BM25_FILE, generation)
+    bm25 = BM25Segment.load(bm25_path) if os.path.exists(bm25_path) else None
+    
+    features = _load_array(document_file(doc_dir, FEATURES_FILE, generation))
+    
+    return {
+        # Map FAISS index: pages are shared through the OS page cache by every process
+        'index': read_index_mmap(document_file(doc_dir, INDEX_FILE, generation)),
+        'documents': documents,
+        'section_names': open_chunk_store(doc_dir, chunk_store_name('sections', generation)),
+        'vectors': _load_array(document_file(doc_dir, VECTORS_FILE, generation)),
+        'bm25': BM25Segment.build(documents) if bm25 is None else bm25,
+        'features': chunk_features(documents) if features is None else features
+    }
+
+def faiss_index_generation(doc_dir, metadata):
+    """Map the segments and tombstones of the generation metadata points at, read as one index"""
+    segments = document_segments(metadata)
+    loaded = [read_segment(doc_dir, segment['generation']) for segment in segments]
+    metadata['segments'] = [{'generation': segment['generation'], 'chunk_count': int(files['index'].ntotal)}
+                            for segment, files in zip(segments, loaded)]
+    
+    tombstones = _load_array(document_file(doc_dir, TOMBSTONES_FILE, metadata.get('generation', 0)))
+    metadata['tombstones'] = np.zeros(0, dtype='int64') if tombstones is None else np.array(tombstones)
+    
+    # Later segments continue the chunk positions of earlier ones; a single segment is used as it is
+    def joined(key, segmented):
+        values = [files[key] for files in loaded]
+        return values[0] if len(values) == 1 else segmented(values)
+    
+    metadata['documents'] = joined('documents', SegmentedChunkStore)
+    metadata['section_names'] = joined('section_names', SegmentedChunkStore)
+    if any(files['vectors'] is None for files in loaded):
+        metadata['vectors'] = None
+    else:
+        metadata['vectors'] = joined('vectors', SegmentedRows)
+    metadata['features'] = joined('features', SegmentedRows)
+    metadata['bm25'] = BM25Index([files['bm25'] for files in loaded], metadata['tombstones'])
+    
+    return joined('index', SegmentedIndex), metadata
+
+def write_segment(doc_dir, generation, faiss_index, documents, section_names, vectors=None, bm25=None,
+                  features=None):
+    """Write the files of a segment of chunks, named after the generation that adds it"""
+    # Save FAISS index
+    write_index_atomic(faiss_index, document_file(doc_dir, INDEX_FILE, generation))
+    
+    # Save exact vectors of quantized indices for re-ranking
+    if vectors is not None:
+        _save_array(document_file(doc_dir, VECTORS_FILE, generation), vectors, 'float32')
+    
+    # Save chunk texts and section names as packed UTF-8 that loads by mapping, not unpickling
+    write_chunk_store(doc_dir, chunk_store_name('documents', generation), documents)
+    write_chunk_store(doc_dir, chunk_store_name('sections', generation), section_names)
+    
+    # Save the lexical (BM25) postings and the re-ranking feature table of the same chunks
+    if bm25 is None:
+        bm25 = BM25Segment.build(documents)
+    bm25.save(document_file(doc_dir, BM25_FILE, generation))
+    if features is None:
+        features = chunk_features(documents)
+    _save_array(document_file(doc_dir, FEATURES_FILE, generation), features, FEATURE_DTYPE)
+
+def commit_generation(doc_dir, generation, segments, manifest, tombstones=None, is_fallback=False, recall=1.0,
+                      previous=None):
+    """Write a generation's tombstones and metadata, then delete the files none of its segments use
+    
+    Segments kept from the previous generation are unchanged on disk, so their checksums and verification carry
+    over: only the files this generation wrote are hashed, when saving and on its first load.
+    """
+    if tombstones is not None and len(tombstones):
+        _save_array(document_file(doc_dir, TOMBSTONES_FILE, generation), tombstones, 'int64')
+    
+    kept = [name for segment in segments if segment['generation'] != generation
+            for name in segment_files(doc_dir, segment['generation'])]
+    previous_checksums = previous.get('checksums', {}) if previous else {}
+    checksums = {name: previous_checksums.get(name) or file_checksum(os.path.join(doc_dir, name)) for name in kept}
+    checksums.update((name, file_checksum(os.path.join(doc_dir, name)))
+                     for name in generation_files(doc_dir, generation))
+    
+    # Save metadata (written last: it is what points readers at the new generation), with the manifest of what
+    # produced the index and checksums of every file it uses
+    metadata = {
+        'generation': generation,
+        'segments': segments,
+        'chunk_count': sum(segment['chunk_count'] for segment in segments),
+        'tombstone_count': 0 if tombstones is None else len(tombstones),
+        'is_fallback': is_fallback,
+        'recall_at_10': recall,
+        **manifest,
+        'checksums': checksums
+    }
+    
+    metadata_path = os.path.join(doc_dir, METADATA_FILE)
+    with open(metadata_path + ".tmp", 'w') as f:
+        json.dump(metadata, f)
+    os.replace(metadata_path + ".tmp", metadata_path)
+    
+    if previous:
+        verified = read_verified_signatures(doc_dir, previous.get('generation', 0))
+        carried = {name: verified[name] for name in kept if name in verified}
+        if carried:
+            write_verified_signatures(doc_dir, generation, carried)
+    
+    # Processes that mapped older generations keep reading their unlinked files
+    remove_stale_generations(doc_dir, generation, kept)
+
+def generation_files(doc_dir, generation):
+    """Names of the files of one generation, e.g. index.3.faiss and documents.3_offsets.npy"""
+    if generation:
+        current = re.compile(rf'^\w+\.{generation}(?:_offsets)?\.\w+$')
+    else:
+        current = re.compile(r'^\w+\.\w+$')  # The unversioned layout, e.g. index.faiss
+    return sorted(filename for filename in os.listdir(doc_dir)
+                  if current.match(filename) and filename != METADATA_FILE)
+
+def segment_files(doc_dir, generation):
+    """Names of the files of the segment a generation added; its tombstones and verification are not shared"""
+    own = {os.path.basename(document_file(doc_dir, name, generation)) for name in (TOMBSTONES_FILE, VERIFIED_FILE)}
+    return [filename for filename in generation_files(doc_dir, generation) if filename not in own]
+
+def remove_stale_generations(doc_dir, generation, kept=()):
+    """Delete files of every generation but the current one, except kept files of segments it still uses"""
+    current = set(generation_files(doc_dir, generation)) | set(kept)
+    for filename in os.listdir(doc_dir):
+        if filename != METADATA_FILE and filename not in current:
+            os.remove(os.path.join(doc_dir, filename))
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def corrupt_generation_files(doc_dir, metadata):
+    """Files whose content no longer matches the checksums in metadata (none recorded before manifests)"""
+    checksums = metadata.get('checksums', {})
+    
+    # A missing file raises FileNotFoundError instead: a concurrent save may have replaced the generation
+    signatures = {name: file_signature(os.path.join(doc_dir, name)) for name in checksums}
+    
+    # Only files changed since the generation was last verified are hashed, so loads stay memory-mapped reads
+    verified = read_verified_signatures(doc_dir, metadata.get('generation', 0))
+    corrupt = [name for name, checksum in checksums.items()
+               if verified.get(name) != signatures[name] and file_checksum(os.path.join(doc_dir, name)) != checksum]
+    
+    if checksums and not corrupt and verified != signatures:
+        write_verified_signatures(doc_dir, metadata.get('generation', 0), signatures)
+    return corrupt
+
+def read_verified_signatures(doc_dir, generation):
+    """{file name: signature} of a generation's files when they last matched their checksums"""
+    verified_path = document_file(doc_dir, VERIFIED_FILE, generation)
+    if not os.path.exists(verified_path):
+        return {}
+    
+    with open(verified_path, 'r') as f:
+        return json.load(f)
+
+def write_verified_signatures(doc_dir, generation, signatures):
+    verified_path = document_file(doc_dir, VERIFIED_FILE, generation)
+    try:
+        with open(verified_path + ".tmp", 'w') as f:
+            json.dump(signatures, f)
+        os.replace(verified_path + ".tmp", verified_path)
+    except OSError as e:
+        print(f"Error saving index verification for {doc_dir}: {e}")
+
+def _save_array(path, values, dtype):
+    with open(path + ".tmp", 'wb') as f:
+        np.save(f, np.ascontiguousarray(values, dtype=dtype))
+    os.replace(path + ".tmp", path)
+
+def _load_array(path):
+    return np.load(path, mmap_mode='r') if os.path.exists(path) else None
+
+def _live_selector(tombstones):
+    """FAISS id filter excluding tombstoned chunk positions, or None when there are none"""
+    if tombstones is None or len(tombstones) == 0:
+        return None
+    return faiss.IDSelectorNot(faiss.IDSelectorBatch(np.asarray(tombstones, dtype='int64')))
+
+def document_index_dir(doc_id, index_dir=FAISS_INDEX_DIR):
+    """Directory holding a document's index, chunk store, metadata and (quantized indices only) exact vectors"""
+    return os.path.join(index_dir, f"doc_{doc_id}")
+
+def legacy_index_paths(doc_id, index_dir=FAISS_INDEX_DIR):
+    """Flat index/pickle/vector files written by older versions, migrated on first load"""
+    return (os.path.join(index_dir, f"index_{doc_id}.faiss"),
+            os.path.join(index_dir, f"metadata_{doc_id}.pkl"),
+            os.path.join(index_dir, f"vectors_{doc_id}.npy"))
+
+def _indexed_document_ids(index_dir=FAISS_INDEX_DIR):
+    """Document ids that have persisted index files on disk"""
+    if not os.path.exists(index_dir):
+        return set()
+    
+    doc_ids = set()
+    for filename in os.listdir(index_dir):
+        match = re.match(r'^(?:doc_(\d+)|(?:index|metadata|vectors)_(\d+)\.(?:faiss|pkl|npy))$', filename)
+        if match:
+            doc_ids.add(int(match.group(1) or match.group(2)))
+    return doc_ids
+
+def remove_document_index_files(doc_id, index_dir=FAISS_INDEX_DIR):
+    """Delete a document's persisted index files, returning the bytes freed"""
+    freed = 0
+    doc_dir = document_index_dir(doc_id, index_dir)
+    if os.path.isdir(doc_dir):
+        freed += sum(entry.stat().st_size for entry in os.scandir(doc_dir) if entry.is_file())
+        shutil.rmtree(doc_dir)
+    
+    for path in legacy_index_paths(doc_id, index_dir):
+        if os.path.exists(path):
+            freed += os.path.getsize(path)
+            os.remove(path)
+    return freed
+
+def _index_dir_of(search_engine):
+    return search_engine.faiss_index_dir if search_engine else FAISS_INDEX_DIR
+
+def purge_document(doc_id, search_engine=None):
+    """Delete a document from every table, memory and disk (the engine's index directory, if one is given)"""
+    deleted = delete_document(doc_id)
+    index_dir = _index_dir_of(search_engine)
+    
+    if search_engine:
+        search_engine.evict_document(doc_id)
+    
+    get_corpus_index(index_dir).remove_document(doc_id)
+    freed = remove_document_index_files(doc_id, index_dir)
+    return {'deleted': deleted, 'index_bytes_freed': freed}
+
+def remove_orphaned_indices(search_engine=None):
+    """Remove index files whose document no longer exists in the database"""
+    known_ids = set(get_all_document_ids())
+    index_dir = _index_dir_of(search_engine)
+    freed = 0
+    orphaned = sorted(_indexed_document_ids(index_dir) - known_ids)
+    
+    corpus = get_corpus_index(index_dir)
+    for doc_id in orphaned:
+        if search_engine:
+            search_engine.evict_document(doc_id)
+        corpus.remove_document(doc_id, save=False)
+        freed += remove_document_index_files(doc_id, index_dir)
+    
+    if orphaned:
+        corpus.save()
+    
+    return {'orphaned_documents': orphaned, 'index_bytes_freed': freed}
+
+def run_retention_policy(max_age_days=RETENTION_MAX_AGE_DAYS, drop_superseded=RETENTION_DROP_SUPERSEDED,
+                         vacuum_pages=RETENTION_VACUUM_PAGES, search_engine=None):
+    """Purge expired and superseded documents, clean orphaned indices and reclaim database space"""
+    expired_ids = get_expired_document_ids(max_age_days, drop_superseded)
+    freed = 0
+    
+    for doc_id in expired_ids:
+        freed += purge_document(doc_id, search_engine)['index_bytes_freed']
+    
+    orphans = remove_orphaned_indices(search_engine)
+    free_pages = reclaim_space(vacuum_pages)
+    
+    return {
+        'purged_documents': expired_ids,
+        'orphaned_documents': orphans['orphaned_documents'],
+        'index_bytes_freed': freed + orphans['index_bytes_freed'],
+        'free_pages_remaining': free_pages
+    }
+
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+
+def _warm_up_search_system():
+    try:
+        faiss.IndexFlatIP  # Any attribute access executes the lazily imported module
+        warm_up_embedding_model(EMBEDDING_MODEL, EMBEDDING_BACKEND)
+        get_openai_client()
+    except Exception as e:
+        print(f"Error warming up search system: {e}")
+
+def warm_up_search_system_in_background():
+    """Load faiss, the OpenAI client and the embedding model on a daemon thread, once per process"""
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            # A search that starts first simply waits for the model on the registry lock
+            _warm_up_thread = threading.Thread(target=_warm_up_search_system, daemon=True)
+            _warm_up_thread.start()
+    return _warm_up_thread
+
 def initialize_enhanced_search_system():
     """Initialize the FAISS-enhanced search and Q&A system"""
     search_engine = FAISSEnhancedSemanticSearchEngine()
     qa_engine = EnhancedQuestionAnsweringEngine(search_engine)
     return search_engine, qa_engine
 
-def perform_enhanced_batch_search(doc_id, queries):
+def perform_enhanced_batch_search(doc_id, queries, search_engine=None, qa_engine=None):
     """Enhanced batch search with FAISS-powered results"""
-    search_engine, qa_engine = initialize_enhanced_search_system()
+    if search_engine is None:
+        search_engine, qa_engine = initialize_enhanced_search_system()
+    elif qa_engine is None:
+        qa_engine = EnhancedQuestionAnsweringEngine(search_engine)
     
     results = {}
     for query in queries:
@@ -696,16 +1767,6 @@ def perform_enhanced_batch_search(doc_id, queries):
     
     return results
 
-def get_enhanced_document_insights(doc_id):
+def get_enhanced_document_insights(doc_id, search_engine=None, qa_engine=None):
     """Get enhanced insights about the document using FAISS"""
-    advanced_queries = [
-        "What is the company's primary business and main revenue sources?",
-        "What are the key financial performance metrics and trends?",
-        "What are the most significant risk factors facing the company?",
-        "How did the company perform compared to the previous year?",
-        "What are the management's strategic priorities and future outlook?",
-        "What are the main competitive advantages and market position?",
-        "What is the company's cash flow and financial stability situation?"
-    ]
-    
-    return perform_enhanced_batch_search(doc_id, advanced_queries)
\ No newline at end of file
+    return perform_enhanced_batch_search(doc_id, INSIGHT_QUERIES, search_engine, qa_engine)
\ No newline at end of file
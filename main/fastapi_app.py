@@ -5,6 +5,7 @@ from pydantic import BaseModel
 from uuid import uuid4
 from pathlib import Path
 import shutil
+from search_metrics import get_search_metrics, reset_search_metrics
 
 # FastAPI app setup
 app = FastAPI()
@@ -66,6 +67,14 @@ def get_chat_status(uuid: str):
 
     return {"message": "Still processing. Try again later."}
 
+@app.get("/metrics/search")
+def search_metrics(reset: bool = False):
+    """p50/p95/p99 latency per stage of enhanced_search ('search') and Q&A ('qa') in this process"""
+    metrics = get_search_metrics()
+    if reset:
+        reset_search_metrics()
+    return metrics
+
 class ChatRequest(BaseModel):
     message: str
 
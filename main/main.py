@@ -8,6 +8,7 @@ from data_visualizer import *
 from semantic_search import *
 from translator import *
 from fallback_data import *
+from config import QA_QUESTION_CATEGORIES, WARM_UP_IN_BACKGROUND
 from threading import Thread
 from fastapi_app import app
 import uvicorn
@@ -28,6 +29,9 @@ fastapi_thread.start()
 
 def initialize_app():
     init_database()
+    if WARM_UP_IN_BACKGROUND:
+        # The upload page renders right away; models load while the user picks a file
+        warm_up_search_system_in_background()
     if 'doc_id' not in st.session_state:
         st.session_state.doc_id = None
     if 'processed' not in st.session_state:
@@ -81,6 +85,7 @@ def upload_and_process_pdf():
                 
                 search_engine, qa_engine = initialize_enhanced_search_system()
                 search_engine.create_embeddings(doc_id)
+                search_engine.pin_document(doc_id)  # Keep the open filing loaded whatever else is searched
                 st.session_state.search_engine = search_engine
                 st.session_state.qa_engine = qa_engine
                 
@@ -171,9 +176,9 @@ Return in this exact JSON format:
 Be specific and use actual data from the document when available."""
         
         # Use the same client as other LLM calls
-        from semantic_search import client
+        from semantic_search import get_openai_client
         
-        response = client.chat.completions.create(
+        response = get_openai_client().chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are a senior financial analyst providing executive-level analysis of 10-K documents. Always return valid JSON with specific, data-driven insights."},
@@ -243,10 +248,8 @@ def display_overview_tab():
         # Enhanced fallback based on document info
         try:
             # Try to get some basic analysis results
-            insights = get_analysis_results(st.session_state.doc_id, "executive_insights")
-            if insights and len(insights) > 0:
-                insights_data = json.loads(insights[0][0]) if isinstance(insights[0], tuple) else json.loads(insights[0])
-                
+            insights_data = get_parsed_analysis_results(st.session_state.doc_id, "executive_insights")
+            if insights_data:
                 col1, col2 = st.columns(2)
                 
                 with col1:
@@ -390,10 +393,8 @@ def display_risk_analysis_tab():
     st.subheader("Risk Assessment Summary")
     
     try:
-        risk_results = get_analysis_results(st.session_state.doc_id, "risk_factors")
-        if risk_results:
-            risk_data = json.loads(risk_results[0][0]) if isinstance(risk_results[0], tuple) else json.loads(risk_results[0])
-            
+        risk_data = get_parsed_analysis_results(st.session_state.doc_id, "risk_factors")
+        if risk_data:
             total_risks = sum(len(risks) if isinstance(risks, list) else 1 for risks in risk_data.values())
             st.metric("Total Risk Factors Identified", total_risks)
             
@@ -425,10 +426,11 @@ def display_business_analysis_tab():
     with col1:
         st.subheader("Business Overview")
         
-        business_results = get_analysis_results(st.session_state.doc_id, "business_overview")
-        if business_results:
+        business_data = get_parsed_analysis_results(st.session_state.doc_id, "business_overview")
+        if business_data:
             try:
-                business_data = json.loads(business_results[0][0]) if isinstance(business_results[0], tuple) else json.loads(business_results[0])
+                if not isinstance(business_data, dict):
+                    raise ValueError("Business overview is not structured JSON")
                 
                 if 'company_name' in business_data:
                     st.write(f"**Company:** {business_data['company_name']}")
@@ -491,36 +493,7 @@ def display_search_qa_tab():
     with col1:
         st.write("**📋 Select a Question Category:**")
         
-        question_categories = {
-            "💰 Financial Performance": [
-                "What are the key financial metrics and performance trends?",
-                "How did revenue and profitability change compared to previous year?",
-                "What are the main sources of revenue and their growth rates?",
-                "What is the company's cash flow and financial stability situation?",
-                "What are the key financial ratios and their implications?"
-            ],
-            "⚠️ Risk Analysis": [
-                "What are the most significant risk factors facing the company?",
-                "How do market risks impact the company's operations?",
-                "What regulatory and compliance risks does the company face?",
-                "What are the operational and supply chain risks?",
-                "How does the company mitigate its key risks?"
-            ],
-            "🏢 Business Strategy": [
-                "What is the company's primary business and main revenue sources?",
-                "What are the main competitive advantages and market position?",
-                "What are management's strategic priorities and future outlook?",
-                "How is the company positioned in its industry?",
-                "What are the key growth drivers and opportunities?"
-            ],
-            "📊 Operations & Market": [
-                "What are the main business segments and their performance?",
-                "How does the company compete in its markets?",
-                "What are the key operational metrics and trends?",
-                "What geographic markets does the company operate in?",
-                "What are the company's key products and services?"
-            ]
-        }
+        question_categories = QA_QUESTION_CATEGORIES
         
         selected_category = st.selectbox("Choose a category:", list(question_categories.keys()))
         selected_question = st.selectbox("Select a question:", ["Choose a question..."] + question_categories[selected_category])
@@ -562,6 +535,25 @@ def display_search_qa_tab():
                 st.write("## 📄 **Analysis Method:**")
                 st.info("Answer generated using comprehensive document analysis for maximum accuracy.")
     
+    # Corpus-wide search across every processed filing
+    st.markdown("---")
+    st.write("## 🗂️ **Search Across All Filings**")
+    
+    corpus_query = st.text_input("🔎 Find passages in every uploaded document:", placeholder="e.g., supply chain concentration in China", key="corpus_query")
+    
+    if corpus_query:
+        with st.spinner("Searching all filings..."):
+            corpus_results = st.session_state.search_engine.corpus_search(corpus_query, top_k=10)
+        
+        if corpus_results:
+            for result in corpus_results:
+                company = result.get('company_name') or f"Document {result['doc_id']}"
+                section_name = result['section'].replace('_', ' ').title()
+                with st.expander(f"{company} — {section_name} ({result['similarity']:.2f})"):
+                    st.write(result['content'])
+        else:
+            st.info("No matching passages found across the indexed filings.")
+    
     # Chat Interface Section
     st.markdown("---")
     st.write("## 💬 **Chat Assistant**")
@@ -772,8 +764,30 @@ def main():
             st.session_state.chat_history = []
             st.rerun()
         
+        if st.session_state.doc_id and st.button("❌ Delete Current Document"):
+            purge_document(st.session_state.doc_id, st.session_state.search_engine)
+            st.session_state.doc_id = None
+            st.session_state.processed = False
+            st.session_state.chat_history = []
+            st.success("Document deleted!")
+            st.rerun()
+        
+        if st.button("🧹 Apply Retention Policy"):
+            # Only on request: purging superseded filings deletes their data and indices for good
+            retention = run_retention_policy(search_engine=st.session_state.search_engine)
+            if st.session_state.doc_id in retention['purged_documents']:
+                st.session_state.doc_id = None
+                st.session_state.processed = False
+                st.session_state.search_engine = None
+                st.session_state.qa_engine = None
+                st.session_state.chat_history = []
+            st.success(f"Purged {len(retention['purged_documents'])} documents and "
+                       f"{len(retention['orphaned_documents'])} orphaned indices")
+            st.rerun()
+        
         if st.button("🗑️ Clear All Data"):
             clear_all_data()
+            remove_orphaned_indices(st.session_state.search_engine)
             st.session_state.doc_id = None
             st.session_state.processed = False
             st.session_state.search_engine = None
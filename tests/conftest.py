@@ -0,0 +1,105 @@
+import os
+import re
+import sys
+import zlib
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'helpers'))
+
+import database  # noqa: E402
+import embedding_models  # noqa: E402
+import semantic_search  # noqa: E402
+from config import EMBEDDING_MODEL, EMBEDDING_BACKEND, ENCODE_BATCH_SIZE  # noqa: E402
+
+class HashingModel:
+    """Offline stand-in for the SentenceTransformer: hashed bag-of-words vectors, so shared words mean similarity"""
+    
+    dimension = 64
+    
+    def __init__(self):
+        self.encoded = 0
+        self.calls = 0
+        self.largest_batch = 0
+    
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+    
+    def encode(self, texts, batch_size=32, **kwargs):
+        self.encoded += len(texts)
+        self.calls += 1
+        self.largest_batch = max(self.largest_batch, len(texts))
+        vectors = np.zeros((len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            for word in re.findall(r'\w+', text.lower()):
+                vectors[row, zlib.crc32(word.encode()) % self.dimension] += 1.0
+            vectors[row, zlib.crc32(text.encode()) % self.dimension] += 0.01  # No all-zero rows
+        return vectors
+
+class InProcessPool:
+    """EncoderPool stand-in: spawned workers could not load the offline test model"""
+    
+    def __init__(self, model_name, backend, processes=None, batch_size=ENCODE_BATCH_SIZE):
+        self.model_name, self.backend = model_name, backend
+        self.batch_size = batch_size
+        self.model = embedding_models.get_embedding_model(model_name, backend)  # The "workers'" model
+    
+    def embedding_space(self):
+        return embedding_models.embedding_space(self.model_name, self.backend)
+    
+    def stream(self, batches):
+        return (self.model.encode(batch) for batch in batches)
+    
+    def encode(self, texts):
+        return self.model.encode(texts)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        pass
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in a temporary directory against an empty database"""
+    monkeypatch.chdir(tmp_path)
+    db_path = str(tmp_path / 'test.db')
+    # semantic_search binds DB_PATH at import time, so its copy is repointed too
+    for module in (database, semantic_search):
+        monkeypatch.setattr(module, 'DB_PATH', db_path)
+    database.invalidate_read_cache()
+    database.init_database()
+    yield tmp_path
+    database.invalidate_read_cache()
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = HashingModel()
+    monkeypatch.setitem(embedding_models._models, (EMBEDDING_MODEL, EMBEDDING_BACKEND), (model, 'torch'))
+    embedding_models.clear_query_cache()
+    yield model
+    embedding_models.clear_query_cache()
+
+@pytest.fixture
+def make_engine(workdir, fake_model):
+    """Build search engines whose indices live in the temporary directory"""
+    from semantic_search import FAISSEnhancedSemanticSearchEngine
+    
+    def make(**kwargs):
+        kwargs.setdefault('index_dir', str(workdir / 'faiss_indices'))
+        engine = FAISSEnhancedSemanticSearchEngine(**kwargs)
+        engine.reranker = None
+        return engine
+    
+    return make
+
+def filing_chunks(n_chunks, topic='revenue'):
+    """(documents, section_names) of n_chunks distinct chunks across two sections"""
+    documents, section_names = [], []
+    for i in range(n_chunks):
+        section = 'risk_factors' if i % 2 else 'financial_data'
+        documents.append(f"[{section}] Chunk {i} discusses {topic} item{i} and segment{i % 7} results in detail.")
+        section_names.append(f"{section}_{i}")
+    return documents, section_names
@@ -0,0 +1,53 @@
+import math
+import numpy as np
+from bm25_index import BM25Index, BM25Segment, tokenize
+from config import BM25_K1, BM25_B
+
+TEXTS = ["Acme reported revenue of 1,234.5 million",
+         "Revenue grew as Acme expanded r&d spending on revenue",
+         "The 10-K lists risk factors",
+         "Operating margin improved"]
+
+def _okapi(texts, query):
+    """Textbook BM25 of every text for the query's distinct terms"""
+    tokens = [tokenize(text) for text in texts]
+    average_length = sum(len(chunk_tokens) for chunk_tokens in tokens) / len(tokens)
+    scores = []
+    for chunk_tokens in tokens:
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(term in other for other in tokens)
+            tf = chunk_tokens.count(term)
+            idf = math.log(1 + (len(tokens) - df + 0.5) / (df + 0.5))
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * len(chunk_tokens) / average_length)
+            score += idf * tf * (BM25_K1 + 1) / (tf + length_norm)
+        scores.append(score)
+    return np.array(scores)
+
+def test_tokens_keep_numbers_and_internal_separators():
+    assert tokenize("Acme's R&D rose to 1,234.5 in the 10-K.") == ["acme's", 'r&d', 'rose', 'to', '1,234.5', 'in',
+                                                                    'the', '10-k']
+
+def test_scores_match_okapi_bm25():
+    query = "acme revenue 10-k"
+    expected = _okapi(TEXTS, query)
+    
+    scores, ids = BM25Index.build(TEXTS).search(query, k=len(TEXTS))
+    assert list(ids) == [i for i in np.argsort(-expected, kind='stable') if expected[i] > 0]
+    np.testing.assert_allclose(scores, expected[ids], rtol=1e-5)
+
+def test_segments_with_tombstones_score_like_the_live_chunks_alone():
+    query = "acme revenue 10-k"
+    appended = TEXTS + ["Acme revenue restated in the amended 10-K"]
+    index = BM25Index([BM25Segment.build(appended[:2]), BM25Segment.build(appended[2:])], tombstones=[1])
+    
+    live = [0, 2, 3, 4]
+    expected_scores, expected_ids = BM25Index.build([appended[i] for i in live]).search(query, k=5)
+    scores, ids = index.search(query, k=5)
+    assert list(ids) == [live[i] for i in expected_ids]
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+def test_search_returns_only_chunks_containing_a_query_term():
+    index = BM25Index.build(TEXTS)
+    assert len(index.search("goodwill impairment", k=3)[1]) == 0
+    assert list(index.search("margin", k=3)[1]) == [3]
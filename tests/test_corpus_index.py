@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+import corpus_index
+from corpus_index import CorpusIndex
+from index_factory import STORAGE_TYPES
+from conftest import filing_chunks, InProcessPool
+
+def _vectors(n, dimension=16, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, dimension)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def test_lookup_is_committed_only_after_the_index_is_written(workdir, monkeypatch):
+    corpus = CorpusIndex(str(workdir / 'corpus'))
+    documents, section_names = filing_chunks(8)
+    corpus.add_document(1, _vectors(8), documents, section_names)
+    
+    def crash(index, path):
+        raise OSError("disk full")
+    
+    monkeypatch.setattr(corpus_index, 'write_index_atomic', crash)
+    with pytest.raises(OSError):
+        corpus.add_document(2, _vectors(8, seed=1), documents, section_names)
+    
+    # What another process (or a restart) sees: the last saved index and only the lookup rows it covers
+    reopened = CorpusIndex(str(workdir / 'corpus'))
+    assert reopened.index.ntotal == 8
+    assert reopened.document_ids() == {1}
+
+def test_unsaved_changes_are_visible_in_process(workdir):
+    corpus = CorpusIndex(str(workdir / 'corpus'))
+    documents, section_names = filing_chunks(8)
+    corpus.add_document(1, _vectors(8), documents, section_names, save=False)
+    
+    assert corpus.document_ids() == {1}
+    assert CorpusIndex(str(workdir / 'corpus')).document_ids() == set()
+    
+    corpus.save()
+    assert CorpusIndex(str(workdir / 'corpus')).document_ids() == {1}
+
+def test_bulk_ingest_writes_the_corpus_index_once(make_engine, monkeypatch):
+    import semantic_search
+    from database import add_document, save_extracted_text
+    
+    writes = []
+    write_index_atomic = corpus_index.write_index_atomic
+    monkeypatch.setattr(semantic_search, 'EncoderPool', InProcessPool)
+    monkeypatch.setattr(corpus_index, 'write_index_atomic',
+                        lambda index, path: writes.append(path) or write_index_atomic(index, path))
+    
+    engine = make_engine()
+    doc_ids = []
+    for i in range(3):
+        doc_id = add_document(f"filing_{i}.pdf", f"Company {i}", "2023")
+        save_extracted_text(doc_id, "business_overview", f"Company {i} sells products. " * 80)
+        doc_ids.append(doc_id)
+    
+    assert engine.create_embeddings_bulk(doc_ids) == {doc_id: True for doc_id in doc_ids}
+    assert len(writes) == 1
+    assert semantic_search.get_corpus_index(engine.faiss_index_dir).document_ids() == set(doc_ids)
+
+@pytest.mark.parametrize('storage', STORAGE_TYPES)
+@pytest.mark.parametrize('index_type', ['flat', 'ivf_flat', 'ivf_pq'])
+def test_filtered_search_returns_only_selected_documents(workdir, index_type, storage):
+    corpus = CorpusIndex(str(workdir / 'corpus'))
+    vectors = {doc_id: _vectors(200, dimension=32, seed=doc_id) for doc_id in (1, 2, 3)}
+    corpus.reset(32, 600, index_type, np.vstack(list(vectors.values())), storage)
+    documents, section_names = filing_chunks(200)
+    for doc_id, embeddings in vectors.items():
+        corpus.add_document(doc_id, embeddings, documents, section_names, save=False)
+    
+    _, chunk_ids = corpus.search(vectors[1][:3], top_k=5, doc_ids=[2], nprobe=64, ef_search=64)
+    found = [chunk_id for chunk_id in chunk_ids.ravel() if chunk_id != -1]
+    assert found
+    assert {row['doc_id'] for row in corpus.get_chunks(found).values()} == {2}
+
+def test_hnsw_is_refused_for_the_corpus_index(workdir):
+    corpus = CorpusIndex(str(workdir / 'corpus'))
+    with pytest.raises(ValueError):
+        corpus.reset(16, 100, 'hnsw', None)
+
+def test_persisted_hnsw_corpus_index_is_discarded(workdir):
+    # HNSW cannot remove vectors: re-adding a document under its reused chunk ids used to leave the old vectors
+    # in the graph, answering queries with the new chunks' content
+    import faiss
+    from index_factory import create_index
+    corpus_dir = str(workdir / 'corpus')
+    documents, section_names = filing_chunks(5)
+    corpus = CorpusIndex(corpus_dir)
+    corpus.index, corpus.index_type = create_index(16, 0, 'hnsw', with_ids=True)
+    corpus.add_chunks(1, _vectors(5), documents, section_names)
+    
+    reopened = CorpusIndex(corpus_dir)
+    assert reopened.index is None and reopened.document_ids() == set()
+    
+    new_vectors = _vectors(3, seed=1)
+    reopened.add_document(1, _vectors(5), documents, section_names)
+    reopened.add_document(1, new_vectors, documents[:3], section_names[:3])
+    assert reopened.index.ntotal == 3
+    assert not isinstance(faiss.downcast_index(reopened.index.index), faiss.IndexHNSW)
+    
+    _, chunk_ids = reopened.search(_vectors(5)[4:5], top_k=3)
+    assert set(chunk_ids.ravel()) <= set(CorpusIndex.chunk_ids(1, 3))
+
+@pytest.mark.parametrize('index_type', ['flat', 'ivf_flat', 'ivf_pq'])
+def test_readded_document_replaces_its_vectors(workdir, index_type):
+    corpus = CorpusIndex(str(workdir / 'corpus'))
+    documents, section_names = filing_chunks(200)
+    old_vectors = _vectors(200, dimension=32)
+    corpus.reset(32, 200, index_type, old_vectors)
+    corpus.add_document(1, old_vectors, documents, section_names, save=False)
+    corpus.add_document(1, _vectors(3, dimension=32, seed=1), documents[:3], section_names[:3], save=False)
+    
+    assert corpus.index.ntotal == 3
+    _, chunk_ids = corpus.search(old_vectors[100:101], top_k=3, nprobe=64)
+    assert set(chunk_ids.ravel()) <= set(CorpusIndex.chunk_ids(1, 3))
+
+def test_rebuild_without_documents_empties_the_corpus(make_engine):
+    import semantic_search
+    from database import add_document, save_extracted_text
+    engine = make_engine()
+    doc_id = add_document("10-K.pdf", "Acme Corp", "2023")
+    save_extracted_text(doc_id, "business_overview", "Acme sells products and services. " * 80)
+    assert engine.create_embeddings(doc_id)
+    
+    # A fresh engine knows no dimension until it indexes something
+    semantic_search.remove_document_index_files(doc_id, engine.faiss_index_dir)
+    engine = make_engine()
+    engine.rebuild_corpus_index()
+    
+    corpus = CorpusIndex(engine.faiss_index_dir)
+    assert corpus.index is None and corpus.document_ids() == set()
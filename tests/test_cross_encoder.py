@@ -0,0 +1,41 @@
+import time
+import cross_encoder
+from cross_encoder import CrossEncoderReranker
+
+class FakeCrossEncoder:
+    def predict(self, pairs, batch_size=32):
+        return [float(len(passage)) for _, passage in pairs]
+
+def _wait_for_warm_up(reranker):
+    loading = reranker._loading
+    if loading is not None:
+        loading.join(timeout=5)
+
+def test_failed_warm_up_is_retried_after_backoff(monkeypatch):
+    attempts = []
+    
+    def load(model_name):
+        attempts.append(model_name)
+        if len(attempts) == 1:
+            raise OSError("model download failed")
+        return FakeCrossEncoder()
+    
+    monkeypatch.setattr(cross_encoder, 'get_cross_encoder', load)
+    reranker = CrossEncoderReranker(model_name='test-model', top_n=3, budget_ms=10_000)
+    results = [{'content': 'x' * n} for n in (1, 3, 2)]
+    
+    assert reranker.rerank("query", results, time.perf_counter()) == results
+    _wait_for_warm_up(reranker)
+    assert reranker.ms_per_pair is None
+    
+    # Within the backoff requests keep the heuristic order without reloading
+    reranker.rerank("query", results, time.perf_counter())
+    assert len(attempts) == 1
+    
+    reranker._retry_at = 0.0
+    reranker.rerank("query", results, time.perf_counter())
+    _wait_for_warm_up(reranker)
+    assert len(attempts) == 2 and reranker.ms_per_pair is not None
+    
+    reranked = reranker.rerank("query", results, time.perf_counter())
+    assert [len(result['content']) for result in reranked] == [3, 2, 1]
@@ -0,0 +1,74 @@
+import os
+import pytest
+import database
+from database import (add_document, update_document_processed, save_financial_metrics, save_risk_factors,
+                      delete_document)
+
+pq = pytest.importorskip('pyarrow.parquet')
+import data_exporter  # noqa: E402
+
+@pytest.fixture
+def export_dir(workdir, monkeypatch):
+    # data_exporter binds DB_PATH at import time, like semantic_search
+    monkeypatch.setattr(data_exporter, 'DB_PATH', database.DB_PATH)
+    return str(workdir / 'exports')
+
+def _processed_filing(company, fiscal_year):
+    doc_id = add_document(f"{company}.pdf", company, fiscal_year)
+    save_financial_metrics(doc_id, {"Net Income": "$1,234.5", "revenue": 100.0})
+    save_risk_factors(doc_id, {"Market Risk": ["Demand may fall"]})
+    update_document_processed(doc_id)
+    return doc_id
+
+def _exported_files(export_dir):
+    return sorted(os.path.relpath(os.path.join(root, name), export_dir)
+                  for root, _, names in os.walk(export_dir) for name in names if name.endswith('.parquet'))
+
+def _metrics_path(export_dir, partition, doc_id):
+    return os.path.join(export_dir, 'financial_metrics', f'fiscal_year={partition}', f'doc_{doc_id}.parquet')
+
+def test_second_export_writes_only_new_documents(export_dir):
+    first = _processed_filing("Acme", "2023")
+    summary = data_exporter.export_to_parquet(export_dir)
+    assert summary['exported_documents'] == [first] and summary['rows_written'] == 3
+    
+    table = pq.read_table(_metrics_path(export_dir, '2023', first))
+    assert sorted(zip(table.column('metric_name').to_pylist(), table.column('metric_value').to_pylist())) == [
+        ('net_income', 1234.5), ('revenue', 100.0)]
+    first_file = os.stat(_metrics_path(export_dir, '2023', first)).st_ino
+    
+    second = _processed_filing("Globex", None)
+    add_document("draft.pdf")  # Not processed yet, so not exported either
+    summary = data_exporter.export_to_parquet(export_dir)
+    assert summary['exported_documents'] == [second] and summary['rows_written'] == 3
+    
+    # Files are replaced by rename, so an untouched inode means the first document was not rewritten
+    assert os.stat(_metrics_path(export_dir, '2023', first)).st_ino == first_file
+    assert _exported_files(export_dir) == sorted([
+        os.path.join('financial_metrics', 'fiscal_year=2023', f'doc_{first}.parquet'),
+        os.path.join('risk_factors', 'fiscal_year=2023', f'doc_{first}.parquet'),
+        os.path.join('financial_metrics', 'fiscal_year=unknown', f'doc_{second}.parquet'),
+        os.path.join('risk_factors', 'fiscal_year=unknown', f'doc_{second}.parquet')])
+    
+    assert data_exporter.export_to_parquet(export_dir)['exported_documents'] == []
+
+def test_files_of_deleted_documents_are_removed(export_dir):
+    kept = _processed_filing("Acme", "2023")
+    deleted = _processed_filing("Globex", "2023")
+    data_exporter.export_to_parquet(export_dir)
+    
+    assert delete_document(deleted)
+    summary = data_exporter.export_to_parquet(export_dir)
+    assert summary['removed_documents'] == [deleted] and summary['exported_documents'] == []
+    assert _exported_files(export_dir) == sorted([
+        os.path.join('financial_metrics', 'fiscal_year=2023', f'doc_{kept}.parquet'),
+        os.path.join('risk_factors', 'fiscal_year=2023', f'doc_{kept}.parquet')])
+
+def test_full_export_rewrites_every_document(export_dir):
+    doc_id = _processed_filing("Acme", "2023")
+    data_exporter.export_to_parquet(export_dir)
+    first_file = os.stat(_metrics_path(export_dir, '2023', doc_id)).st_ino
+    
+    summary = data_exporter.export_to_parquet(export_dir, full=True)
+    assert summary['exported_documents'] == [doc_id] and summary['rows_written'] == 3
+    assert os.stat(_metrics_path(export_dir, '2023', doc_id)).st_ino != first_file
@@ -0,0 +1,28 @@
+import pandas as pd
+from database import (add_document, save_risk_factors, save_financial_metrics, save_analysis_results,
+                      get_risk_factors, get_financial_metrics, get_parsed_analysis_results)
+
+def _document_with_analysis():
+    doc_id = add_document("10-K.pdf", "Acme Corp", "2023")
+    save_risk_factors(doc_id, {"Market Risk": ["Demand may fall"]})
+    save_financial_metrics(doc_id, {"revenue": 100.0})
+    save_analysis_results(doc_id, "risk_factors", {"Market Risk": ["Demand may fall"]})
+    save_analysis_results(doc_id, "financial_metrics", {"revenue": 100.0})
+    return doc_id
+
+def test_parsed_results_and_tables_do_not_share_cache_entries(workdir):
+    doc_id = _document_with_analysis()
+    
+    # The risk and financial tabs load the tables first
+    assert isinstance(get_risk_factors(doc_id), pd.DataFrame)
+    assert isinstance(get_financial_metrics(doc_id), pd.DataFrame)
+    
+    assert get_parsed_analysis_results(doc_id, "risk_factors") == {"Market Risk": ["Demand may fall"]}
+    assert get_parsed_analysis_results(doc_id, "financial_metrics") == {"revenue": 100.0}
+
+def test_tables_after_parsed_results(workdir):
+    doc_id = _document_with_analysis()
+    
+    assert isinstance(get_parsed_analysis_results(doc_id, "risk_factors"), dict)
+    assert list(get_risk_factors(doc_id)['risk_category']) == ["Market Risk"]
+    assert isinstance(get_financial_metrics(doc_id), pd.DataFrame)
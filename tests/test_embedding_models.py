@@ -0,0 +1,32 @@
+import sqlite3
+import embedding_models
+from embedding_models import cache_document_embeddings, encode_documents, embedding_space, _chunk_key
+from config import EMBEDDING_MODEL, EMBEDDING_BACKEND
+from conftest import InProcessPool
+
+def test_documents_are_handed_out_once_their_chunks_are_cached(workdir, fake_model):
+    cache_path = str(workdir / 'cache.db')
+    encode_documents(["already cached"], cache_path=cache_path)
+    fake_model.calls = fake_model.encoded = 0
+    
+    documents = [
+        (1, [f"first {i}" for i in range(5)]),
+        (2, ["first 0", "first 4", "already cached"]),  # Nothing of its own to encode
+        (3, ["already cached"]),
+        (4, [f"fourth {i}" for i in range(6)])
+    ]
+    space = embedding_space(EMBEDDING_MODEL, EMBEDDING_BACKEND)
+    
+    handed_out = []
+    pool = InProcessPool(EMBEDDING_MODEL, EMBEDDING_BACKEND, batch_size=4)
+    for doc_id in cache_document_embeddings(documents, pool, cache_path):
+        # Another connection (the indexer's) sees every chunk of the document
+        conn = sqlite3.connect(cache_path)
+        keys = [_chunk_key(space, text) for text in dict(documents)[doc_id]]
+        assert len(embedding_models._cached_vectors(conn, keys)) == len(set(keys))
+        conn.close()
+        handed_out.append((doc_id, fake_model.calls))
+    
+    # 11 new chunks in batches of 4, spanning documents 1 and 4
+    assert handed_out == [(1, 2), (2, 2), (3, 2), (4, 3)]
+    assert fake_model.encoded == 11
@@ -0,0 +1,45 @@
+import numpy as np
+import faiss
+from index_cache import IndexCache
+
+def _entry(n_bytes):
+    # An empty index holds no codes, so the entry's size is that of its chunk array
+    return faiss.IndexFlatIP(16), {'documents': np.zeros(n_bytes, dtype='uint8')}
+
+def test_unpinned_documents_are_evicted_least_recently_used_first():
+    cache = IndexCache(max_bytes=300)
+    for doc_id in (1, 2, 3):
+        cache.put(doc_id, *_entry(100))
+    assert cache.total_bytes == 300
+    
+    # Using 1 leaves 2 as the least recently used
+    assert cache.get(1) is not None
+    cache.put(4, *_entry(100))
+    assert 2 not in cache
+    assert all(doc_id in cache for doc_id in (1, 3, 4))
+    
+    cache.put(5, *_entry(150))
+    assert 3 not in cache and 1 not in cache
+    assert 4 in cache and 5 in cache
+    assert cache.total_bytes == 250
+    assert cache.stats()['evictions'] == 3
+
+def test_pinned_documents_survive_eviction():
+    cache = IndexCache(max_bytes=300)
+    cache.pin(1)
+    for doc_id in (1, 2, 3):
+        cache.put(doc_id, *_entry(100))
+    
+    # 1 is the least recently used but pinned, so the next oldest goes
+    cache.put(4, *_entry(100))
+    assert 1 in cache and 2 not in cache
+    
+    cache.put(5, *_entry(250))
+    assert 1 in cache and 5 in cache
+    assert 3 not in cache and 4 not in cache
+    assert cache.total_bytes == 350
+    
+    # Once unpinned, 1 is evicted to bring the cache back under budget
+    cache.unpin(1)
+    assert 1 not in cache and 5 in cache
+    assert cache.total_bytes == 250
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from index_factory import create_index, train_index, index_description, search_parameters, INDEX_TYPES
+from conftest import filing_chunks
+
+def _vectors(n, dimension=64, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, dimension)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+@pytest.mark.parametrize('n_vectors', [1, 5, 16, 63, 64, 300])
+@pytest.mark.parametrize('index_type', INDEX_TYPES)
+def test_every_index_type_trains_on_small_documents(index_type, n_vectors):
+    vectors = _vectors(n_vectors)
+    index, _ = create_index(vectors.shape[1], n_vectors, index_type, storage='pq')
+    train_index(index, vectors)
+    index.add(vectors)
+    
+    _, ids = index.search(vectors[:1], 1, params=search_parameters(index))
+    assert ids[0, 0] >= 0
+
+def test_small_ivf_pq_falls_back_to_int8_codes():
+    assert index_description('ivf_pq', 5, 64) == 'IVF1,SQ8'
+    assert index_description('ivf_pq', 5000, 64).startswith('IVF')
+    assert ',PQ8x' in index_description('ivf_pq', 5000, 64)
+
+def test_five_chunk_document_with_ivf_pq_is_searchable(make_engine):
+    engine = make_engine(index_type='ivf_pq')
+    documents, section_names = filing_chunks(5)
+    assert engine._index_document(1, documents, section_names)
+    
+    results = engine.enhanced_search(1, "Chunk 3 discusses revenue item3", top_k=3)
+    assert results and all(result['content'] in documents for result in results)
+    assert any('item3' in result['content'] for result in results)
@@ -0,0 +1,51 @@
+import os
+import database
+from database import add_document, update_document_processed, get_expired_document_ids, get_all_document_ids
+from conftest import filing_chunks
+
+def _processed(filename, company, fiscal_year):
+    doc_id = add_document(filename, company, fiscal_year)
+    update_document_processed(doc_id)
+    return doc_id
+
+def test_same_filename_of_other_filings_is_not_superseded(workdir):
+    first = _processed("10-K.pdf", "Acme Corp", "2022")
+    _processed("10-K.pdf", "Globex Inc", "2022")
+    _processed("10-K.pdf", "Acme Corp", "2023")
+    
+    assert get_expired_document_ids(drop_superseded=True) == []
+    assert first in get_all_document_ids()
+
+def test_newer_filing_of_same_company_and_year_supersedes(workdir):
+    old = _processed("acme_2023.pdf", "Acme Corp", "2023")
+    new = _processed("acme_2023_amended.pdf", "Acme Corp", "2023")
+    unknown = _processed("10-K.pdf", None, None)
+    _processed("10-K.pdf", None, None)
+    
+    assert get_expired_document_ids(drop_superseded=True) == [old]
+    assert new not in get_expired_document_ids(drop_superseded=True)
+    assert unknown not in get_expired_document_ids(drop_superseded=True)
+
+def test_superseded_filings_are_kept_by_default(workdir):
+    from semantic_search import run_retention_policy
+    _processed("a.pdf", "Acme Corp", "2023")
+    _processed("b.pdf", "Acme Corp", "2023")
+    
+    assert run_retention_policy(vacuum_pages=None)['purged_documents'] == []
+    assert len(get_all_document_ids()) == 2
+
+def test_purge_uses_the_engines_index_dir(make_engine):
+    from semantic_search import purge_document, remove_orphaned_indices, document_index_dir
+    engine = make_engine()
+    doc_id = _processed("a.pdf", "Acme Corp", "2023")
+    orphan_id = doc_id + 1
+    for indexed_id in (doc_id, orphan_id):
+        engine._index_document(indexed_id, *filing_chunks(12))
+    
+    result = purge_document(doc_id, engine)
+    assert result['deleted'] and result['index_bytes_freed'] > 0
+    assert not os.path.exists(document_index_dir(doc_id, engine.faiss_index_dir))
+    
+    assert remove_orphaned_indices(engine)['orphaned_documents'] == [orphan_id]
+    assert not os.path.exists(document_index_dir(orphan_id, engine.faiss_index_dir))
+    assert database.get_document_info(doc_id) is None
@@ -0,0 +1,89 @@
+import os
+import numpy as np
+import pytest
+import search_metrics
+from search_metrics import LatencyHistogram, StageTimer, get_search_metrics, reset_search_metrics, LATENCY_BUCKETS_MS
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake perf_counter: each lap advances it by the next duration given, in ms"""
+    now = [100.0]
+    
+    def advance(ms):
+        now[0] += ms / 1000
+    
+    monkeypatch.setattr(search_metrics.time, 'perf_counter', lambda: now[0])
+    reset_search_metrics()
+    yield advance
+    reset_search_metrics()
+
+def test_latencies_fall_in_the_bucket_bounded_above_by_them():
+    histogram = LatencyHistogram()
+    histogram.record(0.001)
+    histogram.record(LATENCY_BUCKETS_MS[10])
+    histogram.record(LATENCY_BUCKETS_MS[10] * 1.01)
+    histogram.record(10 * LATENCY_BUCKETS_MS[-1])
+    
+    assert np.flatnonzero(histogram.counts).tolist() == [0, 10, 11, len(LATENCY_BUCKETS_MS)]
+    assert histogram.count == 4
+
+def test_percentiles_interpolate_within_buckets_and_stop_at_the_maximum():
+    histogram = LatencyHistogram(bounds=np.array([1.0, 2.0, 4.0, 8.0]))
+    assert histogram.summary()['p50_ms'] is None
+    
+    for ms in (1.5, 1.5, 3.0, 3.0):
+        histogram.record(ms)
+    
+    # Half the samples fill the (1, 2] bucket, so p50 is its upper bound; p95 lies 90% into (2, 4], which is
+    # past the largest sample, so that caps it
+    assert histogram.percentile(50) == pytest.approx(2.0)
+    assert histogram.percentile(95) == pytest.approx(3.0)
+    
+    # Samples past the last bound are only known by the maximum
+    histogram.record(20.0)
+    assert histogram.percentile(99) == pytest.approx(20.0)
+    
+    summary = histogram.summary()
+    assert summary['count'] == 5 and summary['mean_ms'] == pytest.approx(29.0 / 5) and summary['max_ms'] == 20.0
+
+def test_stage_timer_records_laps_total_and_events(clock):
+    for encode_ms in (4.0, 6.0):
+        timer = StageTimer('search')
+        clock(1.0)
+        timer.lap('load_index')
+        clock(encode_ms)
+        timer.lap('encode')
+        timer.count('fallback')
+        timer.finish()
+    
+    metrics = get_search_metrics()
+    assert set(metrics) == {'search'}
+    assert set(metrics['search']['stages']) == {'load_index', 'encode', 'total'}
+    assert metrics['search']['events'] == {'fallback': 2}
+    
+    encode = metrics['search']['stages']['encode']
+    assert encode['count'] == 2
+    assert encode['mean_ms'] == pytest.approx(5.0)
+    assert encode['max_ms'] == pytest.approx(6.0)
+    assert 4.0 * 0.8 <= encode['p50_ms'] <= 6.0
+    assert metrics['search']['stages']['total']['max_ms'] == pytest.approx(7.0)
+
+def test_metrics_endpoint_returns_and_resets_the_snapshot(clock, workdir, monkeypatch):
+    pytest.importorskip('fastapi')
+    pytest.importorskip('httpx')
+    from fastapi.testclient import TestClient
+    monkeypatch.syspath_prepend(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main'))
+    import fastapi_app
+    
+    timer = StageTimer('qa')
+    clock(3.0)
+    timer.lap('retrieve')
+    timer.finish()
+    
+    client = TestClient(fastapi_app.app)
+    payload = client.get("/metrics/search", params={'reset': True}).json()
+    assert payload['qa']['stages']['retrieve']['count'] == 1
+    assert payload['qa']['stages']['retrieve']['max_ms'] == pytest.approx(3.0)
+    assert set(payload['qa']['stages']['total']) == {'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}
+    
+    assert client.get("/metrics/search").json() == {}
@@ -0,0 +1,206 @@
+import os
+import numpy as np
+import pytest
+from database import add_document, save_extracted_text
+from index_factory import STORAGE_TYPES
+from conftest import InProcessPool
+from config import EMBEDDING_MODEL, EMBEDDING_BACKEND
+
+def _sentences(topic, n):
+    return " ".join(f"The {topic} discussion number {i} covers {topic} item{i} for fiscal period {i % 4}."
+                    for i in range(n))
+
+def _filing(engine, business_sentences=700, risk_sentences=80):
+    doc_id = add_document("10-K.pdf", "Acme Corp", "2023")
+    save_extracted_text(doc_id, "business_overview", _sentences("business", business_sentences))
+    save_extracted_text(doc_id, "risk_factors", _sentences("risk", risk_sentences))
+    assert engine.create_embeddings(doc_id)
+    return doc_id
+
+@pytest.mark.parametrize('storage', STORAGE_TYPES)
+@pytest.mark.parametrize('index_type', ['flat', 'ivf_flat', 'hnsw'])
+def test_search_skips_tombstoned_chunks(make_engine, index_type, storage):
+    engine = make_engine(index_type=index_type, index_storage=storage)
+    doc_id = _filing(engine)
+    
+    changes = engine.remove_section(doc_id, "risk_factors")
+    assert changes['removed_chunks'] > 0 and not changes['compacted']
+    
+    results = engine.enhanced_search(doc_id, "risk discussion covers risk item3", top_k=5)
+    # Placeholder results (the search error path) carry no chunk ids
+    assert results and all('chunk_id' in result for result in results)
+    assert not any(result['section'].startswith("risk_factors") for result in results)
+
+def test_ingest_encodes_one_stream_batch_at_a_time(make_engine, fake_model, monkeypatch):
+    import semantic_search
+    monkeypatch.setattr(semantic_search, 'EMBED_STREAM_BATCH_SIZE', 16)
+    engine = make_engine(index_type='flat', index_storage='float32')
+    
+    doc_id = add_document("10-K.pdf", "Acme Corp", "2023")
+    save_extracted_text(doc_id, "business_overview", _sentences("business", 700))
+    assert engine.create_embeddings(doc_id)
+    
+    # Every chunk was encoded, but never more than one stream batch per model call
+    assert fake_model.encoded == len(engine.index_cache.get(doc_id)[1]['documents']) > 16
+    assert fake_model.largest_batch <= 16
+
+def test_bulk_ingest_feeds_one_pool_queue_from_every_document(make_engine, fake_model, monkeypatch):
+    import embedding_models
+    engine = make_engine(index_type='flat', index_storage='float32')
+    pool = InProcessPool(EMBEDDING_MODEL, EMBEDDING_BACKEND, batch_size=32)
+    
+    topics = {}
+    for i, sentences in enumerate([20, 45, 6]):
+        doc_id = add_document(f"filing_{i}.pdf", f"Company {i}", "2023")
+        save_extracted_text(doc_id, "business_overview", _sentences(f"company{i}", sentences))
+        topics[doc_id] = f"company{i}"
+    chunk_counts = [len(engine._document_chunks(doc_id)[0]) for doc_id in topics]
+    
+    # Only the pool may encode: this process must not load the model
+    monkeypatch.delitem(embedding_models._models, (EMBEDDING_MODEL, EMBEDDING_BACKEND))
+    monkeypatch.setattr(embedding_models, '_load_embedding_model', lambda *args: pytest.fail("model loaded"))
+    
+    assert engine.create_embeddings_bulk(list(topics), pool=pool) == {doc_id: True for doc_id in topics}
+    assert engine.index_dimension == fake_model.dimension
+    
+    # Batches span document boundaries: only the last batch of the whole stream is partial
+    assert fake_model.encoded == sum(chunk_counts)
+    assert fake_model.calls == -(-sum(chunk_counts) // 32) < sum(-(-count // 32) for count in chunk_counts)
+    for doc_id, topic in topics.items():
+        assert all(topic in document for document in engine.index_cache.get(doc_id)[1]['documents'])
+
+def test_engine_writes_embeddings_to_its_own_cache(make_engine, workdir):
+    engine = make_engine(embedding_cache_path=str(workdir / 'benchmark_cache.db'))
+    _filing(engine, business_sentences=40, risk_sentences=10)
+    
+    assert (workdir / 'benchmark_cache.db').exists()
+    assert not (workdir / 'embedding_cache.db').exists()
+
+def test_index_files_are_hashed_once_per_generation(make_engine, monkeypatch):
+    import semantic_search
+    engine = make_engine()
+    doc_id = _filing(engine, business_sentences=40, risk_sentences=10)
+    
+    hashed = []
+    file_checksum = semantic_search.file_checksum
+    monkeypatch.setattr(semantic_search, 'file_checksum', lambda path: hashed.append(path) or file_checksum(path))
+    
+    # The first load verifies every file; later loads of the unchanged generation hash nothing
+    assert engine._read_persisted_index(doc_id) is not None
+    assert hashed
+    hashed.clear()
+    assert engine._read_persisted_index(doc_id) is not None
+    assert hashed == []
+    
+    # A file rewritten since it was verified is hashed again, and a mismatch discards the index
+    doc_dir = semantic_search.document_index_dir(doc_id, engine.faiss_index_dir)
+    metadata = semantic_search.read_document_metadata(doc_dir)
+    name = next(name for name in metadata['checksums'] if name.startswith('features'))
+    with open(os.path.join(doc_dir, name), 'ab') as f:
+        f.write(b'corrupt')
+    assert engine._read_persisted_index(doc_id) is None
+    assert [os.path.basename(path) for path in hashed] == [name]
+
+def _search_output(engine, doc_id, query):
+    # Chunk ids are positions, which differ between an updated index and a fresh one
+    return [(result['section'], result['content'], round(result['similarity'], 5),
+             round(result['bm25_score'], 4), round(result['fusion_score'], 6))
+            for result in engine.enhanced_search(doc_id, query, top_k=8)]
+
+@pytest.mark.parametrize('storage', ['float32', 'float16'])
+def test_section_updates_search_like_a_full_build(make_engine, storage):
+    engine = make_engine(index_type='flat', index_storage=storage)
+    doc_id = _filing(engine, business_sentences=120, risk_sentences=40)
+    
+    # Two updates: the second segment is merged with the first
+    engine.update_section(doc_id, "risk_factors", _sentences("hazard", 25))
+    risk_text = _sentences("exposure", 30)
+    changes = engine.update_section(doc_id, "risk_factors", risk_text)
+    assert changes['added_chunks'] > 0 and not changes['compacted']
+    
+    rebuilt_id = add_document("10-K.pdf", "Acme Corp", "2023")
+    save_extracted_text(rebuilt_id, "business_overview", _sentences("business", 120))
+    save_extracted_text(rebuilt_id, "risk_factors", risk_text)
+    assert engine.create_embeddings(rebuilt_id)
+    
+    for query in ["exposure discussion covers exposure item7", "business item12 fiscal period", "hazard item3"]:
+        assert _search_output(engine, doc_id, query) == _search_output(engine, rebuilt_id, query)
+
+def test_section_update_writes_and_hashes_only_the_new_segment(make_engine, monkeypatch):
+    import semantic_search
+    engine = make_engine(index_type='flat', index_storage='float16')
+    doc_id = _filing(engine, business_sentences=120, risk_sentences=40)
+    doc_dir = semantic_search.document_index_dir(doc_id, engine.faiss_index_dir)
+    assert engine._read_persisted_index(doc_id) is not None
+    base_files = {name: os.stat(os.path.join(doc_dir, name)).st_mtime_ns
+                  for name in semantic_search.segment_files(doc_dir, 1)}
+    
+    hashed = []
+    file_checksum = semantic_search.file_checksum
+    monkeypatch.setattr(semantic_search, 'file_checksum', lambda path: hashed.append(path) or file_checksum(path))
+    
+    engine.update_section(doc_id, "risk_factors", _sentences("exposure", 30))
+    assert engine._read_persisted_index(doc_id) is not None
+    
+    # The base segment is neither rewritten nor re-hashed, when saving or loading
+    metadata = semantic_search.read_document_metadata(doc_dir)
+    assert [segment['generation'] for segment in metadata['segments']] == [1, 2]
+    assert {name: os.stat(os.path.join(doc_dir, name)).st_mtime_ns for name in base_files} == base_files
+    new_files = semantic_search.generation_files(doc_dir, 2)
+    assert hashed and all(os.path.basename(path) in new_files for path in hashed)
+
+FUSION_CHUNKS = ["Acme ticker Acme ticker",
+                 "Acme ticker quarterly update",
+                 "Acme annual filing notes with many other words about the ticker and more",
+                 "Revenue grew in the quarter",
+                 "Operating margin improved",
+                 "Cash flow from operations"]
+
+def _fusion_inputs(make_engine, query):
+    engine = make_engine()
+    assert engine._index_document(1, FUSION_CHUNKS, ["business_overview"] * len(FUSION_CHUNKS))
+    faiss_index, cached = engine.index_cache.peek(1)
+    
+    # Dense hits are given directly: a chunk BM25 cannot match first, then the lowest-ranked lexical hit
+    lexical_ids = cached['bm25'].search(query, 3)[1].tolist()
+    assert len(lexical_ids) == 3 and not {3, 4} & set(lexical_ids)
+    shared = lexical_ids[-1]
+    similarities = np.array([[0.9, 0.8, 0.7]], dtype='float32')
+    indices = np.array([[3, shared, 4]], dtype='int64')
+    return engine, faiss_index, cached, similarities, indices, lexical_ids
+
+def test_fusion_keeps_lexical_only_and_dense_only_hits(make_engine):
+    import semantic_search
+    query = "acme ticker"
+    engine, faiss_index, cached, similarities, indices, lexical_ids = _fusion_inputs(make_engine, query)
+    
+    results = engine._fuse_results(similarities, indices, [query], faiss_index, cached, query, 3)
+    by_chunk = {result['chunk_id']: result for result in results}
+    assert set(by_chunk) == {3, 4} | set(lexical_ids)
+    
+    # Dense-only hits have no BM25 score; lexical-only ones get their cosine similarity filled in
+    assert by_chunk[3]['bm25_score'] == 0.0 and by_chunk[3]['similarity'] == pytest.approx(0.9)
+    lexical_only = lexical_ids[0]
+    assert by_chunk[lexical_only]['bm25_score'] > 0
+    assert isinstance(by_chunk[lexical_only]['similarity'], float)
+    
+    shared = lexical_ids[-1]
+    expected = 1.0 / (semantic_search.RRF_K + 2) + 1.0 / (semantic_search.RRF_K + len(lexical_ids))
+    assert by_chunk[shared]['fusion_score'] == pytest.approx(expected)
+    assert [result['fusion_score'] for result in results] == sorted((result['fusion_score'] for result in results),
+                                                                    reverse=True)
+
+def test_fusion_constant_trades_top_ranks_for_agreement(make_engine, monkeypatch):
+    import semantic_search
+    query = "acme ticker"
+    engine, faiss_index, cached, similarities, indices, lexical_ids = _fusion_inputs(make_engine, query)
+    shared = lexical_ids[-1]
+    
+    # A large constant flattens the rank curve, so the chunk both rankings found beats either list's first hit
+    results = engine._fuse_results(similarities, indices, [query], faiss_index, cached, query, 3)
+    assert results[0]['chunk_id'] == shared
+    
+    # With no constant, the first hit of each ranking scores 1 and outranks it
+    monkeypatch.setattr(semantic_search, 'RRF_K', 0)
+    results = engine._fuse_results(similarities, indices, [query], faiss_index, cached, query, 3)
+    assert [result['chunk_id'] for result in results[:3]] == [3, lexical_ids[0], shared]